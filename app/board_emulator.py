@@ -0,0 +1,363 @@
+# ====================================================================
+# MGTS - メイン基板・センサーノード エミュレータ (ハードウェアなしの通し試験用)
+#  * main_board.ino の計時ステートマシン (ENTRY / START / SPLIT:n / STOP / FORCE_DNF /
+#    遅延RESULT送信) と signal_board.ino の REACTION / FLYING 判定を再現する
+#  * PCへは実機と同じ形式で送る
+#      UDP    : RESULT / ENTRY_ACK / SPLIT (JSON)、センサーの "START" / "STOP"
+#      シリアル: "[ESP_DATA] {...}" (ESP-NOW中継)、"[HUB_TX] SEQ_START" (ハブ操作)
+#  * 選手の走行時間・リアクション・DNF/フライング率を設定して、仮想時間で
+#    1日分のイベントを数分で流せる
+#
+#  使い方 (GUIと組み合わせる場合):
+#    MGTS_ENTRY_TARGETS=127.0.0.1:5006 python gui_main_voice.py
+#    python board_emulator.py --roster entry_list_sample.csv --auto-entry --speed 20
+# ====================================================================
+import argparse
+import heapq
+import itertools
+import json
+import random
+import socket
+import threading
+import time
+
+from roster import read_roster_lines, parse_roster_lines
+
+TIMING_GUARD_MS = 3000      # main_board.ino と同じガードタイム
+DELAY_SEND_MS = 1000        # RESULT の遅延送信
+SIGNAL_GREEN_MS = 5000      # SEQ_START から青信号まで
+MAX_RUNNERS = 9
+MAX_SPLITS = 8
+DNF_TIME = 999.999
+
+
+# ====================================================================
+# 仮想時間スケジューラ
+# ====================================================================
+class EventScheduler:
+    # speed 倍速で進む仮想時計 (ms)。speed=0 は待ち時間なしで最速実行
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.now_ms = 0.0
+        self._heap = []
+        self._ids = itertools.count()
+        self._cv = threading.Condition()
+
+    def at(self, t_ms, fn, *args):
+        with self._cv:
+            heapq.heappush(self._heap, (t_ms, next(self._ids), fn, args))
+            self._cv.notify()
+
+    def after(self, delay_ms, fn, *args):
+        self.at(self.now_ms + delay_ms, fn, *args)
+
+    def post(self, fn, *args):
+        # 別スレッド (UDP受信) からの割り込み。現在の仮想時刻で実行する
+        self.at(self.now_ms, fn, *args)
+
+    def run(self, until_ms=None, idle_exit=True):
+        while True:
+            with self._cv:
+                if not self._heap:
+                    if idle_exit: return
+                    self._cv.wait(0.1)
+                    continue
+                t_ms, _, fn, args = self._heap[0]
+                if until_ms is not None and t_ms > until_ms: return
+                wait = (t_ms - self.now_ms) / 1000.0 / self.speed if self.speed else 0
+                if wait > 0:
+                    # 待っている間に割り込みが入れば先に処理する
+                    started = time.monotonic()
+                    self._cv.wait(wait)
+                    self.now_ms += (time.monotonic() - started) * 1000.0 * self.speed
+                    if self._heap[0][0] > self.now_ms: continue
+                t_ms, _, fn, args = heapq.heappop(self._heap)
+                self.now_ms = max(self.now_ms, t_ms)
+            fn(*args)
+
+
+# ====================================================================
+# PCへの出力 (UDP / シリアル)
+# ====================================================================
+class PcLink:
+    def __init__(self, pc_addr=("127.0.0.1", 5005), serial_port=None, hub_over_udp=True, sink=None):
+        self.pc_addr = pc_addr
+        self.hub_over_udp = hub_over_udp   # ハブ操作 (SEQ_START) をUDPのJSONでも通知 (シリアルなしでNFCロック解除できるように)
+        self.sink = sink                   # sink(payload, source) を渡すとソケットを使わず直接渡す (ソーク試験用)
+        self.sock = None if sink else socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.ser = None
+        if serial_port:
+            import serial
+            self.ser = serial.Serial(serial_port, 115200)
+        self.sent = 0
+
+    def _udp(self, payload):
+        self.sent += 1
+        if self.sink: self.sink(payload, "UDP")
+        elif self.pc_addr:
+            try: self.sock.sendto(payload.encode(), self.pc_addr)
+            except OSError: pass
+
+    def _serial(self, line):
+        if self.sink: self.sink(line, "SERIAL")
+        elif self.ser: self.ser.write((line + "\n").encode())
+
+    def wired(self, payload):          # 有線LAN (W5500) のブロードキャスト
+        self._udp(payload)
+
+    def espnow_to_hub(self, payload):  # ESP-NOW -> ハブ -> USBシリアル
+        if self.ser or self.sink: self._serial("[ESP_DATA] " + payload)
+
+    def hub_command(self, cmd):
+        if self.ser or self.sink: self._serial("[HUB_TX] " + cmd)
+        if self.hub_over_udp and not self.sink: self._udp(json.dumps({"type": cmd}))
+
+
+# ====================================================================
+# 基板エミュレーション
+# ====================================================================
+class MainBoard:
+    def __init__(self, sched, link):
+        self.sched, self.link = sched, link
+        self.runners = []                 # [[id, start_ms, 通過済みSPLIT番号]]
+        self.next_rider_id = "X999"
+        self.last_entry_seq = -1
+        self.last_start_action = -1e9
+        self.last_stop_action = -1e9
+        self.last_split_action = {}       # SPLIT番号 -> 時刻
+        self.results = []                 # (id, time, dnf)
+
+    def _send(self, packet):
+        payload = json.dumps(packet, separators=(",", ":"))
+        self.link.wired(payload)
+        self.link.espnow_to_hub(payload)
+
+    def _complete(self, rider_id, result, dnf):
+        self.results.append((rider_id, result, dnf))
+        self.sched.after(DELAY_SEND_MS, self._send, {"type": "RESULT", "id": rider_id, "time": round(result, 3)})
+
+    def process(self, msg):
+        now = self.sched.now_ms
+        if msg.startswith("{"):
+            try: doc = json.loads(msg)
+            except ValueError: return
+            if doc.get("type") == "ENTRY":
+                seq = doc.get("seq", -1)
+                if seq < 0 or seq != self.last_entry_seq: self.next_rider_id = doc.get("id", "X999")
+                if seq >= 0:
+                    self.last_entry_seq = seq
+                    self._send({"type": "ENTRY_ACK", "id": doc.get("id"), "seq": seq})
+        elif msg == "START":
+            if now - self.last_start_action > TIMING_GUARD_MS:
+                self.last_start_action = now
+                if len(self.runners) < MAX_RUNNERS:
+                    self.runners.append([self.next_rider_id, now, 0])
+                    self.next_rider_id = "X999"
+        elif msg == "STOP":
+            if now - self.last_stop_action > TIMING_GUARD_MS and self.runners and now - self.runners[0][1] > TIMING_GUARD_MS:
+                self.last_stop_action = now
+                rider_id, started, _ = self.runners.pop(0)
+                self._complete(rider_id, (now - started) / 1000.0, False)
+        elif msg.startswith("SPLIT:"):
+            try: sector = int(msg[6:])
+            except ValueError: return
+            if not 1 <= sector <= MAX_SPLITS or now - self.last_split_action.get(sector, -1e9) <= TIMING_GUARD_MS: return
+            for runner in self.runners:
+                if runner[2] < sector and now - runner[1] > TIMING_GUARD_MS:
+                    self.last_split_action[sector] = now
+                    runner[2] = sector
+                    self._send({"type": "SPLIT", "id": runner[0], "sector": sector, "time": round((now - runner[1]) / 1000.0, 3)})
+                    break
+        elif msg == "FORCE_DNF":
+            if self.runners:
+                self.last_stop_action = now
+                rider_id, _, _ = self.runners.pop(0)
+                self._complete(rider_id, DNF_TIME, True)
+
+
+class SignalBoard:
+    def __init__(self, sched, link):
+        self.sched, self.link = sched, link
+        self.next_rider_id = "X999"
+        self.current_rider_id = "X999"
+        self.active = False
+        self.started_physical = False
+        self.green_at = 0.0
+
+    def process(self, msg):
+        now = self.sched.now_ms
+        if msg.startswith("{"):
+            try: doc = json.loads(msg)
+            except ValueError: return
+            if doc.get("type") == "ENTRY": self.next_rider_id = doc.get("id", "X999")
+        elif msg == "SEQ_START":
+            if self.active: return
+            self.current_rider_id, self.next_rider_id = self.next_rider_id, "X999"
+            self.green_at = now + SIGNAL_GREEN_MS
+            self.active, self.started_physical = True, False
+        elif msg == "START":
+            if not self.active or self.started_physical: return
+            self.started_physical = True
+            self.active = False
+            diff = round((now - self.green_at) / 1000.0, 3)
+            payload = json.dumps({"type": "FLYING" if diff < 0 else "REACTION", "id": self.current_rider_id, "diff": diff}, separators=(",", ":"))
+            self.link.espnow_to_hub(payload)
+        elif msg == "FORCE_DNF":
+            self.active = False
+
+
+class Course:
+    # ESP-NOW / 有線LAN で全基板へ届くコマンドバス
+    def __init__(self, sched, link):
+        self.sched, self.link = sched, link
+        self.main = MainBoard(sched, link)
+        self.signal = SignalBoard(sched, link)
+
+    def broadcast(self, msg):
+        self.main.process(msg)
+        self.signal.process(msg)
+
+    def sensor(self, which):
+        # センサーノードは有線LANにもブロードキャストする (PCでは生文字列として届く)
+        self.link.wired(which)
+        self.broadcast(which)
+
+    def hub(self, cmd):
+        self.link.hub_command(cmd)
+        self.broadcast(cmd)
+
+
+# ====================================================================
+# 選手・走行モデル
+# ====================================================================
+class RiderModel:
+    def __init__(self, rng, mean=35.0, sd=3.0, class_offsets=None, dnf_prob=0.03, flying_prob=0.02, reaction=(0.35, 0.12)):
+        self.rng = rng
+        self.mean, self.sd = mean, sd
+        self.class_offsets = class_offsets or {}
+        self.dnf_prob, self.flying_prob = dnf_prob, flying_prob
+        self.reaction = reaction
+        self._pace = {}
+
+    def pace(self, tag_id, r_class):
+        if tag_id not in self._pace:
+            self._pace[tag_id] = max(10.0, self.rng.gauss(self.mean + self.class_offsets.get(r_class, 0.0), self.sd))
+        return self._pace[tag_id]
+
+    def run(self, tag_id, r_class):
+        # 戻り値: (リアクション秒 (負ならフライング), 走行秒 or None=DNF)
+        reaction = -abs(self.rng.gauss(0.15, 0.08)) if self.rng.random() < self.flying_prob else max(0.05, self.rng.gauss(*self.reaction))
+        if self.rng.random() < self.dnf_prob: return reaction, None
+        return reaction, max(TIMING_GUARD_MS / 1000.0 + 0.5, self.pace(tag_id, r_class) * self.rng.lognormvariate(0, 0.03))
+
+
+class EventSimulator:
+    # 1走ごとに NFCタッチ -> SEQ_START -> START -> (SPLIT) -> STOP (またはDNF) を仮想時間に積む
+    def __init__(self, course, riders, model, runs_per_rider=2, auto_entry=True, staging_sec=8.0, start_gap_sec=12.0, on_touch=None, splits=0):
+        self.course, self.riders, self.model = course, riders, model
+        self.splits = splits       # 中間計測センサーの数 (コースを等分した位置に置く)
+        self.runs_per_rider = runs_per_rider
+        self.auto_entry = auto_entry
+        self.on_touch = on_touch   # on_touch(tag_id): PCに直結したNFCリーダーへのタッチを模擬 (ソーク試験用)
+        self.staging_ms = staging_sec * 1000
+        self.start_gap_ms = start_gap_sec * 1000
+        self.finished = 0
+        self.planned = 0
+
+    def schedule(self):
+        sched = self.course.sched
+        t = 0.0
+        order = [tid for _ in range(self.runs_per_rider) for tid in self.riders]
+        for tag_id in order:
+            info = self.riders[tag_id]
+            reaction, run_sec = self.model.run(tag_id, info["class"])
+            if self.auto_entry:
+                # NFCノードはESP-NOWでハブ (-> PCのシリアル) とメイン基板へ送る
+                entry = json.dumps({"type": "ENTRY", "id": tag_id}, separators=(",", ":"))
+                sched.at(t, self._entry, entry)
+            if self.on_touch: sched.at(t, self.on_touch, tag_id)
+            seq_at = t + self.staging_ms
+            start_at = seq_at + SIGNAL_GREEN_MS + reaction * 1000
+            sched.at(seq_at, self.course.hub, "SEQ_START")
+            sched.at(start_at, self.course.sensor, "START")
+            if run_sec is None: sched.at(start_at + 15000, self.course.hub, "FORCE_DNF")
+            else:
+                sched.at(start_at + run_sec * 1000, self._stop)
+                for k in range(1, self.splits + 1):
+                    frac = k / (self.splits + 1) * self.model.rng.uniform(0.97, 1.03)
+                    sched.at(start_at + run_sec * frac * 1000, self.course.sensor, f"SPLIT:{k}")
+            self.planned += 1
+            t = start_at + self.start_gap_ms
+        return t
+
+    def _entry(self, entry):
+        self.course.link.espnow_to_hub(entry)
+        self.course.broadcast(entry)
+
+    def _stop(self):
+        self.course.sensor("STOP")
+        self.finished += 1
+
+
+def listen_commands(sched, course, port):
+    # PCアプリ (on_nfc_connect) からの ENTRY 等を受け付ける
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(("0.0.0.0", port))
+    def loop():
+        while True:
+            data, _ = s.recvfrom(1024)
+            msg = data.decode("utf-8", "ignore").strip()
+            if msg: sched.post(course.broadcast, msg)
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def build_riders(roster_path, count):
+    if roster_path:
+        riders, _ = parse_roster_lines(read_roster_lines(roster_path))
+        if riders: return riders
+    classes = ["A", "B", "C", "N"]
+    return {f"E{i:03d}": {"bib": str(i), "name": f"選手{i:03d}", "class": classes[i % len(classes)]} for i in range(1, count + 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MGTS メイン基板・センサーノード エミュレータ")
+    parser.add_argument("--roster", help="名簿CSV (省略時は --riders 名を自動生成)")
+    parser.add_argument("--riders", type=int, default=60)
+    parser.add_argument("--runs-per-rider", type=int, default=2)
+    parser.add_argument("--speed", type=float, default=10.0, help="仮想時間の倍速 (0 で待ちなし)")
+    parser.add_argument("--pc", default="127.0.0.1:5005", help="PCアプリの UDP 受信先")
+    parser.add_argument("--listen", type=int, default=5006, help="PCからの ENTRY を受ける UDP ポート")
+    parser.add_argument("--serial", help="ハブ相当のシリアル出力先 (仮想COMペア等)")
+    parser.add_argument("--auto-entry", action="store_true", help="NFCノードのタッチも模擬する (PCからのENTRYを待たない)")
+    parser.add_argument("--mean", type=float, default=35.0)
+    parser.add_argument("--sd", type=float, default=3.0)
+    parser.add_argument("--dnf", type=float, default=0.03)
+    parser.add_argument("--flying", type=float, default=0.02)
+    parser.add_argument("--splits", type=int, default=0, help="中間計測センサーの数")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    host, port = args.pc.rsplit(":", 1)
+    sched = EventScheduler(args.speed)
+    link = PcLink((host, int(port)), args.serial)
+    course = Course(sched, link)
+    listen_commands(sched, course, args.listen)
+
+    rng = random.Random(args.seed)
+    riders = build_riders(args.roster, args.riders)
+    sim = EventSimulator(course, riders, RiderModel(rng, args.mean, args.sd, dnf_prob=args.dnf, flying_prob=args.flying), args.runs_per_rider, args.auto_entry, splits=args.splits)
+    end_ms = sim.schedule()
+    print(f"🏍️ {len(riders)}名 x {args.runs_per_rider}本 = {sim.planned}走 / 仮想 {end_ms / 3600000:.2f}時間 を {args.speed or '最速'}倍速で実行します")
+
+    t0 = time.monotonic()
+    sched.run()
+    real = time.monotonic() - t0
+    hours = sched.now_ms / 3600000
+    results = course.main.results
+    dnf = sum(1 for r in results if r[2])
+    print(f"🏁 完了: RESULT {len(results)}件 (DNF {dnf}) / 送信 {link.sent}パケット / 仮想 {hours:.2f}時間 -> 実時間 {real:.1f}秒 / {len(results) / max(hours, 1e-9):.1f} 走/時")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# ====================================================================
+# MGTS - シリーズポイント集計
+#  * リザルトCSV (on_save_csv_result の出力) / シーズンアーカイブ (.db) を何件でも読み込む
+#  * ファイルの解析はプロセスプールで並列に行い、結果はファイルのハッシュごとに
+#    キャッシュする (最新戦を追加しても、解析し直すのはそのファイルだけ)
+#  * アーカイブ (.db) は読み取り専用で開き、キーは取り込み済み大会の ID・取り込み時刻から作る
+#    (WALモードでは .db 本体のハッシュが変わらないまま大会が増えるため)
+#  * 選手はゼッケン+名前 (rider_key) で区別する (大会ごとのゼッケンの使い回し・変更で混ざらない)
+#  * ポイントテーブル・有効ポイント制 (ワーストN戦カット) を設定でき、総合・クラス別の
+#    シリーズランキングを同点処理 (上位入賞回数 -> 最終戦の順位) 込みで出す
+#
+#  使い方: python championship.py 第1戦.csv 第2戦.csv mgts_season.db --drop 1 --out standings.csv
+# ====================================================================
+import argparse
+import csv
+import hashlib
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from roster import rider_key
+from season_archive import SeasonArchive, results_from_csv, DNF_TIME
+
+CACHE_PATH = "mgts_championship_cache.json"
+CACHE_VERSION = "2"    # 解析結果の形を変えたら上げる (古いキャッシュを使わない)
+DEFAULT_POINTS = [25, 20, 16, 13, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+
+PointsConfig = namedtuple("PointsConfig", ["table", "drop_worst", "finish_points"])
+PointsConfig.__new__.__defaults__ = (DEFAULT_POINTS, 0, 0)   # finish_points: 圏外でもタイムを残した選手への参加点
+
+# 1大会分の集計元: 選手ごとのベストタイム (タイムなし = None)
+EventResult = namedtuple("EventResult", ["name", "date", "riders"])   # riders: {rider_key: [bib, name, class, best_time or None]}
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""): h.update(chunk)
+    return h.hexdigest()
+
+
+def _is_archive(path):
+    return path.lower().endswith(".db")
+
+
+def source_key(path):
+    # キャッシュのキー: CSV はファイルのハッシュ、アーカイブは大会の一覧 (ID・取り込み時刻)
+    if not _is_archive(path): return f"v{CACHE_VERSION}:" + file_hash(path)
+    revision = SeasonArchive(path, readonly=True).revision()
+    return f"v{CACHE_VERSION}:db:" + hashlib.sha256(json.dumps([os.path.abspath(path), revision]).encode("utf-8")).hexdigest()
+
+
+def _best_times(records):
+    riders = {}
+    for r in records:
+        bib = str(r["bib"])
+        valid = not r.get("is_mc") and r.get("time_float") is not None and r["base_time"] < DNF_TIME
+        t = float(r["time_float"]) if valid else None
+        cur = riders.setdefault(rider_key(bib, r.get("name")), [bib, r.get("name", ""), r.get("class", "-"), None])
+        if t is not None and (cur[3] is None or t < cur[3]): cur[3] = t
+    return riders
+
+
+def parse_file(path):
+    # プロセスプールで実行される。戻り値は JSON にそのまま書ける形
+    if _is_archive(path):
+        archive = SeasonArchive(path, readonly=True)
+        return [[ev["name"], ev["date"], _best_times(archive.event_runs(ev["event_id"]))] for ev in archive.events()]
+    name = os.path.splitext(os.path.basename(path))[0]
+    return [[name, "", _best_times(results_from_csv(path))]]
+
+
+class ResultCache:
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f: self.data = json.load(f)
+            except (OSError, ValueError): self.data = {}
+        self.dirty = False
+
+    def get(self, digest): return self.data.get(digest)
+
+    def put(self, digest, events):
+        self.data[digest] = events
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty: return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def load_events(paths, cache=None, workers=None):
+    # 戻り値: ([EventResult, ...] 入力順, 解析したファイル数)
+    cache = cache or ResultCache()
+    digests = [source_key(p) for p in paths]
+    todo = sorted({(d, p) for d, p in zip(digests, paths) if cache.get(d) is None})
+    if len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for (d, _), events in zip(todo, pool.map(parse_file, [p for _, p in todo])): cache.put(d, events)
+    elif todo:
+        cache.put(todo[0][0], parse_file(todo[0][1]))
+    cache.save()
+
+    events = []
+    for d in digests:
+        for name, date, riders in cache.get(d): events.append(EventResult(name, date, riders))
+    return events, len(todo)
+
+
+# ====================================================================
+# ポイント計算
+# ====================================================================
+def _positions(riders, r_class=None):
+    # ベストタイム順の順位 {rider_key: 順位} (同タイムは同順位)
+    timed = sorted((t, key) for key, (_, _, c, t) in riders.items() if t is not None and (r_class is None or c == r_class))
+    pos, last_t, out = 0, None, {}
+    for i, (t, key) in enumerate(timed, 1):
+        if t != last_t: pos, last_t = i, t
+        out[key] = pos
+    return out
+
+
+def _standings(events, config, r_class=None):
+    table = config.table
+    n = len(events)
+    rows = {}   # rider_key -> {"bib","name","class","points":[..n], "positions":[..n]}
+    for i, ev in enumerate(events):
+        for key, pos in _positions(ev.riders, r_class).items():
+            bib, name, c, _ = ev.riders[key]
+            row = rows.setdefault(key, {"bib": bib, "name": name, "class": c, "points": [0] * n, "positions": [None] * n})
+            row["bib"], row["name"], row["class"] = bib, name, c
+            row["points"][i] = table[pos - 1] if pos <= len(table) else config.finish_points
+            row["positions"][i] = pos
+
+    for row in rows.values():
+        kept = sorted(row["points"], reverse=True)[:max(n - config.drop_worst, 0)] if config.drop_worst else row["points"]
+        row["total"] = sum(kept)
+        row["gross"] = sum(row["points"])
+        # 同点処理: 1位の回数, 2位の回数, ... の多い方 -> 最終戦で上位の方
+        finishes = [p for p in row["positions"] if p is not None]
+        row["countback"] = [finishes.count(k) for k in range(1, len(table) + 1)]
+
+    def last_pos(row):
+        for p in reversed(row["positions"]):
+            if p is not None: return p
+        return float("inf")
+
+    ranked = sorted(rows.values(), key=lambda r: (-r["total"], [-c for c in r["countback"]], last_pos(r)))
+    for i, row in enumerate(ranked, 1): row["rank"] = i
+    return ranked
+
+
+def compute_standings(events, config=PointsConfig()):
+    # 戻り値: {"総合": [...], クラス名: [...]}
+    classes = sorted({c for ev in events for _, _, c, t in ev.riders.values() if t is not None})
+    result = {"総合": _standings(events, config)}
+    for c in classes: result[c] = _standings(events, config, c)
+    return result
+
+
+def write_standings_csv(path, events, standings):
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        for group, rows in standings.items():
+            writer.writerow([f"[{group}]", "順位", "ゼッケン", "名前", "クラス", "有効ポイント", "総ポイント"] + [ev.name for ev in events])
+            for row in rows:
+                writer.writerow(["", row["rank"], row["bib"], row["name"], row["class"], row["total"], row["gross"]] + row["points"])
+            writer.writerow([])
+
+
+def self_check():
+    # 同じゼッケンを別の選手が使い回した2大会: ポイントが選手ごとに分かれること
+    rec = lambda bib, name, t: {"bib": bib, "name": name, "class": "A", "base_time": t, "time_float": t}
+    events = [EventResult("第1戦", "", _best_times([rec(7, "山田 太郎", 60.0), rec(8, "佐藤 花子", 61.0)])),
+              EventResult("第2戦", "", _best_times([rec(7, "鈴木 一郎", 59.0), rec(8, "佐藤　花子", 62.0)]))]
+    rows = {row["name"]: row for row in compute_standings(events, PointsConfig([10, 5], 0, 0))["総合"]}
+    assert rows["山田 太郎"]["points"] == [10, 0] and rows["鈴木 一郎"]["points"] == [0, 10], rows
+    assert rows["佐藤　花子"]["points"] == [5, 5] and len(rows) == 3, rows
+    print("✅ ゼッケン使い回し: 選手ごとに集計 OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MGTS シリーズポイント集計")
+    parser.add_argument("files", nargs="*", help="リザルトCSV / シーズンアーカイブ (.db) (開催順)")
+    parser.add_argument("--table", help="ポイントテーブル (例: 25,20,16,13,11)")
+    parser.add_argument("--drop", type=int, default=0, help="ワーストN戦をカット")
+    parser.add_argument("--finish-points", type=int, default=0, help="ポイント圏外の完走者に与える点")
+    parser.add_argument("--cache", default=CACHE_PATH)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--out", help="シリーズランキングのCSV出力先")
+    parser.add_argument("--check", action="store_true", help="自己診断を実行して終了")
+    args = parser.parse_args()
+    if args.check: return self_check()
+    if not args.files: parser.error("files を指定してください")
+
+    table = [int(x) for x in args.table.split(",")] if args.table else DEFAULT_POINTS
+    events, parsed = load_events(args.files, ResultCache(args.cache), args.workers)
+    standings = compute_standings(events, PointsConfig(table, args.drop, args.finish_points))
+    print(f"📊 {len(events)}戦を集計 (新規解析 {parsed}ファイル / キャッシュ {len(set(args.files)) - parsed}ファイル)")
+    for group, rows in standings.items():
+        print(f"\n[{group}]")
+        for row in rows[:10]: print(f"  {row['rank']:>3}. No.{row['bib']:<5} {row['name']:<12} {row['total']:>4}pt  {row['points']}")
+    if args.out:
+        write_standings_csv(args.out, events, standings)
+        print(f"\n💾 出力: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
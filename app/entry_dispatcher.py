@@ -0,0 +1,112 @@
+# ====================================================================
+# MGTS - ENTRY送信ディスパッチャ (再送・送達確認付き)
+#  * 送信先ごとにUDPソケットを常駐させて使い回す (タグ読取ごとの生成/破棄をしない)
+#  * メイン基板からの ENTRY_ACK を受けるまで、指数バックオフで再送する
+#  * 同じパケットをシリアル (コントロールハブ経由のESP-NOW) にも同時送出する
+#  * 1件ごとに送信所要時間・ACKまでの時間・試行回数を報告する
+# ====================================================================
+import json
+import queue
+import socket
+import threading
+import time
+from collections import namedtuple
+
+ENTRY_ACK_TIMEOUT = 0.1    # 初回の再送待ち (秒)。以降は倍々に延ばす
+ENTRY_MAX_ATTEMPTS = 5
+
+DispatchReport = namedtuple("DispatchReport", ["tag_id", "seq", "acked", "attempts", "send_ms", "ack_ms", "ack_source", "superseded", "error"])
+
+
+class EntryDispatcher:
+    def __init__(self, targets, get_serial, on_report):
+        self.targets = list(targets)     # [(ip, port), ...]
+        self.get_serial = get_serial     # 現在のシリアルポート (未接続なら None) を返す関数
+        self.on_report = on_report
+        self._sockets = {}               # 送信先 -> 常駐ソケット
+        self._queue = queue.Queue()
+        self._seq = int(time.time()) % 1000000000  # 再起動後に基板側の直前seqと衝突しないよう時刻起点
+        self._lock = threading.Lock()
+        self._waiting = None             # (tag_id, seq, Event, ack情報dict)
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def dispatch(self, tag_id):
+        # 呼び出し元 (NFCスレッド) はブロックしない
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        self._queue.put((tag_id, seq))
+        return seq
+
+    def acknowledge(self, tag_id, seq=None, source=""):
+        with self._lock:
+            w = self._waiting
+            if not w or w[0] != tag_id: return False
+            if seq is not None and seq != w[1]: return False
+            if not w[2].is_set():
+                w[3]["at"] = time.perf_counter()
+                w[3]["source"] = source
+                w[2].set()
+        return True
+
+    # ----------------------------------------------------------------
+    # 内部処理
+    # ----------------------------------------------------------------
+    def _socket_for(self, target):
+        s = self._sockets.get(target)
+        if s is None:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self._sockets[target] = s
+        return s
+
+    def _send_once(self, packet):
+        errors = []
+        for target in self.targets:
+            try:
+                self._socket_for(target).sendto(packet, target)
+            except OSError as err:
+                # 壊れたソケットは破棄し、次回の試行で作り直す
+                s = self._sockets.pop(target, None)
+                if s: s.close()
+                errors.append(f"{target[0]}:{target[1]} {err}")
+        ser = self.get_serial()
+        if ser is not None:
+            try:
+                if ser.is_open: ser.write(packet)
+            except Exception as err:
+                errors.append(f"serial {err}")
+        return errors
+
+    def _worker(self):
+        while True:
+            tag_id, seq = self._queue.get()
+            packet = f"{json.dumps({'type': 'ENTRY', 'id': tag_id, 'seq': seq})}\n".encode()
+            acked_event, ack = threading.Event(), {}
+            with self._lock: self._waiting = (tag_id, seq, acked_event, ack)
+
+            started = time.perf_counter()
+            send_ms, attempts, errors, superseded = None, 0, [], False
+            timeout = ENTRY_ACK_TIMEOUT
+            while attempts < ENTRY_MAX_ATTEMPTS:
+                t0 = time.perf_counter()
+                errors = self._send_once(packet)
+                attempts += 1
+                if send_ms is None: send_ms = (time.perf_counter() - t0) * 1000
+                if acked_event.wait(timeout): break
+                # 次のタグが来ていれば古いENTRYの再送は打ち切る (基板は最新の1件しか保持しない)
+                if not self._queue.empty():
+                    superseded = True
+                    break
+                timeout *= 2
+
+            with self._lock: self._waiting = None
+            acked = acked_event.is_set()
+            ack_ms = (ack["at"] - started) * 1000 if acked else None
+            report = DispatchReport(tag_id, seq, acked, attempts, send_ms, ack_ms, ack.get("source", ""), superseded, " / ".join(errors))
+            try: self.on_report(report)
+            except Exception: pass
+
+    def close(self):
+        for s in self._sockets.values(): s.close()
+        self._sockets.clear()
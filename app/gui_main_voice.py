@@ -7,11 +7,28 @@ import socket
 import json
 import time
 import serial
-import re
 import csv
 import os
+import uuid
 from serial.tools import list_ports
 import pyttsx3
+from overlay_writer import OverlayWriter
+from penalty_history import PenaltyHistory, describe_audit, audit_to_dict, audit_from_dict, DEFAULT_OPERATOR, ID_PREFIX
+from replication import ReplicationNode
+from entry_dispatcher import EntryDispatcher
+from wire_protocol import decode_packet, sensor_trigger, NODE_HUB
+from nfc_gate import NfcGate, NFC_READER_PATHS
+from roster import load_roster, restore_roster
+from season_archive import SeasonArchive
+from record_index import RecordIndex, describe_flags, FLAG_ORDER, PAST_RESULTS_DIR
+from split_timing import SplitBoard, describe_sectors
+from start_scheduler import StartScheduler
+from result_report import ReportWriter
+from result_grid import ResultGrid, OVERALL, HISTORY, FILTER_FLAGS
+from listener_supervisor import ListenerSupervisor, describe_health, RUNNING, WAITING, STALLED
+from node_registry import NodeRegistry, identify_node, packet_fingerprint, describe_node, NODE_NAMES, ONLINE as NODE_ONLINE, MISSING as NODE_MISSING, SILENT as NODE_SILENT
+from scoring_rules import load_rules, compile_rules, SCORING_RULES_PATH
+from sampling_profiler import SamplingProfiler, describe_profile
 
 try:
     import nfc
@@ -22,6 +39,18 @@ except ImportError:
 
 UDP_IP = "0.0.0.0"
 UDP_PORT = 5005
+ENTRY_TARGETS = [("255.255.255.255", UDP_PORT)]  # ENTRYパケットの送信先 (UDP)
+# 基板エミュレータ (board_emulator.py) で試験する時は MGTS_ENTRY_TARGETS=127.0.0.1:5006 のように上書きする
+if os.environ.get("MGTS_ENTRY_TARGETS"):
+    ENTRY_TARGETS = [(host, int(port)) for host, port in (t.strip().rsplit(":", 1) for t in os.environ["MGTS_ENTRY_TARGETS"].split(","))]
+TTS_ENABLED = os.environ.get("MGTS_TTS", "1") != "0"  # ソーク試験などで読み上げを止める時は MGTS_TTS=0
+LOG_MAX_LINES = 500        # ログ画面に残す行数 (1日分を溜め続けない)
+RUNNER_NOTE_TTL = 600      # ゴールしなかった選手のリアクション等のメモを捨てるまでの秒数
+RESULT_DUP_SEC = 10.0      # 同じゼッケン・同じタイムをこの秒数内に受けたら同じ走行 (二重受信・他PCとの重複)
+RESULT_PAGE_SIZE = 50      # リザルト表に一度に描画する行数
+PROFILED_METHODS = ("process_incoming_packet", "handle_serial_line", "recalculate_results", "update_result_table", "render_result_rows", "log_message")   # 区間トレースの対象
+RUN_FIELDS = ("bib", "name", "class", "base_time", "memo_text", "sectors")   # LAN同期の RUN で送る項目 (ゴール時・同期開始時で共通)
+RESULT_SORT_COLUMNS = ["rank", "class", "bib", "name", "time", "top_ratio", "class_ratio", "penalty", "memo"]   # 表の列順
 
 class MotoGymkhanaApp:
     # ====================================================================
@@ -34,11 +63,39 @@ class MotoGymkhanaApp:
         self.page.padding = 0
         
         self.ser = None
+        self.serial_port = None
         self.rider_database = {}    
         self.active_runners = []    
         self.runner_notes = {}      
+        self.runner_note_times = {} # rider_id -> 最後にメモを追加した時刻
+        self.clock = time.time      # 受信時刻・メモの期限・出走予定の時計 (ソーク試験では仮想時計に差し替える)
         self.results_log = []       
+        self.result_grid = ResultGrid()  # リザルト表の並び順キャッシュ・絞り込み索引
+        self.result_view = {"scope": OVERALL, "sort": "rank", "desc": False, "offset": 0}
         self.is_nfc_locked = False  
+        self.overlay_writer = OverlayWriter()  # 配信オーバーレイ出力 (mgts_overlay/)
+        self.penalty_history = PenaltyHistory()  # ペナルティ編集イベント・監査ログ
+        self.runs_by_id = {}        # run_id -> リザルトレコード
+        self.replica = None         # 計測PC間同期ノード (LAN同期ON時のみ)
+        self.roster_refresh_timer = None
+        self.entry_dispatcher = EntryDispatcher(ENTRY_TARGETS, lambda: self.ser, self.on_entry_report)
+        self.entry_lock = threading.Lock()  # 複数レーンからの同時エントリーでロック判定が競合しないように
+        self.state_lock = threading.RLock() # 走行・名簿・採点の変更 (受信・LAN同期・画面操作の各スレッドから1本ずつ)
+        self.archive = SeasonArchive()      # シーズンアーカイブ (mgts_season.db)
+        self.session_id = f"{time.strftime('%H%M%S')}-{ID_PREFIX}"  # 同じ日の別セッションを別の大会として保存する
+        self.record_index = RecordIndex()   # 自己ベスト・クラス/大会レコード (起動時にアーカイブから読み込む)
+        self.scheduler = StartScheduler(clock=lambda: self.clock())   # 出走順・スタート予定・稼働率
+        self.split_board = SplitBoard()     # 中間計測の区間タイム・区間ベスト・理論ベスト
+        self.report_writer = ReportWriter(on_done=self.on_report_done)  # 掲示用順位表 (mgts_reports/)
+        self.listeners = ListenerSupervisor(self.on_listener_change, self.on_monitor_tick)  # UDP/シリアル受信の監視・再起動
+        self.listener_health_texts = []
+        self.nodes = NodeRegistry(on_alert=self.on_node_alert)  # センサー・シグナル・ハブ・メイン基板の死活
+        self.node_strip_texts = []
+        self.scorer = compile_rules()       # 採点ルール (mgts_scoring.json は起動後に読み込む)
+        self.profiler = SamplingProfiler()  # ログ画面から切り替えるプロファイラ (mgts_profiles/)
+        # ハンドラ登録より前に包む (OFFの間はフラグを見るだけ)。画面更新 (page.update) も区間に含める
+        self.profiler.instrument(self, PROFILED_METHODS)
+        self.profiler.instrument(self.page, ("update",))
         
         self.file_picker = ft.FilePicker(on_result=self.on_csv_selected)
         self.save_file_picker = ft.FilePicker(on_result=self.on_save_csv_result)
@@ -47,8 +104,12 @@ class MotoGymkhanaApp:
         self.init_ui_components()
         self.build_layout()
         
-        threading.Thread(target=self.udp_listener, daemon=True).start()
-        if NFC_AVAILABLE: threading.Thread(target=self.nfc_listener, daemon=True).start()
+        self.listeners.start("UDP", self.udp_listener)
+        threading.Thread(target=self.seed_record_index, daemon=True).start()
+        threading.Thread(target=self.restore_roster_snapshot, daemon=True).start()
+        self.reload_scoring_rules()
+        self.nfc_gate = None
+        if NFC_AVAILABLE: self.start_nfc_gate()
         else: self.log_message("⚠️ nfcpy未検出: NFCリーダーがPCに直接接続されていません", ft.Colors.YELLOW)
 
     # ====================================================================
@@ -57,18 +118,44 @@ class MotoGymkhanaApp:
     def init_ui_components(self):
         self.runner_count_text = ft.Text("0 台", size=30, weight=ft.FontWeight.BOLD, color=ft.Colors.CYAN_400)
         self.active_runners_row = ft.Row(wrap=True)
+        self.entry_status_text = ft.Text("ENTRY送信: -", size=12, color=ft.Colors.GREY_400)
+        self.schedule_list = ft.Column(spacing=2)
+        self.schedule_stats_text = ft.Text("", size=12, color=ft.Colors.GREY_400)
+        self.node_strip = ft.Row(spacing=16, wrap=True)
         
-        self.result_tabs = ft.Tabs(selected_index=0, animation_duration=300, tabs=[], expand=True)
+        self.result_tabs = ft.Tabs(selected_index=0, animation_duration=300, tabs=[], on_change=self.on_result_tab_change)
+        # ★カラムに「ペナルティ」を追加し、「備考」と分離 (見出しのクリックで並べ替え)
+        headers = ["順位", "ｸﾗｽ", "ゼッケン", "名前", "最終タイム", "トップ比", "ｸﾗｽ比", "ペナルティ", "備考"]
+        self.result_table = ft.DataTable(columns=[ft.DataColumn(label=ft.Text(h), on_sort=self.on_result_sort) for h in headers] + [ft.DataColumn(label=ft.Text("編集"))], rows=[])
+        # 表示行は1ページ分を起動時に作っておき、描画では中身 (.value / .data) だけを差し替える
+        self.result_row_pool = [self.build_result_row() for _ in range(RESULT_PAGE_SIZE)]
+        self.result_filter_text = ft.TextField(label="名前・ゼッケンで絞り込み", width=240, dense=True, on_change=self.on_result_filter)
+        self.result_flag_filters = {f: ft.Checkbox(label=f, value=False, on_change=self.on_result_filter) for f in FILTER_FLAGS}
+        self.result_page_text = ft.Text("", size=12, color=ft.Colors.GREY_400)
+        self.btn_result_prev = ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, on_click=lambda _: self.on_result_page(-1))
+        self.btn_result_next = ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, on_click=lambda _: self.on_result_page(1))
         
         self.btn_export_csv = ft.ElevatedButton("リザルトをCSV保存", icon=ft.Icons.DOWNLOAD, on_click=lambda _: self.save_file_picker.save_file(allowed_extensions=["csv"], file_name="mgts_results.csv"), color=ft.Colors.WHITE, bgcolor=ft.Colors.BLUE_700)
+        self.btn_report = ft.ElevatedButton("掲示用順位表を出力", icon=ft.Icons.PRINT, on_click=lambda _: self.publish_report(manual=True), color=ft.Colors.WHITE, bgcolor=ft.Colors.TEAL_700)
+        self.sw_auto_report = ft.Switch(label="順位表を自動更新", value=False)
+        self.btn_archive = ft.ElevatedButton("シーズンアーカイブに保存", icon=ft.Icons.ARCHIVE, on_click=lambda _: self.archive_event(), color=ft.Colors.WHITE, bgcolor=ft.Colors.INDIGO_700)
         self.btn_import_csv = ft.ElevatedButton("名簿CSVを一括読込", icon=ft.Icons.UPLOAD_FILE, on_click=lambda _: self.file_picker.pick_files(allowed_extensions=["csv"], allow_multiple=False), color=ft.Colors.WHITE, bgcolor=ft.Colors.GREEN_700)
         self.rider_table = ft.DataTable(columns=[ft.DataColumn(label=ft.Text("タグID")), ft.DataColumn(label=ft.Text("ゼッケン")), ft.DataColumn(label=ft.Text("選手名")), ft.DataColumn(label=ft.Text("クラス"))], rows=[])
 
         self.drop_com = ft.Dropdown(label="COMポート", width=200, options=[])
         self.btn_connect_ser = ft.ElevatedButton("接続", icon=ft.Icons.CABLE, on_click=self.connect_serial)
+        self.btn_reload_rules = ft.ElevatedButton("採点ルール再読込", icon=ft.Icons.RULE, on_click=lambda _: self.reload_scoring_rules())
+        self.sw_replication = ft.Switch(label="LAN同期 (複数PC)", value=False, on_change=self.toggle_replication)
+        self.sw_profile = ft.Switch(label="プロファイル計測", value=False, on_change=self.toggle_profiler)
+        self.cb_profile_trace = ft.Checkbox(label="区間トレース", value=True)
         self.log_box = ft.ListView(expand=True, spacing=5, auto_scroll=True)
+        self.listener_health_column = ft.Column(spacing=2)
         
         self.current_edit_record = None
+        self.txt_operator = ft.TextField(label="担当者", value=DEFAULT_OPERATOR, width=250, dense=True)
+        self.btn_undo_penalty = ft.TextButton("元に戻す", icon=ft.Icons.UNDO, on_click=lambda e: self.undo_penalty())
+        self.btn_redo_penalty = ft.TextButton("やり直し", icon=ft.Icons.REDO, on_click=lambda e: self.redo_penalty())
+        self.penalty_audit_list = ft.ListView(height=120, width=250, spacing=2)
         self.penalty_dialog = ft.AlertDialog(
             title=ft.Text("ペナルティ操作"),
             content=ft.Column([
@@ -81,6 +168,11 @@ class MotoGymkhanaApp:
                 ft.ElevatedButton("MC (ミスコース) にする", on_click=lambda e: self.apply_penalty(999, "MC"), bgcolor=ft.Colors.PURPLE_800, color=ft.Colors.WHITE, width=250),
                 ft.Divider(),
                 ft.ElevatedButton("ペナルティ・MCをリセット", on_click=lambda e: self.apply_penalty(0, "RESET"), color=ft.Colors.RED_200, width=250),
+                ft.Divider(),
+                self.txt_operator,
+                ft.Row([self.btn_undo_penalty, self.btn_redo_penalty]),
+                ft.Text("変更履歴", size=12, color=ft.Colors.GREY_400),
+                self.penalty_audit_list,
             ], tight=True),
             actions=[ft.TextButton("閉じる", on_click=lambda e: self.close_penalty_dialog())],
         )
@@ -89,14 +181,17 @@ class MotoGymkhanaApp:
 
     def build_layout(self):
         self.timing_view = ft.Container(expand=True, padding=20, content=ft.Column([
-                ft.Text("⏱️ 計測ダッシュボード", size=30, weight=ft.FontWeight.BOLD),
+                ft.Row([ft.Text("⏱️ 計測ダッシュボード", size=30, weight=ft.FontWeight.BOLD), self.node_strip], spacing=30),
                 ft.Card(content=ft.Container(padding=20, content=ft.Row([
-                    ft.Column([ft.Text("現在コース上の台数", color=ft.Colors.GREY_400), self.runner_count_text], expand=1),
-                    ft.Column([ft.Text("出走中 ➡ スターティング", color=ft.Colors.GREY_400), self.active_runners_row], expand=5),
+                    ft.Column([ft.Text("現在コース上の台数", color=ft.Colors.GREY_400), self.runner_count_text, self.entry_status_text], expand=1),
+                    ft.Column([ft.Text("出走中 ➡ スターティング", color=ft.Colors.GREY_400), self.active_runners_row], expand=3),
+                    ft.Column([ft.Text("次の出走 (予定)", color=ft.Colors.GREY_400), self.schedule_list, self.schedule_stats_text], expand=2),
                 ]))),
                 ft.Divider(),
-                ft.Row([ft.Text("📊 リザルト一覧", size=20, weight=ft.FontWeight.BOLD), self.btn_export_csv], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                ft.Column([self.result_tabs], expand=True)
+                ft.Row([ft.Text("📊 リザルト一覧", size=20, weight=ft.FontWeight.BOLD), ft.Row([self.sw_auto_report, self.btn_report, self.btn_archive, self.btn_export_csv])], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                ft.Row([self.result_filter_text] + list(self.result_flag_filters.values()) + [ft.Container(expand=True), self.btn_result_prev, self.result_page_text, self.btn_result_next]),
+                self.result_tabs,
+                ft.Column([self.result_table], scroll=ft.ScrollMode.AUTO, expand=True)
             ]))
 
         self.nfc_view = ft.Container(expand=True, padding=20, visible=False, content=ft.Column([
@@ -108,7 +203,8 @@ class MotoGymkhanaApp:
 
         self.system_view = ft.Container(expand=True, padding=20, visible=False, content=ft.Column([
                 ft.Text("⚙️ システムログ", size=30, weight=ft.FontWeight.BOLD),
-                ft.Row([self.drop_com, self.btn_connect_ser, ft.IconButton(icon=ft.Icons.REFRESH, on_click=lambda e: self.refresh_com_ports())]),
+                ft.Row([self.drop_com, self.btn_connect_ser, ft.IconButton(icon=ft.Icons.REFRESH, on_click=lambda e: self.refresh_com_ports()), self.sw_replication, self.btn_reload_rules, self.sw_profile, self.cb_profile_trace]),
+                self.listener_health_column,
                 ft.Divider(),
                 ft.Container(bgcolor=ft.Colors.BLACK87, padding=10, border_radius=5, expand=True, content=self.log_box)
             ]))
@@ -126,227 +222,412 @@ class MotoGymkhanaApp:
     # ====================================================================
     # 4. ペナルティ操作・MC・再計算ロジック
     # ====================================================================
+    def on_edit_clicked(self, e):
+        self.open_penalty_dialog(e.control.data)
+
     def open_penalty_dialog(self, record):
         self.current_edit_record = record
         self.penalty_dialog.title.value = f"操作: No.{record['bib']} {record['name']}"
+        self.refresh_penalty_audit()
         self.penalty_dialog.open = True
         self.page.update()
 
+    def refresh_penalty_audit(self):
+        rec = self.current_edit_record
+        self.penalty_audit_list.controls = [ft.Text(describe_audit(a), size=11) for a in reversed(self.penalty_history.audit_trail(rec))]
+        self.btn_undo_penalty.disabled = not self.penalty_history.can_undo(rec)
+        self.btn_redo_penalty.disabled = not self.penalty_history.can_redo(rec)
+
     def close_penalty_dialog(self):
         self.penalty_dialog.open = False
         self.page.update()
 
     def apply_penalty(self, seconds, note_text):
-        if not self.current_edit_record: return
-        rec = self.current_edit_record
+        with self.state_lock:
+            if not self.current_edit_record: return
+            rec = self.current_edit_record
         
-        # ★修正：memo_text（備考）には一切触れず、penalty_text のみを書き換える
-        if note_text == "RESET":
-            rec["penalty"] = 0
-            rec["is_mc"] = False
-            rec["penalty_text"] = ""
-        elif note_text == "MC":
-            rec["is_mc"] = True
-            rec["penalty_text"] = "MC"
-        else:
-            rec["penalty"] += seconds
-            if rec["penalty_text"] == "MC":
-                rec["penalty_text"] = "" # MCから通常のペナルティ加算に復帰した場合
-            rec["is_mc"] = False
-            rec["penalty_text"] = f"{rec['penalty_text']} [{note_text}]".strip()
-            
-        if rec["is_mc"]:
-            rec["time_float"] = float('inf')
-            rec["time_str"] = "MC"
-            self.log_message(f"⚠️ 修正: No.{rec['bib']} {rec['name']} -> ミスコース(MC)", ft.Colors.PURPLE_300)
-        else:
-            rec["time_float"] = round(rec["base_time"] + rec["penalty"], 3)
-            rec["time_str"] = f"{rec['time_float']:.3f}"
-            self.log_message(f"⚠️ 修正: No.{rec['bib']} {rec['name']} -> {note_text} (トータル: {rec['time_str']}s)", ft.Colors.RED_400)
+            # ★修正：memo_text（備考）には一切触れず、編集イベントとして積み上げる (派生値は採点ルールで再計算)
+            kind = note_text if note_text in ("RESET", "MC") else "PENALTY"
+            entry = self.penalty_history.apply(rec, kind, seconds, note_text, self.txt_operator.value or DEFAULT_OPERATOR)
+            self.replicate("EDIT", rec["run_id"], audit_to_dict(entry))
+            self.close_penalty_dialog()
+            self.recalculate_results(records_changed=True, runs=[rec])
             
-        self.close_penalty_dialog()
-        self.recalculate_results()
-
-    def recalculate_results(self):
-        if not self.results_log: return
-        
-        valid_runs = [r for r in self.results_log if not r.get("is_mc")]
-        global_top = min([r["time_float"] for r in valid_runs]) if valid_runs else None
-        class_tops = {}
-        for r in valid_runs:
-            c = r["class"]
-            if c not in class_tops or r["time_float"] < class_tops[c]:
-                class_tops[c] = r["time_float"]
-
-        for r in self.results_log:
-            r["is_best"] = False
-            r["overall_rank"] = "-"
-            r["class_rank"] = "-"
-            if r.get("is_mc"):
-                r["top_ratio"] = "-"
-                r["class_ratio"] = "-"
+            if rec["is_mc"]:
+                self.log_message(f"⚠️ 修正: No.{rec['bib']} {rec['name']} -> ミスコース(MC)", ft.Colors.PURPLE_300)
             else:
-                if global_top: r["top_ratio"] = f"{(r['time_float'] / global_top) * 100:.2f}%"
-                if class_tops.get(r["class"]): r["class_ratio"] = f"{(r['time_float'] / class_tops[r['class']]) * 100:.2f}%"
-
-        best_runs_map = {}
-        for r in self.results_log:
-            bib = r["bib"]
-            if bib not in best_runs_map:
-                best_runs_map[bib] = r
-            else:
-                curr_best = best_runs_map[bib]
-                if curr_best["is_mc"] and not r["is_mc"]:
-                    best_runs_map[bib] = r
-                elif not curr_best["is_mc"] and not r["is_mc"]:
-                    if r["time_float"] < curr_best["time_float"]:
-                        best_runs_map[bib] = r
-
-        best_valid_list = [r for r in best_runs_map.values() if not r.get("is_mc")]
-        best_valid_list.sort(key=lambda x: x["time_float"])
-        
-        for i, r in enumerate(best_valid_list):
-            r["overall_rank"] = i + 1
-            
-        for c in class_tops.keys():
-            c_best = [r for r in best_valid_list if r["class"] == c]
-            c_best.sort(key=lambda x: x["time_float"])
-            for i, r in enumerate(c_best):
-                r["class_rank"] = i + 1
-
-        for r in best_runs_map.values():
-            r["is_best"] = True
-
-        self.update_result_table()
+                self.log_message(f"⚠️ 修正: No.{rec['bib']} {rec['name']} -> {note_text} (トータル: {rec['time_str']}s)", ft.Colors.RED_400)
+
+    def undo_penalty(self):
+        with self.state_lock:
+            rec = self.current_edit_record
+            entry = self.penalty_history.undo(rec, self.txt_operator.value or DEFAULT_OPERATOR) if rec else None
+            if not entry: return
+            self.replicate("EDIT", rec["run_id"], audit_to_dict(entry))
+            self.refresh_penalty_audit()
+            self.recalculate_results(records_changed=True, runs=[rec])
+            self.log_message(f"↩️ 取消: No.{rec['bib']} {rec['name']} -> {rec['time_str']}", ft.Colors.AMBER_300)
+
+    def redo_penalty(self):
+        with self.state_lock:
+            rec = self.current_edit_record
+            entry = self.penalty_history.redo(rec, self.txt_operator.value or DEFAULT_OPERATOR) if rec else None
+            if not entry: return
+            self.replicate("EDIT", rec["run_id"], audit_to_dict(entry))
+            self.refresh_penalty_audit()
+            self.recalculate_results(records_changed=True, runs=[rec])
+            self.log_message(f"↪️ やり直し: No.{rec['bib']} {rec['name']} -> {rec['time_str']}", ft.Colors.AMBER_300)
+
+    def recalculate_results(self, records_changed=False, runs=None):
+        with self.state_lock:
+            if not self.results_log: return
+            # ペナルティ秒数・MC・DNF・ベスト/順位は採点ルールで計算する
+            # runs: 変更のあった走行 (ゴール・修正)。その走行だけ採点して順位を差分で直す。省略時 (ルール変更) は全走行
+            if runs is None: self.scorer.rescore(self.results_log, self.penalty_history)
+            else: self.scorer.rescore_runs(self.results_log, runs, self.penalty_history)
+            # 修正・ルール変更でタイムが変わった時は記録フラグも付け直す
+            if records_changed: self.record_index.rebuild(self.results_log)
+            self.update_result_table()
+            if self.sw_auto_report.value: self.publish_report()
+
+    def reload_scoring_rules(self):
+        try:
+            rules = load_rules(SCORING_RULES_PATH)
+        except (OSError, ValueError) as ex:
+            self.log_message(f"❌ 採点ルールの読み込みエラー ({SCORING_RULES_PATH}): {ex}", ft.Colors.RED)
+            return
+        self.scorer = compile_rules(rules)
+        t0 = time.perf_counter()
+        self.recalculate_results(records_changed=True)
+        self.log_message(f"📐 採点ルール: {self.scorer.name} ({len(self.results_log)}走を {(time.perf_counter() - t0) * 1000:.0f}ms で再採点)", ft.Colors.GREEN)
 
     # ====================================================================
     # 5. コアロジック（パケット解析・状態遷移）
     # ====================================================================
-    def process_incoming_packet(self, json_str, source):
+    def process_incoming_packet(self, packet, source, addr=None):
         try:
-            data = json.loads(json_str)
+            # JSON文字列 / バイナリパケットを自動判別 (解釈できないものは生ログとして無視)
+            data = decode_packet(packet)
+            if data is None:
+                trigger = sensor_trigger(packet)
+                # 生のトリガー行は中身が毎回同じなので重複判定に使わない (生存確認と受信数だけ数える)
+                if trigger: self.nodes.observe(identify_node({"type": trigger}, addr), fingerprint=None)
+                else: self.listeners.reject(source, packet, "解釈不能")
+                return
             msg_type = data.get("type")
             raw_id = data.get("id")
+            node = identify_node(data, addr)
+            if msg_type == "HEARTBEAT":
+                self.nodes.heartbeat(node, data.get("seq"))
+                return
+            # UDPとハブ経由で同じ内容が届いたものは重複として数える
+            self.nodes.observe(node, packet_fingerprint(data), data.get("ts_us"))
             
-            rider_id = raw_id if raw_id and raw_id != "X999" else (self.active_runners[0] if self.active_runners else "X999")
-            info = self.rider_database.get(rider_id, {"bib": "?", "name": "不明", "class": "-"})
-            rider_name = f"No.{info['bib']} {info['name']}"
-            current_time = time.time()
+            with self.state_lock:
+                rider_id = raw_id if raw_id and raw_id != "X999" else (self.active_runners[0] if self.active_runners else "X999")
+                info = self.rider_database.get(rider_id, {"bib": "?", "name": "不明", "class": "-"})
+                rider_name = f"No.{info['bib']} {info['name']}"
+                current_time = self.clock()
             
-            if msg_type in ["SEQ_START", "FORCE_DNF"]:
-                self.is_nfc_locked = False
-                if msg_type == "SEQ_START": self.log_message(f"🚦 シグナル開始 (NFCロック解除)", ft.Colors.GREEN_400)
-                else:
-                    self.active_runners.clear()
-                    self.update_dashboard_counts()
-                    self.log_message(f"🛑 コースリセット (NFCロック解除 / 待機列クリア)", ft.Colors.ORANGE_400)
+                if msg_type in ["SEQ_START", "FORCE_DNF"]:
+                    self.is_nfc_locked = False
+                    if msg_type == "SEQ_START":
+                        self.scheduler.on_signal()
+                        self.log_message(f"🚦 シグナル開始 (NFCロック解除)", ft.Colors.GREEN_400)
+                    else:
+                        self.reset_course()
+                        self.log_message(f"🛑 コースリセット (NFCロック解除 / 待機列クリア)", ft.Colors.ORANGE_400)
             
-            elif msg_type == "REACTION":
-                diff = data.get("diff", 0.0)
-                if rider_id not in self.runner_notes: self.runner_notes[rider_id] = []
-                self.runner_notes[rider_id].append(f"React:{diff}s")
-                self.log_message(f"⏱️ リアクション: {rider_name} -> {diff}s", ft.Colors.BLUE_200)
+                elif msg_type == "ENTRY_ACK":
+                    self.entry_dispatcher.acknowledge(raw_id, data.get("seq"), source)
+                    # 他の計測PCが受け付けたエントリーもACKは全PCに届く: 出走待ち列に入れる (再送のACKは1回にまとまる)
+                    if raw_id in self.rider_database: self.scheduler.on_entry(raw_id)
+
+                elif msg_type == "REACTION":
+                    diff = data.get("diff", 0.0)
+                    self.add_runner_note(rider_id, f"React:{diff}s")
+                    self.scheduler.on_start(rider_id)
+                    self.log_message(f"⏱️ リアクション: {rider_name} -> {diff}s", ft.Colors.BLUE_200)
                 
-            elif msg_type == "FLYING":
-                diff = data.get("diff", 0.0)
-                if rider_id not in self.runner_notes: self.runner_notes[rider_id] = []
-                self.runner_notes[rider_id].append(f"FLYING({diff}s)")
-                self.log_message(f"⚠️ フライング検知: {rider_name} -> {diff}s", ft.Colors.RED_400)
+                elif msg_type == "FLYING":
+                    diff = data.get("diff", 0.0)
+                    self.add_runner_note(rider_id, f"FLYING({diff}s)")
+                    self.scheduler.on_start(rider_id)
+                    self.log_message(f"⚠️ フライング検知: {rider_name} -> {diff}s", ft.Colors.RED_400)
+
+                elif msg_type == "SPLIT":
+                    # 走行中の通過記録だけ (区間順位・理論ベストはゴール時にまとめて確定する)
+                    elapsed = float(data.get("time", 0.0))
+                    split = self.split_board.on_split(rider_id, int(data.get("sector", 0)), elapsed, current_time)
+                    if split is None: return   # UDPとハブ経由の二重受信
+                    split_no, sector_time, best = split
+                    lap = f" 区間{split_no} {sector_time:.3f}s" if sector_time is not None else ""
+                    if lap and best is not None: lap += f" (区間ベスト {sector_time - best:+.3f})"
+                    self.log_message(f"📍 中間{split_no}: {rider_name} [{elapsed:.3f}s]{lap}", ft.Colors.BLUE_200)
                 
-            elif msg_type == "RESULT":
-                run_time = round(float(data.get("time", 999.999)), 3)
-                time_str = f"{run_time:.3f}"
-                r_class = info.get("class", "-")
+                elif msg_type == "RESULT":
+                    run_time = round(float(data.get("time", 999.999)), 3)
+                    time_str = f"{run_time:.3f}"
+                    r_class = info.get("class", "-")
                 
-                for res in self.results_log:
-                    if res["bib"] == info["bib"] and res["base_time"] == run_time:
-                        if current_time - res.get("recv_time", 0) < 3.0: return
+                    # UDPとハブ経由の二重受信、または他PCから同期済みの同じ走行
+                    if self.find_twin_run(info["bib"], run_time, current_time) is not None: return
                 
-                # ★修正：センサー由来の通知（React/FLYING等）は memo_text に格納する
-                memo_str = " / ".join(self.runner_notes.pop(rider_id, [])) or ""
+                    # ★修正：センサー由来の通知（React/FLYING等）は memo_text に格納する
+                    memo_str = " / ".join(self.runner_notes.pop(rider_id, [])) or ""
+                    self.runner_note_times.pop(rider_id, None)
+                    sectors = self.split_board.on_finish(rider_id, info["bib"], run_time if run_time < 999 else None)
+                    if sectors: memo_str = " / ".join(filter(None, [memo_str, describe_sectors(sectors)]))
                 
-                new_record = {
-                    "bib": info["bib"], "name": info["name"], "class": r_class,
-                    "base_time": run_time, "penalty": 0, "is_mc": False,
-                    "time_float": run_time, "time_str": time_str,
-                    "penalty_text": "", "memo_text": memo_str, # ★2つのテキスト欄に分離
-                    "overall_rank": "-", "class_rank": "-", "top_ratio": "-", "class_ratio": "-",
-                    "is_best": False, "recv_time": current_time
-                }
-                self.results_log.append(new_record)
-                self.recalculate_results()
+                    new_record = {
+                        "bib": info["bib"], "name": info["name"], "class": r_class,
+                        "base_time": run_time, "penalty": 0, "is_mc": False,
+                        "time_float": run_time, "time_str": time_str,
+                        "penalty_text": "", "memo_text": memo_str, # ★2つのテキスト欄に分離
+                        "sectors": sectors,  # 区間タイム [区間1, 区間2, ...] (備考欄の表示とは別に数値で持つ)
+                        "overall_rank": "-", "class_rank": "-", "top_ratio": "-", "class_ratio": "-",
+                        "is_best": False, "recv_time": current_time
+                    }
+                    run_id = self.penalty_history.register_run(new_record)
+                    self.scorer.score_runs([new_record], self.penalty_history)  # 記録判定は採点ルール適用後のタイムで
+                    flags = self.record_index.update(new_record)
+                    self.runs_by_id[run_id] = new_record
+                    self.results_log.append(new_record)
+                    self.replicate("RUN", run_id, {k: new_record.get(k) for k in RUN_FIELDS})
+                    self.recalculate_results(runs=[new_record])
                 
-                sec = int(run_time)
-                ms = int(round((run_time - sec) * 1000))
-                top_ratio_str = new_record['top_ratio'].replace('%','') if new_record['top_ratio'] != '-' else '測定不能'
-                class_ratio_str = new_record['class_ratio'].replace('%','') if new_record['class_ratio'] != '-' else '測定不能'
+                    sec = int(run_time)
+                    ms = int(round((run_time - sec) * 1000))
+                    top_ratio_str = new_record['top_ratio'].replace('%','') if new_record['top_ratio'] != '-' else '測定不能'
+                    class_ratio_str = new_record['class_ratio'].replace('%','') if new_record['class_ratio'] != '-' else '測定不能'
                 
-                speech_text = f"ゼッケン{info['bib']}番。タイム、{sec}秒{ms}。総合タイム比、{top_ratio_str}パーセント。クラスタイム比、{class_ratio_str}パーセントです。"
-
-                def speak_async(text):
-                    try:
-                        engine = pyttsx3.init()
-                        engine.say(text)
-                        engine.runAndWait()
-                    except Exception as e: print(f"TTS Error: {e}")
-
-                threading.Thread(target=speak_async, args=(speech_text,), daemon=True).start()
-                self.log_message(f"🏁 ゴール: {rider_name} [{time_str}s] 総合比 {new_record['top_ratio']} / ｸﾗｽ比 {new_record['class_ratio']}", ft.Colors.CYAN_200)
+                    record_text = describe_flags(flags)
+                    speech_text = (f"{record_text}更新！" if record_text else "") + f"ゼッケン{info['bib']}番。タイム、{sec}秒{ms}。総合タイム比、{top_ratio_str}パーセント。クラスタイム比、{class_ratio_str}パーセントです。"
+
+                    def speak_async(text):
+                        try:
+                            engine = pyttsx3.init()
+                            engine.say(text)
+                            engine.runAndWait()
+                        except Exception as e: print(f"TTS Error: {e}")
+
+                    if TTS_ENABLED: threading.Thread(target=speak_async, args=(speech_text,), daemon=True).start()
+                    self.log_message(f"🏁 ゴール: {rider_name} [{time_str}s] 総合比 {new_record['top_ratio']} / ｸﾗｽ比 {new_record['class_ratio']}", ft.Colors.CYAN_200)
+                    if record_text: self.log_message(f"🏆 {record_text}更新: {rider_name} [{time_str}s]", ft.Colors.AMBER_400)
+                    if sectors:
+                        ideal, own = self.split_board.theoretical_best(), self.split_board.theoretical_best(info["bib"])
+                        ranks = " ".join(f"S{k}:{self.split_board.sector_rank(info['bib'], k) or '-'}位" for k in range(1, len(sectors) + 1))
+                        self.log_message(f"🧩 {describe_sectors(sectors)} / 区間順位 {ranks} / 理論ベスト {own or '-'} (全体 {ideal or '-'})", ft.Colors.BLUE_200)
                 
-                if rider_id in self.active_runners: self.active_runners.remove(rider_id)
-                self.update_dashboard_counts()
+                    if rider_id in self.active_runners: self.active_runners.remove(rider_id)
+                    self.scheduler.on_finish(rider_id, run_time)
+                    self.update_dashboard_counts()
                 
-        except Exception: pass
+        except Exception as err:
+            # 1件の不正パケットで受信を止めない (件数と直近の内容は受信監視に残す)
+            self.listeners.reject(source, packet, f"{type(err).__name__}: {err}")
+
+    def reset_course(self):
+        # コースリセット: 待機列と走行中の中間計測を捨てる (ゴールしない走行の途中経過を次の走行に混ぜない)
+        with self.state_lock:
+            self.scheduler.on_reset()
+            for rider_id in self.active_runners: self.split_board.discard(rider_id)
+            self.active_runners.clear()
+            self.update_dashboard_counts()
+
+    def add_runner_note(self, rider_id, note):
+        # FORCE_DNF の待機列クリアなどでRESULTが来なかった選手のメモは一定時間で捨てる
+        now = self.clock()
+        for rid in [r for r, ts in self.runner_note_times.items() if now - ts > RUNNER_NOTE_TTL]:
+            self.runner_notes.pop(rid, None)
+            del self.runner_note_times[rid]
+        self.runner_notes.setdefault(rider_id, []).append(note)
+        self.runner_note_times[rider_id] = now
+
+    # --------------------------------------------------------------------
+    # 5-2. 計測PC間同期 (LAN)
+    # --------------------------------------------------------------------
+    def toggle_replication(self, e):
+        if e.control.value:
+            try:
+                self.replica = ReplicationNode(f"{DEFAULT_OPERATOR}-{uuid.uuid4().hex[:6]}", self.on_replicated_op)
+            except OSError as err:
+                e.control.value = False
+                self.log_message(f"❌ LAN同期の開始に失敗: {err}", ft.Colors.RED)
+                return
+            self.replica.start()
+            # 同期開始前のローカル状態も配信し、後から参加したPCが追いつけるようにする
+            for tag_id, info in list(self.rider_database.items()): self.replicate("ROSTER", tag_id, info)
+            for run_id, rec in list(self.runs_by_id.items()):
+                if rec["run_id"] != run_id: continue   # 他PCの同じ走行の別名
+                self.replicate("RUN", run_id, {k: rec.get(k) for k in RUN_FIELDS})
+                for entry in self.penalty_history.audit_trail(rec): self.replicate("EDIT", run_id, audit_to_dict(entry))
+            self.log_message(f"🔗 LAN同期 開始: ステーションID {self.replica.station_id}", ft.Colors.GREEN)
+        else:
+            if self.replica: self.replica.stop()
+            self.replica = None
+            self.log_message("🔗 LAN同期 停止", ft.Colors.ORANGE_400)
+
+    def replicate(self, kind, key, data):
+        if self.replica: self.replica.publish(kind, key, data)
+
+    def on_replicated_op(self, op):
+        with self.state_lock:
+            kind, key, data = op["kind"], op["key"], op["data"]
+            if kind == "ROSTER":
+                self.rider_database[key] = data
+                self.schedule_roster_refresh()
+            elif kind == "RUN":
+                if key in self.runs_by_id: return
+                now = self.clock()
+                twin = self.find_twin_run(data["bib"], data["base_time"], now)
+                if twin is not None:
+                    # 同じゴールを両方のPCが記録した: 相手の run_id を別名として同じ走行にまとめる
+                    self.runs_by_id[key] = twin
+                    twin.setdefault("run_aliases", []).append(key)
+                    self.replay_run_edits(twin)
+                    self.recalculate_results(records_changed=True, runs=[twin])
+                    return
+                rec = {
+                    "run_id": key,
+                    "bib": data["bib"], "name": data["name"], "class": data["class"],
+                    "base_time": data["base_time"], "penalty": 0, "is_mc": False,
+                    "time_float": data["base_time"], "time_str": f"{data['base_time']:.3f}",
+                    "penalty_text": "", "memo_text": data.get("memo_text", ""), "sectors": data.get("sectors") or [],
+                    "overall_rank": "-", "class_rank": "-", "top_ratio": "-", "class_ratio": "-",
+                    "is_best": False, "recv_time": now
+                }
+                self.penalty_history.register_run(rec)
+                self.runs_by_id[key] = rec
+                self.results_log.append(rec)
+                self.replay_run_edits(rec)  # 走行より先に届いた編集があれば反映
+                self.scorer.score_runs([rec], self.penalty_history)
+                self.record_index.update(rec)
+                self.recalculate_results(runs=[rec])
+                self.log_message(f"🔗 同期受信: No.{rec['bib']} {rec['name']} [{rec['time_str']}s] ({op['origin']})", ft.Colors.CYAN_200)
+            elif kind == "EDIT":
+                rec = self.runs_by_id.get(key)
+                if not rec: return
+                self.replay_run_edits(rec)
+                if self.current_edit_record is rec: self.refresh_penalty_audit()
+                self.recalculate_results(records_changed=True, runs=[rec])
+                self.log_message(f"🔗 同期編集: No.{rec['bib']} {rec['name']} -> {rec['time_str']} ({op['origin']})", ft.Colors.AMBER_300)
+
+    def find_twin_run(self, bib, base_time, now):
+        # 同じゼッケン・同じタイムを短時間に受け取った走行 (= 同じゴール) を探す
+        for res in reversed(self.results_log):
+            if now - res.get("recv_time", 0) >= RESULT_DUP_SEC: break
+            if res["bib"] == bib and res["base_time"] == base_time: return res
+        return None
+
+    def replay_run_edits(self, rec):
+        # 全PC共通の (lamport, origin) 順で、その走行の編集だけを再生する (同一の編集が再配信されても1回だけ)
+        entries, seen = [], set()
+        for o in self.replica.ops_for("EDIT", rec["run_id"], *rec.get("run_aliases", ())):
+            entry = audit_from_dict(o["data"])
+            if entry in seen: continue
+            seen.add(entry)
+            entries.append(entry)
+        if entries: self.penalty_history.rebuild(rec, entries)
+
+    def schedule_roster_refresh(self):
+        # 名簿の一括同期で表を何百回も作り直さないよう、まとめて1回だけ更新する
+        if self.roster_refresh_timer: return
+        def refresh():
+            self.roster_refresh_timer = None
+            self.update_rider_table()
+        self.roster_refresh_timer = threading.Timer(0.5, refresh)
+        self.roster_refresh_timer.daemon = True
+        self.roster_refresh_timer.start()
 
     # ====================================================================
     # 6. UIレンダリング・画面更新
     # ====================================================================
     def update_result_table(self):
-        def create_table_frame():
-            # ★カラムに「ペナルティ」を追加し、「備考」と分離
-            return ft.DataTable(columns=[
-                    ft.DataColumn(label=ft.Text("順位")), ft.DataColumn(label=ft.Text("ｸﾗｽ")), ft.DataColumn(label=ft.Text("ゼッケン")),
-                    ft.DataColumn(label=ft.Text("名前")), ft.DataColumn(label=ft.Text("最終タイム")), ft.DataColumn(label=ft.Text("トップ比")),
-                    ft.DataColumn(label=ft.Text("ｸﾗｽ比")), ft.DataColumn(label=ft.Text("ペナルティ")), ft.DataColumn(label=ft.Text("備考")), ft.DataColumn(label=ft.Text("編集")),
-                ], rows=[])
-
-        exist_classes = sorted(list(set([r["class"] for r in self.results_log])))
-        tab_list = ["総合"] + exist_classes + ["全履歴"]
-        new_tabs = []
-        
-        for tab_name in tab_list:
-            table = create_table_frame()
+        # 採点後の索引更新と、表示中のページだけの描画 (タブ・並べ替え・絞り込みの切替では作り直さない)
+        self.result_grid.sync(self.results_log)
+        tab_names = [OVERALL] + self.result_grid.classes() + [HISTORY]
+        tabs_changed = tab_names != [t.text for t in self.result_tabs.tabs]
+        if tabs_changed:
+            self.result_tabs.tabs = [ft.Tab(text=name) for name in tab_names]
+            self.result_tabs.selected_index = tab_names.index(self.result_view["scope"]) if self.result_view["scope"] in tab_names else 0
+        changed = self.render_result_rows()
+        self.overlay_writer.publish(self.results_log, self.active_runners, self.rider_database)
+        self.page.update(*changed, *([self.result_tabs] if tabs_changed else []))
+
+    def build_result_row(self):
+        texts = [ft.Text("") for _ in range(9)]
+        texts[4].weight = ft.FontWeight.BOLD
+        texts[7].color = ft.Colors.RED_400   # ペナルティと備考をそれぞれ独立したセルとして表示
+        # 行ごとにクロージャを作らず、共通のハンドラと data で対象レコードを渡す
+        button = ft.IconButton(icon=ft.Icons.ADD_ALERT, icon_size=20, icon_color=ft.Colors.ORANGE_400, on_click=self.on_edit_clicked)
+        row = ft.DataRow(cells=[ft.DataCell(t) for t in texts] + [ft.DataCell(button)])
+        return {"row": row, "texts": texts, "button": button, "shown": None}
+
+    def render_result_rows(self):
+        # 戻り値: 中身が変わって送り直しが必要なコントロール (page.update に渡す)
+        v = self.result_view
+        rows = self.result_grid.query(v["scope"], v["sort"], v["desc"], self.result_filter_text.value or "", [f for f, cb in self.result_flag_filters.items() if cb.value])
+        v["offset"] = min(v["offset"], max(0, (len(rows) - 1) // RESULT_PAGE_SIZE * RESULT_PAGE_SIZE))
+        scope = v["scope"]
+        records = self.result_grid.page(rows, v["offset"], RESULT_PAGE_SIZE)
+        changed = []
+        for slot, r in zip(self.result_row_pool, records):
+            rank_str = str(r["overall_rank"]) if scope == OVERALL else (str(r["class_rank"]) if scope != HISTORY else "-")
             
-            if tab_name == "全履歴":
-                records = list(reversed(self.results_log))
-            else:
-                if tab_name == "総合": records = [r for r in self.results_log if r.get("is_best")]
-                else: records = [r for r in self.results_log if r.get("is_best") and r["class"] == tab_name]
-                records.sort(key=lambda x: (x.get("is_mc", False), x["time_float"]))
-
-            for r in records:
-                rank_str = str(r["overall_rank"]) if tab_name == "総合" else (str(r["class_rank"]) if tab_name != "全履歴" else "-")
-                
-                time_color = ft.Colors.PURPLE_400 if r.get("is_mc") else (ft.Colors.RED_400 if r["penalty"] > 0 else ft.Colors.WHITE)
-                time_display = "MC" if r.get("is_mc") else r["time_str"]
-                
-                # 自動検知されたFLYINGは備考欄で赤字に
-                memo_color = ft.Colors.RED_400 if "FLYING" in r["memo_text"] else ft.Colors.WHITE
-                memo_weight = ft.FontWeight.BOLD if "FLYING" in r["memo_text"] else ft.FontWeight.NORMAL
-                
-                table.rows.append(ft.DataRow(cells=[
-                    ft.DataCell(ft.Text(rank_str)), ft.DataCell(ft.Text(r["class"])), ft.DataCell(ft.Text(r["bib"])), ft.DataCell(ft.Text(r["name"])),
-                    ft.DataCell(ft.Text(time_display, weight=ft.FontWeight.BOLD, color=time_color)),
-                    ft.DataCell(ft.Text(r["top_ratio"])), ft.DataCell(ft.Text(r["class_ratio"])),
-                    # ペナルティと備考をそれぞれ独立したセルとして表示
-                    ft.DataCell(ft.Text(r["penalty_text"], color=ft.Colors.RED_400)), 
-                    ft.DataCell(ft.Text(r["memo_text"], color=memo_color, weight=memo_weight)),
-                    ft.DataCell(ft.IconButton(icon=ft.Icons.ADD_ALERT, icon_size=20, icon_color=ft.Colors.ORANGE_400, on_click=lambda e, rec=r: self.open_penalty_dialog(rec)))
-                ]))
-            new_tabs.append(ft.Tab(text=tab_name, content=ft.Column([table], scroll=ft.ScrollMode.AUTO)))
-
-        self.result_tabs.tabs = new_tabs
-        self.page.update()
+            time_color = ft.Colors.PURPLE_400 if r.get("is_mc") else (ft.Colors.RED_400 if r["penalty"] > 0 else ft.Colors.WHITE)
+            time_display = "MC" if r.get("is_mc") else (r.get("score_str", r["time_str"]) if scope != HISTORY else r["time_str"])
+            # 新記録の走行はタイムを金色にし、記録の種類を添える
+            flags = r.get("record_flags", ())
+            if flags:
+                time_color = ft.Colors.AMBER_400
+                time_display += " " + "/".join(f for f in FLAG_ORDER if f in flags)
+            
+            # 自動検知されたFLYINGは備考欄で赤字に
+            flying = "FLYING" in r["memo_text"]
+            values = (rank_str, r["class"], str(r["bib"]), r["name"], time_display, r["top_ratio"], r["class_ratio"], r["penalty_text"], r["memo_text"])
+            shown = (values, time_color, flying, id(r))
+            if shown == slot["shown"]: continue   # 前回と同じ内容 -> 触らない
+            slot["shown"] = shown
+            texts = slot["texts"]
+            for t, value in zip(texts, values): t.value = value
+            texts[4].color = time_color
+            texts[8].color = ft.Colors.RED_400 if flying else ft.Colors.WHITE
+            texts[8].weight = ft.FontWeight.BOLD if flying else ft.FontWeight.NORMAL
+            slot["button"].data = r
+            changed.append(slot["row"])
+        if len(self.result_table.rows) != len(records):
+            self.result_table.rows = [slot["row"] for slot in self.result_row_pool[:len(records)]]
+            changed = [self.result_table]   # 行数が変わった時だけ表ごと送る
+        sort_index = RESULT_SORT_COLUMNS.index(v["sort"]) if v["sort"] in RESULT_SORT_COLUMNS else None
+        if (self.result_table.sort_column_index, self.result_table.sort_ascending) != (sort_index, not v["desc"]):
+            self.result_table.sort_column_index = sort_index
+            self.result_table.sort_ascending = not v["desc"]
+            changed = [self.result_table]
+        last = min(v["offset"] + RESULT_PAGE_SIZE, len(rows))
+        self.result_page_text.value = f"{v['offset'] + 1 if rows else 0}-{last} / {len(rows)}件"
+        self.btn_result_prev.disabled = v["offset"] == 0
+        self.btn_result_next.disabled = last >= len(rows)
+        return changed + [self.result_page_text, self.btn_result_prev, self.btn_result_next]
+
+    def on_result_tab_change(self, e):
+        scope = self.result_tabs.tabs[self.result_tabs.selected_index].text
+        # 履歴は新しい走行から、順位タブは順位順で開く
+        self.result_view.update(scope=scope, sort="order" if scope == HISTORY else "rank", desc=scope == HISTORY, offset=0)
+        self.page.update(*self.render_result_rows())
+
+    def on_result_sort(self, e):
+        self.result_view.update(sort=RESULT_SORT_COLUMNS[e.column_index], desc=not e.ascending, offset=0)
+        self.page.update(*self.render_result_rows())
+
+    def on_result_filter(self, e):
+        self.result_view["offset"] = 0
+        self.page.update(*self.render_result_rows())
+
+    def on_result_page(self, step):
+        self.result_view["offset"] = max(0, self.result_view["offset"] + step * RESULT_PAGE_SIZE)
+        self.page.update(*self.render_result_rows())
 
     # --- 以下、省略不可の定型処理 ---
     def on_save_csv_result(self, e: ft.FilePickerResultEvent):
@@ -367,88 +648,161 @@ class MotoGymkhanaApp:
         if e.files and len(e.files) > 0:
             file_path = e.files[0].path
             try:
-                try:
-                    with open(file_path, mode='r', encoding='utf-8-sig') as f: lines = f.readlines()
-                except UnicodeDecodeError:
-                    with open(file_path, mode='r', encoding='shift_jis') as f: lines = f.readlines()
-                self._parse_csv(lines)
+                snapshot, _ = load_roster(file_path)
+                self._apply_roster(snapshot["riders"], snapshot["errors"], "📁 名簿読込完了")
             except Exception as ex: self.log_message(f"❌ 読み込みエラー: {ex}", ft.Colors.RED)
 
-    def _parse_csv(self, lines):
-        if not lines: return
-        count, error_count, header_skipped = 0, 0, False
-        for idx, raw_line in enumerate(lines):
-            line = raw_line.strip()
-            if not line: continue
-            if line.startswith('"') and line.endswith('"'): line = line[1:-1]
-            if ',' in line: row = line.split(',')
-            elif '\t' in line: row = line.split('\t')
-            else: row = re.split(r'\s+', line)
-            row = [item.strip() for item in row if item.strip()]
-
-            if len(row) < 4:
-                if idx > 0 and row: error_count += 1
-                continue
-            if not header_skipped and ("ID" in row[0].upper() or "タグ" in row[0]):
-                header_skipped = True
-                continue
-                
-            tag_id, bib, name = row[0].upper(), row[1], row[2]
-            r_class = row[3] if len(row) > 3 else "-"
-            
-            if not bib.isdigit() or not name:
-                error_count += 1
-                continue
-
-            self.rider_database[tag_id] = {"bib": bib, "name": name, "class": r_class}
-            count += 1
-            
-        self.update_rider_table()
-        msg = f"📁 名簿読込完了: {count}名登録"
-        if error_count > 0: msg += f" (エラー: {error_count}件)"
-        self.log_message(msg, ft.Colors.GREEN if count > 0 else ft.Colors.RED)
-
-    def on_nfc_connect(self, tag):
-        try:
-            if tag.ndef and tag.ndef.records and isinstance(tag.ndef.records[0], ndef.TextRecord): tag_id = tag.ndef.records[0].text
-            else: return True
-        except: return True
-
-        if self.is_nfc_locked:
+    def restore_roster_snapshot(self):
+        # 前回までに読み込んだ名簿 (複数CSVは読み込み順に重ねる) をスナップショットから復元 (元CSVが変わっていれば読み直す)
+        try: restored = restore_roster()
+        except Exception as ex:
+            self.log_message(f"⚠️ 前回の名簿を復元できません: {ex}", ft.Colors.YELLOW)
+            return
+        if restored is None: return
+        snapshot, rebuilt = restored
+        label = "📁 名簿を再読込 (CSV更新あり)" if rebuilt else "📁 前回の名簿を復元"
+        self._apply_roster(snapshot["riders"], snapshot["errors"], f"{label} [{', '.join(os.path.basename(src['source']) for src in snapshot['sources'])}]")
+
+    def _apply_roster(self, riders, error_count, label):
+        with self.state_lock:
+            for tag_id, info in riders.items():
+                self.rider_database[tag_id] = info
+                self.replicate("ROSTER", tag_id, info)
+            count = len(riders)
+            self.update_rider_table()
+            msg = f"{label}: {count}名登録"
+            if error_count > 0: msg += f" (エラー: {error_count}件)"
+            self.log_message(msg, ft.Colors.GREEN if count > 0 else ft.Colors.RED)
+
+    def on_nfc_connect(self, tag_id, lane=0):
+        # NfcGate のワーカースレッドから呼ばれる (連続読取はゲート側で破棄済み)。受付しなかったら False (デバウンスに記録させない)
+        with self.entry_lock:
+            locked = self.is_nfc_locked
+            accepted = not locked and tag_id in self.rider_database
+            if accepted: self.is_nfc_locked = True
+
+        if locked:
             self.log_message("🔒 ロック中: 前の選手がスタートするまでタッチ不可", ft.Colors.RED)
-            self.page.update()
-            return True
+            return False
 
-        if tag_id in self.rider_database:
+        if accepted:
             rider = self.rider_database[tag_id]
-            self.log_message(f"📖 エントリー受付: No.{rider['bib']} {rider['name']} (ID:{tag_id})", ft.Colors.GREEN_200)
-
-            packet = f"{json.dumps({'type':'ENTRY', 'id':tag_id})}\n".encode()
-            if self.ser and self.ser.is_open: self.ser.write(packet) 
-            try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-                s.sendto(packet, ("255.255.255.255", UDP_PORT))
-                s.close()
-            except: pass
+            self.log_message(f"📖 エントリー受付: No.{rider['bib']} {rider['name']} (ID:{tag_id} / レーン{lane + 1})", ft.Colors.GREEN_200)
+
+            # 送信・再送・ACK待ちはディスパッチャのスレッドで行う (結果は on_entry_report へ)
+            self.entry_dispatcher.dispatch(tag_id)
+            self.scheduler.on_entry(tag_id)
+            self.archive.submit("personal_best", rider["bib"], rider["name"], callback=lambda pb, err, rider=rider: self.on_archive_pb(rider, pb))
+            self.entry_status_text.value = f"ENTRY送信中: No.{rider['bib']}"
+            self.entry_status_text.color = ft.Colors.AMBER_300
             
             self.active_runners.append(tag_id)
-            self.is_nfc_locked = True
             self.update_dashboard_counts()
         else:
             self.log_message(f"⚠️ 未登録タグ: {tag_id} (CSVに登録されていません)", ft.Colors.YELLOW)
-        self.page.update()
-        return True
-
+        return accepted
+
+    def on_entry_report(self, report):
+        info = self.rider_database.get(report.tag_id, {"bib": "?", "name": "不明"})
+        rider_name = f"No.{info['bib']} {info['name']}"
+        if report.acked:
+            self.entry_status_text.value = f"ENTRY確認済: {rider_name} ({report.ack_ms:.0f}ms / {report.attempts}回)"
+            self.entry_status_text.color = ft.Colors.GREEN_400
+            self.log_message(f"📨 ENTRY送達確認: {rider_name} 送信 {report.send_ms:.1f}ms / ACK {report.ack_ms:.1f}ms ({report.attempts}回, {report.ack_source})", ft.Colors.GREEN_200)
+        elif report.superseded:
+            self.log_message(f"↪️ ENTRY再送打ち切り (次のエントリーへ): {rider_name}", ft.Colors.GREY_400)
+        else:
+            self.entry_status_text.value = f"ENTRY未確認: {rider_name}"
+            self.entry_status_text.color = ft.Colors.RED_400
+            detail = f" エラー: {report.error}" if report.error else ""
+            self.log_message(f"❌ ENTRY未確認: {rider_name} ({report.attempts}回送信){detail}", ft.Colors.RED)
+
+    # --------------------------------------------------------------------
+    # シーズンアーカイブ (問い合わせ・取り込みはアーカイブのスレッドで行う)
+    # --------------------------------------------------------------------
+    def seed_record_index(self):
+        try:
+            self.record_index.seed_from_archive(self.archive)
+            csv_count = self.record_index.seed_from_csv_dir(PAST_RESULTS_DIR)
+            self.record_index.rebuild(self.results_log)
+        except Exception as ex:
+            self.log_message(f"⚠️ 過去記録の読み込みに失敗: {ex}", ft.Colors.YELLOW)
+            return
+        idx = self.record_index
+        source = f" (リザルトCSV {csv_count}件を含む)" if csv_count else ""
+        if idx.seed_pb: self.log_message(f"🏆 過去記録を読み込み{source}: 自己ベスト {len(idx.seed_pb)}名 / クラスレコード {len(idx.seed_class)}クラス / 大会レコード {idx.seed_overall:.3f}s", ft.Colors.INDIGO_200)
+
+    def on_archive_pb(self, rider, pb):
+        if pb: self.log_message(f"📚 シーズンPB: No.{rider['bib']} {rider['name']} -> {pb['time_float']:.3f}s ({pb['date']} {pb['event_name']})", ft.Colors.INDIGO_200)
+
+    def archive_event(self):
+        date = time.strftime("%Y-%m-%d")
+        results = [dict(r) for r in self.results_log]
+        audit = {r["run_id"]: self.penalty_history.audit_trail(r) for r in self.results_log}
+        def done(event_id, err):
+            if err: self.log_message(f"❌ アーカイブ保存エラー: {err}", ft.Colors.RED)
+            else: self.log_message(f"📚 シーズンアーカイブに保存: {date} ({len(results)}走)", ft.Colors.GREEN)
+        self.archive.submit("ingest_event", f"MGTS {date}", date, results, dict(self.rider_database), audit, "", self.session_id, callback=done)
+
+    def publish_report(self, manual=False):
+        # 描画はワーカープロセス側。ここでは現在の順位のスナップショットを渡すだけ
+        if not self.results_log:
+            if manual: self.log_message("⚠️ 順位表: まだ走行がありません", ft.Colors.YELLOW)
+            return
+        self.report_writer.publish(self.results_log, f"MGTS {time.strftime('%Y-%m-%d')}", tag=manual)
+
+    def on_report_done(self, report):
+        if "error" in report: self.log_message(f"❌ 順位表の出力エラー: {report['error']}", ft.Colors.RED)
+        elif report["tag"]:
+            kind = "HTML/PDF" if report["pdf"] else "HTML (PDFはWeasyPrint未導入)"
+            self.log_message(f"🖨️ 順位表を出力 [{kind}]: {report['index']} (更新 {report['rendered']}区分 / 変更なし {report['reused']}区分)", ft.Colors.GREEN)
+
+    # --------------------------------------------------------------------
+    # ログ画面 (ログ出力・プロファイラの開始/停止と要約の表示)
+    # --------------------------------------------------------------------
     def log_message(self, msg, color=ft.Colors.WHITE70):
         timestamp = time.strftime("[%H:%M:%S] ")
         self.log_box.controls.append(ft.Text(timestamp + msg, color=color))
+        if len(self.log_box.controls) > LOG_MAX_LINES: del self.log_box.controls[:-LOG_MAX_LINES]
         self.page.update()
 
+    def toggle_profiler(self, e):
+        if e.control.value:
+            self.profiler.start(trace=self.cb_profile_trace.value)
+            self.cb_profile_trace.disabled = True
+            self.log_message(f"🔬 プロファイル計測 開始{' (区間トレースあり)' if self.cb_profile_trace.value else ''}", ft.Colors.CYAN_200)
+            return
+        self.cb_profile_trace.disabled = False
+        try: report = self.profiler.stop()
+        except Exception as ex:
+            self.log_message(f"❌ プロファイルの出力エラー: {ex}", ft.Colors.RED)
+            return
+        if report is None: return
+        lines = describe_profile(report) + [f"  出力: {path}" for path in report["paths"]]
+        self.log_message("🔬 プロファイル計測 終了: " + "\n".join(lines), ft.Colors.CYAN_200)
+
+    # --------------------------------------------------------------------
+    # 名簿・出走予定・ダッシュボードの表示
+    # --------------------------------------------------------------------
     def update_rider_table(self):
-        self.rider_table.rows = [ft.DataRow(cells=[ft.DataCell(ft.Text(tid)), ft.DataCell(ft.Text(i.get("bib", ""))), ft.DataCell(ft.Text(i.get("name", ""))), ft.DataCell(ft.Text(i.get("class", "")))]) for tid, i in self.rider_database.items()]
+        with self.state_lock:
+            self.rider_table.rows = [ft.DataRow(cells=[ft.DataCell(ft.Text(tid)), ft.DataCell(ft.Text(i.get("bib", ""))), ft.DataCell(ft.Text(i.get("name", ""))), ft.DataCell(ft.Text(i.get("class", "")))]) for tid, i in self.rider_database.items()]
+            self.scheduler.set_roster(self.rider_database, dict(self.record_index.pb))
+        self.update_schedule_view()
         self.page.update()
 
+    def update_schedule_view(self):
+        now = self.clock()
+        rows = []
+        for tag_id, eta, t_run in self.scheduler.upcoming(8, now):
+            info = self.rider_database.get(tag_id, {"bib": "?", "name": "不明", "class": "-"})
+            wait = eta - now
+            when = "今すぐ" if wait < 1 else f"{wait:.0f}秒後"
+            rows.append(ft.Text(f"{when:>6}  No.{info['bib']} {info['name']} ({info['class']}) 見込み {t_run:.1f}s", size=12))
+        self.schedule_list.controls = rows or [ft.Text("待機なし", size=12, color=ft.Colors.GREY_400)]
+        st = self.scheduler.stats(now)
+        self.schedule_stats_text.value = f"{st['runs']}走 / {st['runs_per_hour']:.1f} 走/時 (直近1時間 {st['runs_last_hour']}走) / 空き 平均{st['idle_avg']:.0f}秒 計{st['idle_total'] / 60:.1f}分"
+
     def update_dashboard_counts(self):
         self.runner_count_text.value = f"{len(self.active_runners)} 台"
         self.active_runners_row.controls.clear()
@@ -458,6 +812,8 @@ class MotoGymkhanaApp:
                 chip = ft.Chip(label=ft.Text(f"No.{info.get('bib', '?')} {info.get('name', '不明')}", weight=ft.FontWeight.BOLD), bgcolor=ft.Colors.ORANGE_800)
                 self.active_runners_row.controls.append(chip)
         else: self.active_runners_row.controls.append(ft.Text("待機なし", size=24, weight=ft.FontWeight.BOLD, color=ft.Colors.ORANGE_400))
+        self.update_schedule_view()
+        self.overlay_writer.publish(self.results_log, self.active_runners, self.rider_database)
         self.page.update()
 
     def refresh_com_ports(self):
@@ -471,42 +827,100 @@ class MotoGymkhanaApp:
         self.page.update()
 
     def connect_serial(self, e):
-        try:
-            self.ser = serial.Serial(self.drop_com.value, 115200, timeout=0.5)
-            self.log_message(f"✅ 接続成功: {self.drop_com.value}", ft.Colors.GREEN)
-            threading.Thread(target=self.serial_listener, daemon=True).start()
-        except Exception as err: self.log_message(f"❌ シリアル接続エラー: {err}", ft.Colors.RED)
+        # 接続・切断時の再接続は受信監視に任せる (ポートが抜けても挿し直せば自動で復帰)
+        if not self.drop_com.value: return
+        self.serial_port = self.drop_com.value
+        self.listeners.start("SERIAL", self.serial_listener)
 
-    def udp_listener(self):
+    def udp_listener(self, ctx):
+        # 受信監視のスレッドで動く。例外で抜けたら再起動される
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.settimeout(1.0)   # 受信がなくてもハートビートを打つ
         try:
             s.bind((UDP_IP, UDP_PORT))
-            while True:
-                data, _ = s.recvfrom(1024)
-                self.process_incoming_packet(data.decode('utf-8', 'ignore').strip(), "UDP")
-        except: pass
-
-    def serial_listener(self):
-        while self.ser and self.ser.is_open:
-            if self.ser.in_waiting > 0:
-                line = self.ser.readline().decode('utf-8', 'ignore').strip()
-                if line == "SEQ_START" or "SEQ_START" in line:
-                    self.is_nfc_locked = False
-                    self.log_message("🚦 シグナル開始 (NFCロック解除)", ft.Colors.GREEN_400)
-                elif line == "FORCE_DNF" or "FORCE_DNF" in line:
-                    self.is_nfc_locked = False
-                    self.active_runners.clear()
-                    self.update_dashboard_counts()
-                    self.log_message("🛑 コースリセット (NFCロック解除 / 待機列クリア)", ft.Colors.ORANGE_400)
-                elif line.startswith("[ESP_DATA] "): 
-                    self.process_incoming_packet(line.replace("[ESP_DATA] ", ""), "SERIAL")
+            while ctx.running:
+                try: data, addr = s.recvfrom(1024)
+                except socket.timeout:
+                    ctx.beat()
+                    continue
+                ctx.message()
+                self.process_incoming_packet(data, "UDP", addr[0])
+        finally: s.close()
+
+    def serial_listener(self, ctx):
+        ser = serial.Serial(self.serial_port, 115200, timeout=0.5)
+        self.ser = ser
+        self.log_message(f"✅ 接続成功: {self.serial_port}", ft.Colors.GREEN)
+        try:
+            while ctx.running:
+                raw = ser.readline()   # タイムアウト (0.5秒) で空が返る
+                if not raw:
+                    ctx.beat()
+                    continue
+                ctx.message()
+                self.handle_serial_line(raw.decode('utf-8', 'ignore').strip())
+        finally:
+            if self.ser is ser: self.ser = None
+            ser.close()
+
+    def on_listener_change(self, name, state, detail):
+        if state == RUNNING: self.log_message(f"📡 受信 {name}: {state}{' (' + detail + ')' if detail else ''}", ft.Colors.GREEN_200)
+        elif state == WAITING: self.log_message(f"❌ 受信 {name}: {detail}", ft.Colors.RED)
+        elif state == STALLED: self.log_message(f"⚠️ 受信 {name}: {state} ({detail})", ft.Colors.ORANGE_400)
+        else: self.log_message(f"📡 受信 {name}: {state}", ft.Colors.GREY_400)
+        self.refresh_listener_health(force=True)
+
+    def on_monitor_tick(self):
+        # 受信監視の1秒ごとの確認に合わせて、ノード状態とリスナー状態の表示を更新する
+        self.nodes.check()
+        self.refresh_node_strip()
+        self.refresh_listener_health()
+
+    def on_node_alert(self, node, state, detail):
+        color = ft.Colors.RED_400 if state == NODE_MISSING else ft.Colors.GREEN_200
+        self.log_message(f"{'🚨' if state == NODE_MISSING else '📡'} ノード {NODE_NAMES.get(node, node)}: {state} ({detail})", color)
+
+    def refresh_node_strip(self):
+        rows = self.nodes.snapshot()
+        texts = [describe_node(r) for r in rows]
+        if texts == self.node_strip_texts: return
+        self.node_strip_texts = texts
+        colors = {NODE_ONLINE: ft.Colors.GREEN_400, NODE_MISSING: ft.Colors.RED_400, NODE_SILENT: ft.Colors.AMBER_400}
+        self.node_strip.controls = [ft.Text(f"● {t}", size=12, color=colors.get(r["state"], ft.Colors.GREY_500)) for r, t in zip(rows, texts)]
+        self.page.update()
 
-    def nfc_listener(self):
-        while True:
-            try:
-                with nfc.ContactlessFrontend('usb') as clf: clf.connect(rdwr={'on-connect': self.on_nfc_connect})
-            except: time.sleep(2)
+    def refresh_listener_health(self, force=False):
+        # ログ画面を開いている時だけ、表示が変わった場合に描画する
+        if not (force or self.system_view.visible): return
+        rows = self.listeners.snapshot()
+        texts = [describe_health(r) for r in rows]
+        if texts == self.listener_health_texts: return
+        self.listener_health_texts = texts
+        colors = {RUNNING: ft.Colors.GREEN_200, WAITING: ft.Colors.RED_400, STALLED: ft.Colors.ORANGE_400}
+        self.listener_health_column.controls = [ft.Text(t, size=12, color=colors.get(r["state"], ft.Colors.GREY_400)) for r, t in zip(rows, texts)]
+        self.page.update()
+
+    def handle_serial_line(self, line):
+        self.nodes.observe(NODE_HUB)   # ハブはPCにUSB直結 (中継した行もハブの生存確認になる)
+        if line == "SEQ_START" or "SEQ_START" in line:
+            self.is_nfc_locked = False
+            self.scheduler.on_signal()
+            self.log_message("🚦 シグナル開始 (NFCロック解除)", ft.Colors.GREEN_400)
+        elif line == "FORCE_DNF" or "FORCE_DNF" in line:
+            self.is_nfc_locked = False
+            self.reset_course()
+            self.log_message("🛑 コースリセット (NFCロック解除 / 待機列クリア)", ft.Colors.ORANGE_400)
+        elif line.startswith("[ESP_DATA] "): 
+            self.process_incoming_packet(line.replace("[ESP_DATA] ", ""), "SERIAL")
+
+    def start_nfc_gate(self):
+        self.nfc_gate = NfcGate(self.on_nfc_connect, NFC_READER_PATHS, on_status=self.on_nfc_status)
+        self.nfc_gate.start()
+
+    def on_nfc_status(self, lane, path, connected, detail):
+        if connected: self.log_message(f"📡 NFCリーダー接続: レーン{lane + 1} ({path})", ft.Colors.GREEN_200)
+        else: self.log_message(f"⚠️ NFCリーダー切断: レーン{lane + 1} ({path}) {detail}", ft.Colors.YELLOW)
 
 def main(page: ft.Page): MotoGymkhanaApp(page)
 if __name__ == "__main__": ft.app(target=main)
@@ -0,0 +1,204 @@
+# ====================================================================
+# MGTS - 受信リスナーの監視・自動再起動
+#  * UDP / シリアルなどの受信ループを1本ずつ監視付きスレッドで動かす
+#  * 受信ループは ctx.beat() (待ち受けのタイムアウトごと) と ctx.message() (受信ごと) を呼ぶ。
+#    ハートビートが途絶えたリスナーは「応答なし」として数秒で通知する
+#  * 例外で落ちた・途中で抜けたリスナーは、短い間隔から倍々に延ばして再起動する
+#  * 解釈できなかったパケットは件数を数え、直近の数件を理由つきで残す
+# ====================================================================
+import threading
+import time
+from collections import deque
+
+LISTENER_RESTART_MIN = 0.2     # 再起動までの待ち (秒)。失敗が続くと倍々に延ばす
+LISTENER_RESTART_MAX = 10.0
+LISTENER_STALL_SEC = 5.0       # この秒数ハートビートがなければ「応答なし」
+LISTENER_CHECK_SEC = 1.0       # 監視スレッドの確認間隔
+REJECT_SAMPLES = 20
+
+RUNNING, WAITING, STALLED, STOPPED = "稼働", "再起動待ち", "応答なし", "停止"
+
+
+class ListenerContext:
+    # 受信ループに渡す窓口 (ループ側はこれだけを見る)
+    def __init__(self, supervisor, name, generation):
+        self._sup, self.name, self._gen = supervisor, name, generation
+
+    @property
+    def running(self):
+        h = self._sup._listeners.get(self.name)
+        return h is not None and h.wanted and h.generation == self._gen
+
+    def beat(self):
+        self._sup._listeners[self.name].last_beat = time.monotonic()
+
+    def message(self):
+        h = self._sup._listeners[self.name]
+        h.last_beat = h.last_msg = time.monotonic()
+        h.messages += 1
+
+    def reject(self, raw, reason):
+        self._sup.reject(self.name, raw, reason)
+
+
+class ListenerHealth:
+    def __init__(self, name, run):
+        self.name, self.run = name, run
+        self.wanted = True
+        self.generation = 0
+        self.state = WAITING
+        self.last_beat = self.last_msg = None
+        self.messages = self.errors = self.restarts = self.rejected = 0
+        self.last_error = ""
+        self.rejects = deque(maxlen=REJECT_SAMPLES)   # (時刻, 理由, 先頭の生データ)
+        self.rate = 0.0
+        self._rate_at, self._rate_count = time.monotonic(), 0
+
+
+class ListenerSupervisor:
+    def __init__(self, on_change=None, on_tick=None, stall_sec=LISTENER_STALL_SEC, check_sec=LISTENER_CHECK_SEC):
+        self.on_change = on_change      # on_change(name, 状態, 詳細): 状態が変わった時だけ
+        self.on_tick = on_tick          # on_tick(): 確認間隔ごと (受信件数/秒などの表示更新用)
+        self.stall_sec = stall_sec
+        self.check_sec = check_sec
+        self._listeners = {}            # name -> ListenerHealth
+        self._lock = threading.Lock()
+        self._monitor = None
+
+    # ----------------------------------------------------------------
+    # 起動・停止
+    # ----------------------------------------------------------------
+    def start(self, name, run):
+        # run(ctx): 受信ループ。ctx.running が False になったら戻る。同名のリスナーは入れ替える
+        with self._lock:
+            old = self._listeners.get(name)
+            h = ListenerHealth(name, run)
+            if old is not None:
+                h.generation = old.generation + 1
+                h.messages, h.errors, h.restarts, h.rejected, h.rejects = old.messages, old.errors, old.restarts, old.rejected, old.rejects
+            self._listeners[name] = h
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._monitor_loop, name="listener-monitor", daemon=True)
+                self._monitor.start()
+        threading.Thread(target=self._worker, args=(h,), name=f"listener-{name}", daemon=True).start()   # 名前はプロファイルの集計に出る
+
+    def stop(self, name):
+        h = self._listeners.get(name)
+        if h is None: return
+        h.wanted = False
+        self._set_state(h, STOPPED)
+
+    def _worker(self, h):
+        ctx = ListenerContext(self, h.name, h.generation)
+        delay = LISTENER_RESTART_MIN
+        while ctx.running:
+            started = h.last_beat = time.monotonic()
+            self._set_state(h, RUNNING)
+            try:
+                h.run(ctx)
+                if not ctx.running: return
+                err = "受信ループが終了しました"
+            except Exception as e:
+                err = f"{type(e).__name__}: {e}"
+            if not ctx.running: return
+            h.errors += 1
+            h.last_error = err
+            self._set_state(h, WAITING, f"{err} ({delay:.1f}秒後に再起動)")
+            time.sleep(delay)
+            if not ctx.running: return
+            h.restarts += 1
+            # 一定時間まともに動いた後の失敗なら待ちを戻す
+            delay = LISTENER_RESTART_MIN if time.monotonic() - started > LISTENER_RESTART_MAX * 3 else min(delay * 2, LISTENER_RESTART_MAX)
+
+    def _set_state(self, h, state, detail=""):
+        if h.state == state: return
+        h.state = state
+        if self.on_change:
+            try: self.on_change(h.name, state, detail)
+            except Exception: pass
+
+    # ----------------------------------------------------------------
+    # 監視
+    # ----------------------------------------------------------------
+    def _monitor_loop(self):
+        while True:
+            time.sleep(self.check_sec)
+            self.check()
+            if self.on_tick:
+                try: self.on_tick()
+                except Exception: pass
+
+    def check(self, now=None):
+        now = time.monotonic() if now is None else now
+        for h in list(self._listeners.values()):
+            if h.state == RUNNING and h.last_beat is not None and now - h.last_beat > self.stall_sec:
+                self._set_state(h, STALLED, f"{now - h.last_beat:.1f}秒間ハートビートなし")
+            elif h.state == STALLED and now - h.last_beat <= self.stall_sec:
+                self._set_state(h, RUNNING, "復帰")
+            elapsed = now - h._rate_at
+            if elapsed >= self.check_sec:
+                h.rate = (h.messages - h._rate_count) / elapsed
+                h._rate_at, h._rate_count = now, h.messages
+
+    def reject(self, name, raw, reason):
+        h = self._listeners.get(name)
+        if h is None: return
+        h.rejected += 1
+        sample = raw[:48] if isinstance(raw, (bytes, bytearray, str)) else repr(raw)[:48]
+        h.rejects.append((time.time(), reason, sample))
+
+    def snapshot(self, now=None):
+        now = time.monotonic() if now is None else now
+        rows = []
+        for h in list(self._listeners.values()):
+            rows.append({
+                "name": h.name, "state": h.state, "rate": h.rate, "messages": h.messages,
+                "rejected": h.rejected, "errors": h.errors, "restarts": h.restarts, "last_error": h.last_error,
+                "beat_age": None if h.last_beat is None else now - h.last_beat,
+                "msg_age": None if h.last_msg is None else now - h.last_msg,
+                "last_reject": h.rejects[-1] if h.rejects else None,
+            })
+        return rows
+
+    def rejected_samples(self, name):
+        h = self._listeners.get(name)
+        return list(h.rejects) if h else []
+
+
+def describe_health(row):
+    age = "-" if row["msg_age"] is None else f"{row['msg_age']:.0f}秒前"
+    text = f"{row['name']} {row['state']} / {row['rate']:.1f}件/s / 受信 {row['messages']} (最終 {age}) / 棄却 {row['rejected']} / 再起動 {row['restarts']}"
+    if row["last_reject"]:
+        _, reason, sample = row["last_reject"]
+        text += f" / 直近の棄却: {reason} {sample!r}"
+    return text
+
+
+# ====================================================================
+# 動作確認: python listener_supervisor.py
+#  わざと落ちる・固まるリスナーを動かし、再起動と応答なし検知を確認する
+# ====================================================================
+if __name__ == "__main__":
+    events = []
+    sup = ListenerSupervisor(lambda name, state, detail: events.append((round(time.monotonic() - t0, 2), name, state, detail)), stall_sec=0.5, check_sec=0.1)
+    t0 = time.monotonic()
+
+    def flaky(ctx):
+        for i in range(20):
+            if not ctx.running: return
+            ctx.message()
+            if i % 7 == 6: ctx.reject(b"\x00garbage", "解釈不能")
+            time.sleep(0.01)
+        raise OSError("模擬切断")
+
+    def stuck(ctx):
+        ctx.beat()
+        time.sleep(1.0)          # 受信処理が固まった状態
+
+    sup.start("flaky", flaky)
+    sup.start("stuck", stuck)
+    time.sleep(2.0)
+    sup.stop("flaky")
+    sup.stop("stuck")
+    for e in events: print(e)
+    for row in sup.snapshot(): print(describe_health(row))
@@ -0,0 +1,182 @@
+# ====================================================================
+# MGTS - NFCゲート (複数リーダー並列・読取デバウンス)
+#  * リーダー (ゲートレーン) ごとに専用ワーカースレッドで読み取る
+#  * 直近に受付されたタグIDを時間窓つきキャッシュに保持し、かざしっぱなし等の
+#    連続読取はUIへ渡す前に捨てる (UIが断った読取は記録しない)
+#  * 切断時は固定2秒待ちではなく、短い間隔から倍々に延ばして再接続する
+#  * FakeReaderBackend でハードウェアなしの負荷試験ができる
+# ====================================================================
+import random
+import threading
+import time
+
+NFC_READER_PATHS = ["usb"]     # nfcpy のデバイスパス (例: "usb:000", "usb:001")
+NFC_DEBOUNCE_SEC = 2.0         # 同一タグの再読取を無視する時間窓
+NFC_RECONNECT_MIN = 0.05
+NFC_RECONNECT_MAX = 2.0
+
+
+class DebounceCache:
+    def __init__(self, window=NFC_DEBOUNCE_SEC):
+        self.window = window
+        self._seen = {}          # tag_id -> 最終読取時刻
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def is_recent(self, tag_id, now=None):
+        # 受付済みのタグを窓の中で読んだら True (破棄する)。かざし続けている間は時刻を更新し、離して窓が過ぎるまで抑止を続ける
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now >= self._next_prune: self._prune(now)
+            last = self._seen.get(tag_id)
+            if last is None or now - last >= self.window: return False
+            self._seen[tag_id] = now
+            return True
+
+    def record(self, tag_id, now=None):
+        # 受付された読取だけを記録する (ロック中などで断られたタッチは次のタッチを抑止しない)
+        now = time.monotonic() if now is None else now
+        with self._lock: self._seen[tag_id] = now
+
+    def _prune(self, now):
+        expired = [t for t, ts in self._seen.items() if now - ts >= self.window]
+        for t in expired: del self._seen[t]
+        self._next_prune = now + self.window
+
+
+def read_tag_id(tag):
+    import ndef
+    try:
+        if tag.ndef and tag.ndef.records and isinstance(tag.ndef.records[0], ndef.TextRecord): return tag.ndef.records[0].text
+    except Exception: pass
+    return None
+
+
+# ====================================================================
+# リーダーバックエンド
+# ====================================================================
+class NfcpyBackend:
+    def open(self, path):
+        import nfc
+        return _NfcpyReader(nfc.ContactlessFrontend(path))
+
+
+class _NfcpyReader:
+    def __init__(self, clf): self.clf = clf
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.clf.close()
+
+    def run(self, on_read, should_stop):
+        def on_connect(tag):
+            tag_id = read_tag_id(tag)
+            if tag_id: on_read(tag_id)
+            return True   # タグが離れるまで待つ
+        while not should_stop():
+            # connect はタグが離れると戻る。False はリーダー側の異常
+            if not self.clf.connect(rdwr={'on-connect': on_connect}, terminate=should_stop) and not should_stop():
+                raise IOError("NFCリーダーとの通信が終了しました")
+
+
+class FakeReaderBackend:
+    # tag_ids からランダムに「タッチ」を発生させる。1タッチあたり hold_reads 回の連続読取を模擬
+    def __init__(self, tag_ids, touches_per_sec=5.0, hold_reads=4, fail_every=0, seed=None):
+        self.tag_ids = list(tag_ids)
+        self.touches_per_sec = touches_per_sec
+        self.hold_reads = hold_reads
+        self.fail_every = fail_every   # N タッチごとに切断を模擬 (0 で無効)
+        self.rng = random.Random(seed)
+
+    def open(self, path): return _FakeReader(self)
+
+
+class _FakeReader:
+    def __init__(self, backend): self.b = backend
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
+
+    def run(self, on_read, should_stop):
+        touches = 0
+        while not should_stop():
+            tag_id = self.b.rng.choice(self.b.tag_ids)
+            for _ in range(self.b.hold_reads): on_read(tag_id)
+            touches += 1
+            if self.b.fail_every and touches % self.b.fail_every == 0: raise IOError("模擬切断")
+            if self.b.touches_per_sec: time.sleep(1.0 / self.b.touches_per_sec)
+
+
+# ====================================================================
+# ゲート本体
+# ====================================================================
+class NfcGate:
+    def __init__(self, on_entry, reader_paths=NFC_READER_PATHS, debounce_sec=NFC_DEBOUNCE_SEC, backend=None, on_status=None):
+        self.on_entry = on_entry          # on_entry(tag_id, lane) -> False なら受付されなかった読取
+        self.on_status = on_status        # on_status(lane, path, connected, detail)
+        self.reader_paths = list(reader_paths)
+        self.cache = DebounceCache(debounce_sec)
+        self.backend = backend or NfcpyBackend()
+        self.stats = {"reads": 0, "dropped": 0, "accepted": 0, "rejected": 0, "reconnects": 0}
+        self._stats_lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        self._running = True
+        for lane, path in enumerate(self.reader_paths):
+            threading.Thread(target=self._worker, args=(lane, path), daemon=True).start()
+
+    def stop(self):
+        self._running = False
+
+    def _should_stop(self):
+        return not self._running
+
+    def _on_read(self, lane, tag_id):
+        dropped = self.cache.is_recent(tag_id)
+        accepted = False
+        if not dropped:
+            try: accepted = self.on_entry(tag_id, lane) is not False
+            except Exception: pass
+            if accepted: self.cache.record(tag_id)
+        with self._stats_lock:
+            self.stats["reads"] += 1
+            self.stats["dropped" if dropped else "accepted" if accepted else "rejected"] += 1
+
+    def _notify(self, lane, path, connected, detail=""):
+        if self.on_status:
+            try: self.on_status(lane, path, connected, detail)
+            except Exception: pass
+
+    def _worker(self, lane, path):
+        delay, connected = NFC_RECONNECT_MIN, None
+        while self._running:
+            try:
+                with self.backend.open(path) as reader:
+                    delay = NFC_RECONNECT_MIN
+                    if connected is not True: self._notify(lane, path, True)
+                    connected = True
+                    reader.run(lambda tag_id: self._on_read(lane, tag_id), self._should_stop)
+            except Exception as err:
+                # 状態が変わった時だけ通知する (未接続のままの再試行でログを埋めない)
+                if connected is not False: self._notify(lane, path, False, str(err))
+                connected = False
+                self.stats["reconnects"] += 1
+                time.sleep(delay)
+                delay = min(delay * 2, NFC_RECONNECT_MAX)
+
+
+# ====================================================================
+# 負荷試験: python nfc_gate.py [レーン数] [秒数]
+# ====================================================================
+if __name__ == "__main__":
+    import sys
+    lanes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    tags = [f"A{i:03d}" for i in range(1, 301)]
+    entries = []
+    gate = NfcGate(lambda tag_id, lane: entries.append((time.monotonic(), tag_id, lane)),
+                   reader_paths=[f"fake:{i}" for i in range(lanes)], debounce_sec=0.5,
+                   backend=FakeReaderBackend(tags, touches_per_sec=500, hold_reads=6, fail_every=500, seed=1))
+    gate.start()
+    time.sleep(seconds)
+    gate.stop()
+    s = gate.stats
+    print(f"レーン {lanes} / {seconds:.0f}秒: 読取 {s['reads']} ({s['reads'] / seconds:.0f}/s) 採用 {s['accepted']} 拒否 {s['rejected']} 破棄 {s['dropped']} 再接続 {s['reconnects']}")
@@ -0,0 +1,198 @@
+# ====================================================================
+# MGTS - ノード死活管理 (スタート/ゴールセンサー・シグナルボード・コントロールハブ・メイン基板)
+#  * UDP / シリアルで受けたパケットから送信元ノードを判定し、最終受信時刻・受信件数/秒・
+#    重複率 (UDPとハブ経由の二重受信など)・ジッタを記録する
+#  * 重複の判定は中身だけで行う (seq・送信時刻・ノード番号・版などの伝送用の項目は除くので、
+#    バイナリとJSONで届いた同じ RESULT も重複として数える)
+#  * 判定の順: バイナリヘッダのノード番号 -> 送信元IP (各基板の固定IP) -> メッセージ種別
+#  * ハートビート (HEARTBEAT {node, seq}) は1件 O(1) で処理し、間隔を学習して
+#    既定倍率を超えて途絶えたら「応答なし」を通知する。seq の欠番は損失として数える
+#  * 画面は check() (1秒ごと) の結果だけで描き、受信ごとの描画はしない
+# ====================================================================
+import threading
+import time
+from collections import deque
+
+from wire_protocol import NODE_MAIN, NODE_START, NODE_STOP, NODE_SIGNAL, NODE_HUB, NODE_NFC
+
+NODE_NAMES = {NODE_MAIN: "メイン", NODE_START: "スタート", NODE_STOP: "ゴール", NODE_SIGNAL: "シグナル", NODE_HUB: "ハブ", NODE_NFC: "NFC"}
+NODE_ADDRS = {"192.168.1.20": NODE_MAIN, "192.168.1.21": NODE_START, "192.168.1.22": NODE_STOP}   # 各ファームの ip_eth
+TYPE_NODES = {
+    "RESULT": NODE_MAIN, "ENTRY_ACK": NODE_MAIN, "SPLIT": NODE_MAIN,
+    "REACTION": NODE_SIGNAL, "FLYING": NODE_SIGNAL, "START": NODE_START, "STOP": NODE_STOP,
+}
+EXPECTED_NODES = (NODE_START, NODE_STOP, NODE_SIGNAL, NODE_HUB, NODE_MAIN)   # ダッシュボードに常に出すノード
+TRANSPORT_FIELDS = frozenset(("seq", "ts_us", "node", "v"))   # 経路・形式ごとに変わる項目 (重複判定に使わない)
+DUP_WINDOW = 3.0           # 同じ内容をこの秒数内に再受信したら重複
+HB_MISS_FACTOR = 3.0       # 学習したハートビート間隔の何倍途絶えたら応答なしとするか
+ONLINE, SILENT, MISSING, UNSEEN = "稼働", "無通信", "応答なし", "未受信"
+
+
+class NodeStats:
+    __slots__ = ("node", "first_seen", "last_seen", "packets", "duplicates", "jitter", "_prev_transit",
+                 "hb_count", "hb_last", "hb_interval", "hb_seq", "hb_lost", "state", "rate", "_rate_at", "_rate_count")
+
+    def __init__(self, node, now):
+        self.node = node
+        self.first_seen = self.last_seen = now
+        self.packets = self.duplicates = 0
+        self.jitter = 0.0               # RFC 3550 方式の平滑化ジッタ (秒)
+        self._prev_transit = None
+        self.hb_count, self.hb_last, self.hb_interval, self.hb_seq, self.hb_lost = 0, None, None, None, 0
+        self.state = ONLINE
+        self.rate = 0.0
+        self._rate_at, self._rate_count = now, 0
+
+
+def identify_node(msg, addr=None):
+    # バイナリ/ハートビートは自己申告のノード番号、生文字列やJSONは送信元IP・種別から推定
+    node = msg.get("node")
+    if isinstance(node, int) and node in NODE_NAMES: return node
+    if addr is not None and addr in NODE_ADDRS: return NODE_ADDRS[addr]
+    return TYPE_NODES.get(msg.get("type"))
+
+
+def packet_fingerprint(msg):
+    # 重複判定用の中身の指紋。タイム等はバイナリ (ミリ秒整数から復元) と JSON の表記揺れをそろえる
+    return tuple(sorted((k, round(v, 3) if isinstance(v, float) else (v if isinstance(v, (str, int)) or v is None else repr(v)))
+                        for k, v in msg.items() if k not in TRANSPORT_FIELDS))
+
+
+class NodeRegistry:
+    def __init__(self, expected=EXPECTED_NODES, silent_sec=60.0, on_alert=None):
+        self.expected = tuple(expected)
+        self.silent_sec = silent_sec    # ハートビートのないノードを「無通信」と表示するまでの秒数
+        self.on_alert = on_alert        # on_alert(node, 状態, 詳細): 応答なし・復帰の時だけ
+        self._nodes = {}                # node -> NodeStats
+        self._recent = {}               # 指紋 -> 受信時刻 (重複判定。別ノード・別経路から届いた同じ中身も重複)
+        self._recent_order = deque()
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------------------------
+    # 受信ごと (O(1))
+    # ----------------------------------------------------------------
+    def observe(self, node, fingerprint=None, ts_us=None, now=None):
+        if node is None: return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            st = self._nodes.get(node)
+            if st is None: st = self._nodes[node] = NodeStats(node, now)
+            st.last_seen = now
+            st.packets += 1
+            if fingerprint is not None:
+                key = fingerprint
+                seen = self._recent.get(key)
+                if seen is not None and now - seen < DUP_WINDOW: st.duplicates += 1
+                self._recent[key] = now
+                self._recent_order.append((now, key))
+                while self._recent_order and now - self._recent_order[0][0] > DUP_WINDOW:
+                    t, old = self._recent_order.popleft()
+                    if self._recent.get(old) == t: del self._recent[old]
+            if ts_us is not None:
+                # 送信元時刻つき (バイナリ) は到着遅延の揺らぎをジッタとする
+                transit = now - ts_us / 1e6
+                if st._prev_transit is not None: st.jitter += (abs(transit - st._prev_transit) - st.jitter) / 16.0
+                st._prev_transit = transit
+        return st
+
+    def heartbeat(self, node, seq=None, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            st = self._nodes.get(node)
+            if st is None: st = self._nodes[node] = NodeStats(node, now)
+            st.last_seen = now
+            st.packets += 1
+            if seq is not None and st.hb_seq is not None:
+                if seq == st.hb_seq:
+                    st.duplicates += 1   # 有線と無線の両経路で届いた同じハートビート
+                    return st
+                if seq > st.hb_seq + 1: st.hb_lost += seq - st.hb_seq - 1
+            if st.hb_last is not None:
+                interval = now - st.hb_last
+                if st.hb_interval is None: st.hb_interval = interval
+                elif interval <= st.hb_interval * HB_MISS_FACTOR:   # 途絶明けの1回は間隔の学習に使わない
+                    st.jitter += (abs(interval - st.hb_interval) - st.jitter) / 16.0
+                    st.hb_interval += (interval - st.hb_interval) / 8.0
+            st.hb_last = now
+            st.hb_seq = seq
+            st.hb_count += 1
+        return st
+
+    # ----------------------------------------------------------------
+    # 定期確認 (1秒ごと)
+    # ----------------------------------------------------------------
+    def check(self, now=None):
+        now = time.monotonic() if now is None else now
+        alerts = []
+        with self._lock:
+            for st in self._nodes.values():
+                elapsed = now - st._rate_at
+                if elapsed >= 1.0:
+                    st.rate = (st.packets - st._rate_count) / elapsed
+                    st._rate_at, st._rate_count = now, st.packets
+                age = now - st.last_seen
+                if st.hb_interval: state = MISSING if now - st.hb_last > max(st.hb_interval * HB_MISS_FACTOR, 1.0) else ONLINE
+                else: state = SILENT if age > self.silent_sec else ONLINE
+                if state != st.state:
+                    if state == MISSING: alerts.append((st.node, state, f"ハートビートが {now - st.hb_last:.0f}秒途絶 (間隔 {st.hb_interval:.1f}秒)"))
+                    elif st.state == MISSING: alerts.append((st.node, state, "復帰"))
+                    st.state = state
+        if self.on_alert:
+            for alert in alerts:
+                try: self.on_alert(*alert)
+                except Exception: pass
+        return alerts
+
+    def snapshot(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            rows = [{
+                "node": st.node, "name": NODE_NAMES.get(st.node, str(st.node)), "state": st.state,
+                "age": now - st.last_seen, "rate": st.rate, "packets": st.packets,
+                "dup_ratio": st.duplicates / st.packets if st.packets else 0.0, "jitter_ms": st.jitter * 1000,
+                "hb_interval": st.hb_interval, "hb_lost": st.hb_lost,
+            } for st in self._nodes.values()]
+        seen = {r["node"] for r in rows}
+        rows += [{"node": n, "name": NODE_NAMES[n], "state": UNSEEN, "age": None, "rate": 0.0, "packets": 0,
+                  "dup_ratio": 0.0, "jitter_ms": 0.0, "hb_interval": None, "hb_lost": 0} for n in self.expected if n not in seen]
+        order = {n: i for i, n in enumerate(self.expected)}
+        return sorted(rows, key=lambda r: (order.get(r["node"], len(order)), r["node"]))
+
+
+def describe_node(row):
+    # ダッシュボードの状態表示用 (秒単位の変化では文字列が変わらないように丸める)
+    age = row["age"]
+    if age is None: return f"{row['name']} {row['state']}"
+    seen = "" if age < 10 else (f" {int(age // 10) * 10}秒前" if age < 60 else f" {int(age // 60)}分前")
+    extra = f" 重複{row['dup_ratio'] * 100:.0f}%" if row["dup_ratio"] >= 0.05 else ""
+    if row["hb_lost"]: extra += f" 欠{row['hb_lost']}"
+    return f"{row['name']} {row['state']}{seen}{extra}"
+
+
+# ====================================================================
+# 動作確認: python node_registry.py [ハートビート件数]
+# ====================================================================
+if __name__ == "__main__":
+    import random
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(1)
+    alerts = []
+    reg = NodeRegistry(on_alert=lambda node, state, detail: alerts.append((NODE_NAMES[node], state, detail)))
+    t, seq = 0.0, 0
+    t0 = time.perf_counter()
+    for i in range(n):
+        t += rng.gauss(1.0, 0.02)
+        seq += 1 if rng.random() > 0.01 else 2
+        reg.heartbeat(NODE_START, seq, now=t)
+        if rng.random() < 0.3: reg.heartbeat(NODE_START, seq, now=t + 0.002)   # 二重経路
+    per_hb = (time.perf_counter() - t0) / n * 1e6
+    reg.check(now=t + 0.5)
+    reg.check(now=t + 5.0)
+    reg.heartbeat(NODE_START, seq + 1, now=t + 6.0)
+    reg.check(now=t + 6.1)
+    row = reg.snapshot(now=t + 6.1)[0]
+    print(f"ハートビート {n}件: {per_hb:.2f}µs/件 / 間隔 {row['hb_interval']:.3f}s / ジッタ {row['jitter_ms']:.1f}ms / 重複率 {row['dup_ratio']:.2f} / 欠番 {row['hb_lost']}")
+    for a in alerts: print("  通知:", a)
+    print(" ", describe_node(row))
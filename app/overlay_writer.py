@@ -0,0 +1,154 @@
+# ====================================================================
+# MGTS - 配信オーバーレイ出力 (OBS / 放送グラフィック用)
+#  * 最終ゴール選手・クラス別上位N名・コース上の選手を小さなテキスト/JSONへ書き出す
+#  * 一時ファイルへ書いてから os.replace で差し替える (OBS側が半端な内容を読まない)
+#  * 連続更新は min_interval で間引き、内容が変わらないファイルは書き込まない
+#  * 書き込みはタイマー・呼び出し元のどちらからでも1本ずつ (古い内容で新しいファイルを上書きしない)
+#  * いなくなったクラスの top_<クラス>.txt は削除する
+# ====================================================================
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+OVERLAY_DIR = "mgts_overlay"
+OVERLAY_TOP_N = 5
+OVERLAY_MIN_INTERVAL = 0.5   # 書き込み最小間隔 (秒)
+
+
+def _safe_name(text):
+    # クラス名をファイル名に使える形へ (日本語はそのまま残す)
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", str(text)) or "_"
+
+
+def _rider_line(r):
+    time_display = "MC" if r.get("is_mc") else r.get("time_str", "-")
+    return f"No.{r['bib']} {r['name']} {time_display}"
+
+
+def build_overlay_snapshot(results_log, active_runners, rider_database, top_n=OVERLAY_TOP_N):
+    # update_result_table と同じステートから配信用の最小データを組み立てる
+    last = results_log[-1] if results_log else None
+    last_finisher = None
+    if last:
+        last_finisher = {
+            "bib": last["bib"], "name": last["name"], "class": last["class"],
+            "time": "MC" if last.get("is_mc") else last["time_str"],
+            "penalty": last.get("penalty_text", ""),
+            "overall_rank": last.get("overall_rank", "-"), "class_rank": last.get("class_rank", "-"),
+            "top_ratio": last.get("top_ratio", "-"), "class_ratio": last.get("class_ratio", "-"),
+        }
+
+    # 並びと順位は採点結果 (sort_key / overall_rank / class_rank) に従う (result_report.build_sections と同じ)
+    ranked = sorted((r for r in results_log if r.get("is_best") and isinstance(r.get("overall_rank"), int)),
+                    key=lambda r: (r["sort_key"], str(r["bib"])))
+    tops = {"総合": ranked[:top_n]}
+    for r in ranked:
+        c_list = tops.setdefault(r["class"], [])
+        if len(c_list) < top_n: c_list.append(r)
+
+    on_course = []
+    for tid in active_runners:
+        info = rider_database.get(tid, {"bib": "?", "name": "不明", "class": "-"})
+        on_course.append({"bib": info.get("bib", "?"), "name": info.get("name", "不明"), "class": info.get("class", "-")})
+
+    return {
+        "last_finisher": last_finisher,
+        "top": {c: [{"rank": r["overall_rank"] if c == "総合" else r["class_rank"], "bib": r["bib"], "name": r["name"],
+                     "time": r.get("score_str", r["time_str"])} for r in lst] for c, lst in tops.items()},
+        "on_course": on_course,
+    }
+
+
+def render_overlay_files(snapshot):
+    # スナップショット -> {ファイル名: バイト列}
+    files = {"overlay.json": json.dumps(snapshot, ensure_ascii=False, indent=1).encode("utf-8")}
+
+    last = snapshot["last_finisher"]
+    files["last_finisher.txt"] = (f"No.{last['bib']} {last['name']}  {last['time']}" if last else "").encode("utf-8")
+    files["on_course.txt"] = "\n".join(f"No.{r['bib']} {r['name']}" for r in snapshot["on_course"]).encode("utf-8")
+    for c, lst in snapshot["top"].items():
+        lines = [f"{r['rank']}. No.{r['bib']} {r['name']} {r['time']}" for r in lst]
+        files[f"top_{_safe_name(c)}.txt"] = "\n".join(lines).encode("utf-8")
+    return files
+
+
+class OverlayWriter:
+    def __init__(self, out_dir=OVERLAY_DIR, top_n=OVERLAY_TOP_N, min_interval=OVERLAY_MIN_INTERVAL):
+        self.out_dir = out_dir
+        self.top_n = top_n
+        self.min_interval = min_interval
+        self.write_count = 0         # 実際にディスクへ書いたファイル数
+        self.skip_count = 0          # 内容不変でスキップしたファイル数
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # 取り出しから書き込み完了までを1本にする
+        self._pending = None
+        self._timer = None
+        self._last_flush = 0.0
+        self._written = {}           # ファイル名 -> 最後に書いた内容
+        os.makedirs(out_dir, exist_ok=True)
+
+    def publish(self, results_log, active_runners, rider_database):
+        # スナップショットは呼び出し元スレッドで作成 (ステートの一貫性を保つ)
+        snapshot = build_overlay_snapshot(results_log, active_runners, rider_database, self.top_n)
+        with self._lock:
+            self._pending = snapshot
+            if self._timer is not None: return   # 後続の遅延書き込みに合流
+            wait = self.min_interval - (time.monotonic() - self._last_flush)
+            if wait > 0:
+                self._timer = threading.Timer(wait, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self.flush()
+
+    def _flush_from_timer(self):
+        with self._lock: self._timer = None
+        self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+                self._last_flush = time.monotonic()
+            if snapshot is None: return
+
+            files = render_overlay_files(snapshot)
+            for name, data in files.items():
+                if self._written.get(name) == data:
+                    self.skip_count += 1
+                    continue
+                if self._atomic_write(name, data):
+                    self._written[name] = data
+                    self.write_count += 1
+            self._remove_stale(files)
+
+    def _remove_stale(self, files):
+        # 前回起動時の分も含め、今のスナップショットに無いクラスの上位ファイルを消す
+        try: names = os.listdir(self.out_dir)
+        except OSError: return
+        for name in names:
+            if name.startswith("top_") and name.endswith(".txt") and name not in files:
+                try: os.remove(os.path.join(self.out_dir, name))
+                except OSError: continue   # OBS側が掴んでいる等 -> 次回再試行
+                self._written.pop(name, None)
+
+    def _atomic_write(self, name, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.out_dir, prefix=".tmp_", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f: f.write(data)
+            os.replace(tmp_path, os.path.join(self.out_dir, name))
+            return True
+        except OSError:
+            # OBS側がファイルを掴んでいる等 -> キャッシュを更新せず次回再試行
+            try: os.remove(tmp_path)
+            except OSError: pass
+            return False
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None: self._timer.cancel()
+            self._timer = None
+        self.flush()
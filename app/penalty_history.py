@@ -0,0 +1,139 @@
+# ====================================================================
+# MGTS - ペナルティ編集履歴 (イベントソーシング)
+#  * ペナルティ加算 / MC / リセットを不変の編集イベントとして走行ごとに積み上げる
+#  * 現在値 (penalty / penalty_text / is_mc / time_float / time_str) は持たない。
+#    採点ルール (scoring_rules.Scorer) が events_for() のイベント列から求める
+#  * 走行ごとに多段アンドゥ・リドゥと監査ログ (誰が・いつ・何を) を保持する
+# ====================================================================
+import itertools
+import socket
+import time
+import uuid
+from collections import namedtuple
+
+# kind: "PENALTY" (seconds 加算) / "MC" / "RESET"
+# event_id: 全PCで一意 (取消・やり直しはこのIDで対象のイベントを特定する)
+EditEvent = namedtuple("EditEvent", ["run_id", "kind", "seconds", "label", "operator", "timestamp", "event_id"], defaults=(None,))
+AuditEntry = namedtuple("AuditEntry", ["action", "event", "operator", "timestamp"])
+
+DEFAULT_OPERATOR = socket.gethostname()
+ID_PREFIX = f"{DEFAULT_OPERATOR}-{uuid.uuid4().hex[:6]}"   # 起動ごとに一意 (同じPCの再起動とも重ならない)
+_run_seq = itertools.count(1)
+_event_seq = itertools.count(1)
+
+
+def make_run_id():
+    # 走行ごとに一意 (同じゼッケン・同じタイムの走行や未登録タグの走行も区別する)
+    return f"{ID_PREFIX}-r{next(_run_seq)}"
+
+
+def make_event_id():
+    return f"{ID_PREFIX}-e{next(_event_seq)}"
+
+
+def _same_event(a, b):
+    # event_id のない古い監査ログは内容全体で照合する
+    return a.event_id == b.event_id if a.event_id or b.event_id else a == b
+
+
+class RunHistory:
+    def __init__(self, run_id, base_time):
+        self.run_id = run_id
+        self.base_time = base_time
+        self.events = []     # 現在有効なイベント
+        self.redo_stack = []
+        self.audit = []      # 監査ログ (追記のみ)
+
+    def _touch(self, action, event, operator, timestamp=None):
+        entry = AuditEntry(action, event, operator, timestamp or time.time())
+        self.audit.append(entry)
+        return entry
+
+
+class PenaltyHistory:
+    def __init__(self):
+        self.runs = {}   # run_id -> RunHistory
+
+    def register_run(self, record):
+        # 他PCから同期した走行は発行元の run_id をそのまま使う
+        run_id = record.get("run_id") or make_run_id()
+        record["run_id"] = run_id
+        if run_id not in self.runs: self.runs[run_id] = RunHistory(run_id, record["base_time"])
+        return run_id
+
+    def _history_for(self, record):
+        return self.runs[self.register_run(record)]
+
+    def apply(self, record, kind, seconds=0, label="", operator=DEFAULT_OPERATOR):
+        h = self._history_for(record)
+        ev = EditEvent(h.run_id, kind, seconds, label, operator, time.time(), make_event_id())
+        h.events.append(ev)
+        h.redo_stack.clear()
+        return h._touch("APPLY", ev, operator)
+
+    def undo(self, record, operator=DEFAULT_OPERATOR):
+        h = self._history_for(record)
+        if not h.events: return None
+        ev = h.events.pop()
+        h.redo_stack.append(ev)
+        return h._touch("UNDO", ev, operator)
+
+    def redo(self, record, operator=DEFAULT_OPERATOR):
+        h = self._history_for(record)
+        if not h.redo_stack: return None
+        ev = h.redo_stack.pop()
+        h.events.append(ev)
+        return h._touch("REDO", ev, operator)
+
+    def rebuild(self, record, entries):
+        # 監査ログ (並び順確定済み) から走行1件分の状態を再構築する (他PCからの同期用)
+        h = self._history_for(record)
+        # 取消・やり直しは末尾ではなく、監査ログに記録されたそのイベントに対して行う
+        # (複数PCの編集が混ざると、取消したPCの末尾と全体の末尾が一致しないため)
+        h.events, h.redo_stack, h.audit = [], [], []
+        for entry in entries:
+            ev = entry.event
+            if entry.action == "APPLY":
+                h.events.append(ev)
+                h.redo_stack.clear()
+            elif entry.action == "UNDO":
+                i = next((i for i, e in enumerate(h.events) if _same_event(e, ev)), None)
+                if i is None: continue
+                h.redo_stack.append(h.events.pop(i))
+            elif entry.action == "REDO":
+                i = next((i for i, e in enumerate(h.redo_stack) if _same_event(e, ev)), None)
+                if i is None: continue
+                h.events.append(h.redo_stack.pop(i))
+            h._touch(entry.action, ev, entry.operator, entry.timestamp)
+
+    def can_undo(self, record):
+        h = self.runs.get(record.get("run_id"))
+        return bool(h and h.events)
+
+    def can_redo(self, record):
+        h = self.runs.get(record.get("run_id"))
+        return bool(h and h.redo_stack)
+
+    def events_for(self, record):
+        # 現在有効な編集イベント (採点ルールはここから走行の派生値を求める)
+        h = self.runs.get(record.get("run_id"))
+        return h.events if h else ()
+
+    def audit_trail(self, record):
+        h = self.runs.get(record.get("run_id"))
+        return list(h.audit) if h else []
+
+
+def audit_to_dict(entry):
+    return {"action": entry.action, "event": list(entry.event), "operator": entry.operator, "timestamp": entry.timestamp}
+
+
+def audit_from_dict(d):
+    return AuditEntry(d["action"], EditEvent(*d["event"]), d["operator"], d["timestamp"])
+
+
+def describe_audit(entry):
+    ev = entry.event
+    what = "MC" if ev.kind == "MC" else ("リセット" if ev.kind == "RESET" else f"+{ev.seconds}秒 [{ev.label}]")
+    action = {"APPLY": "適用", "UNDO": "取消", "REDO": "やり直し"}.get(entry.action, entry.action)
+    return f"{time.strftime('%H:%M:%S', time.localtime(entry.timestamp))} {action}: {what} ({entry.operator})"
@@ -0,0 +1,106 @@
+# ====================================================================
+# MGTS - 自己ベスト / クラスレコード / 大会レコード のインデックス
+#  * 過去の記録 (シーズンアーカイブ / mgts_past_results/ に置いたリザルトCSV) で起動時に初期化し、
+#    ゴールごとの判定は辞書引き1回ずつ (O(1)) で行う
+#  * 新記録は走行レコードの record_flags に入れ、読み上げ・リザルト表の強調に使う
+#  * ペナルティ修正で記録が変わった時は rebuild() で当日分だけを数え直す
+#  * 記録はクラス係数 (ハンデ)・タイム上限をかける前の実タイム (ベース+ペナルティ) で比べる
+#  * 自己ベストは rider_key (ゼッケン+名前) ごと。ゼッケンを使い回した別人の記録とは比べない
+# ====================================================================
+import os
+import threading
+
+from roster import rider_key
+from season_archive import results_from_csv, DNF_TIME
+
+EVENT_RECORD, CLASS_RECORD, PERSONAL_BEST = "ER", "CR", "PB"
+FLAG_ORDER = (EVENT_RECORD, CLASS_RECORD, PERSONAL_BEST)
+PAST_RESULTS_DIR = "mgts_past_results"   # アーカイブに取り込んでいない過去大会のリザルトCSV置き場
+FLAG_LABELS = {EVENT_RECORD: "大会レコード", CLASS_RECORD: "クラスレコード", PERSONAL_BEST: "自己ベスト"}
+
+
+def valid_time(r):
+    # MC / DNF (採点ルールでDNF扱いになった走行を含む) は記録の対象外
+    if r.get("is_mc") or r.get("is_dnf") or r.get("base_time") is None or float(r["base_time"]) >= DNF_TIME: return None
+    return round(float(r["base_time"]) + float(r.get("penalty") or 0), 3)   # クラス係数・上限をかける前の実タイム
+
+
+class RecordIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 過去大会の記録 (seed_* で設定、当日の走行では変えない)
+        self.seed_pb = {}          # rider_key -> time
+        self.seed_class = {}       # class -> time
+        self.seed_overall = None
+        # 当日を含めた現在の記録
+        self.pb = {}
+        self.class_best = {}
+        self.overall = None
+
+    # ----------------------------------------------------------------
+    # 初期化
+    # ----------------------------------------------------------------
+    def _merge_seed(self, pbs, classes):
+        with self._lock:
+            for key, t in pbs.items():
+                if key not in self.seed_pb or t < self.seed_pb[key]: self.seed_pb[key] = t
+                if key not in self.pb or t < self.pb[key]: self.pb[key] = t
+            for c, t in classes.items():
+                if c not in self.seed_class or t < self.seed_class[c]: self.seed_class[c] = t
+                if c not in self.class_best or t < self.class_best[c]: self.class_best[c] = t
+            for t in classes.values():
+                if self.seed_overall is None or t < self.seed_overall: self.seed_overall = t
+                if self.overall is None or t < self.overall: self.overall = t
+
+    def seed_from_archive(self, archive):
+        self._merge_seed(archive.best_by_rider(), archive.best_by_class())
+
+    def seed_from_records(self, records):
+        pbs, classes = {}, {}
+        for r in records:
+            t = valid_time(r)
+            if t is None: continue
+            key = rider_key(r["bib"], r.get("name"))
+            if key not in pbs or t < pbs[key]: pbs[key] = t
+            if r["class"] not in classes or t < classes[r["class"]]: classes[r["class"]] = t
+        self._merge_seed(pbs, classes)
+
+    def seed_from_csv(self, paths):
+        for path in paths: self.seed_from_records(results_from_csv(path))
+        return len(paths)
+
+    def seed_from_csv_dir(self, directory=PAST_RESULTS_DIR):
+        if not os.path.isdir(directory): return 0
+        return self.seed_from_csv(sorted(os.path.join(directory, n) for n in os.listdir(directory) if n.lower().endswith(".csv")))
+
+    # ----------------------------------------------------------------
+    # 判定
+    # ----------------------------------------------------------------
+    def _check(self, r):
+        # 呼び出し側でロック済み。新記録のフラグを返し、インデックスを更新する
+        t = valid_time(r)
+        if t is None: return ()
+        key, c = rider_key(r["bib"], r.get("name")), r["class"]
+        flags = []
+        if self.overall is not None and t < self.overall: flags.append(EVENT_RECORD)
+        if c in self.class_best and t < self.class_best[c]: flags.append(CLASS_RECORD)
+        if key in self.pb and t < self.pb[key]: flags.append(PERSONAL_BEST)   # 初出走は自己ベスト扱いにしない
+        if self.overall is None or t < self.overall: self.overall = t
+        if c not in self.class_best or t < self.class_best[c]: self.class_best[c] = t
+        if key not in self.pb or t < self.pb[key]: self.pb[key] = t
+        return tuple(flags)
+
+    def update(self, record):
+        with self._lock: flags = self._check(record)
+        record["record_flags"] = flags
+        return flags
+
+    def rebuild(self, results_log):
+        # 過去大会の記録から当日分を走行順に数え直す (ペナルティ修正・取消時)
+        with self._lock:
+            self.pb, self.class_best, self.overall = dict(self.seed_pb), dict(self.seed_class), self.seed_overall
+            for r in results_log: r["record_flags"] = self._check(r)
+
+
+def describe_flags(flags):
+    return " / ".join(FLAG_LABELS[f] for f in FLAG_ORDER if f in flags)
@@ -0,0 +1,256 @@
+# ====================================================================
+# MGTS - 計測PC間 リザルト同期 (LAN / UDPマルチキャスト)
+#  * 操作 (走行追加 RUN / ペナルティ編集 EDIT / 名簿 ROSTER) を「オペレーション」として
+#    (origin, seq) で一意に識別し、全ステーションへ配信する
+#  * 各ステーションはオリジン別の連続受信済み seq をベクタークロックとして保持し、
+#    定期ハートビートで差分 (delta) を要求・補完する
+#  * 競合解決: ROSTER は (lamport, origin) の後勝ち、EDIT は走行ごとに (lamport, origin)
+#    順で並べ直して全PCで同じ順序に再生する、RUN は run_id で冪等
+#    (同じゴールを2台が別IDで記録した場合は、受け手側で別名としてまとめる)
+#  * 途中参加のPCには、圧縮したスナップショット + 以降の差分で追いつかせる
+# ====================================================================
+import json
+import socket
+import struct
+import threading
+import time
+from bisect import insort
+
+REPLICATION_GROUP = "239.255.50.5"
+REPLICATION_PORT = 5010
+HEARTBEAT_SEC = 2.0
+SNAPSHOT_MIN_OPS = 200     # 相手が空でこれ以上の差があればスナップショットで送る
+MAX_DATAGRAM = 60000
+LWW_KINDS = ("ROSTER",)    # キー単位で後勝ちにする種別
+
+
+def _op_order(op):
+    return (op["lamport"], op["origin"], op["seq"])
+
+
+class ReplicationNode:
+    # peers を指定するとマルチキャストの代わりにユニキャストで送る (ループバック試験用)
+    def __init__(self, station_id, on_op, group=REPLICATION_GROUP, port=REPLICATION_PORT, peers=None, bind_ip="0.0.0.0"):
+        self.station_id = station_id
+        self.on_op = on_op            # 新しく採用されたオペレーションごとに呼ばれる
+        self.group, self.port, self.peers = group, port, peers
+        self.lamport = 0
+        self.seq = 0
+        self.vc = {}                  # origin -> 連続受信済みの最大 seq
+        self.ahead = {}               # origin -> vc より先に届いた seq の集合
+        self.ops = {}                 # (origin, seq) -> op
+        self.by_key = {}              # (kind, key) -> (lamport, origin, seq) 順の op リスト
+        self.snap_parts = {}          # 受信中スナップショット: snap_id -> {part: ops}
+        self.stats = {"sent": 0, "recv": 0, "applied": 0, "snapshots": 0}
+        self._lock = threading.RLock()
+        self._running = False
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((bind_ip, port))
+        self.sock.settimeout(0.5)
+        if not peers:
+            mreq = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton("0.0.0.0"))
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+    # ----------------------------------------------------------------
+    # 起動・停止
+    # ----------------------------------------------------------------
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._recv_loop, daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+        self._send({"msg": "HB", "vc": dict(self.vc)})
+
+    def stop(self):
+        self._running = False
+        try: self.sock.close()
+        except OSError: pass
+
+    # ----------------------------------------------------------------
+    # ローカル操作の発行
+    # ----------------------------------------------------------------
+    def publish(self, kind, key, data):
+        with self._lock:
+            self.seq += 1
+            self.lamport += 1
+            op = {"origin": self.station_id, "seq": self.seq, "lamport": self.lamport, "kind": kind, "key": key, "data": data}
+            self._store(op)
+        self._send_ops([op])
+        return op
+
+    def ops_for(self, kind, key, *aliases):
+        # 全PCで同一になる順序 (lamport, origin) で返す。別名のキーがあれば合わせて並べる
+        with self._lock:
+            if not aliases: return list(self.by_key.get((kind, key), []))
+            return sorted((op for k in (key,) + aliases for op in self.by_key.get((kind, k), [])), key=_op_order)
+
+    # ----------------------------------------------------------------
+    # 内部: 保存・採用
+    # ----------------------------------------------------------------
+    def _store(self, op):
+        # 新規なら True。LWW種別で負けた op は保存だけして採用しない
+        ident = (op["origin"], op["seq"])
+        if ident in self.ops: return False
+        self.ops[ident] = op
+        self.lamport = max(self.lamport, op["lamport"])
+        self._advance_vc(op["origin"], op["seq"])
+
+        lst = self.by_key.setdefault((op["kind"], op["key"]), [])
+        if op["kind"] in LWW_KINDS:
+            if lst and _op_order(lst[-1]) > _op_order(op): return False
+            lst[:] = [op]
+            return True
+        insort(lst, op, key=_op_order)
+        return True
+
+    def _advance_vc(self, origin, seq):
+        cur = self.vc.get(origin, 0)
+        if seq <= cur: return
+        pending = self.ahead.setdefault(origin, set())
+        pending.add(seq)
+        while cur + 1 in pending:
+            cur += 1
+            pending.discard(cur)
+        self.vc[origin] = cur
+
+    def _ingest(self, ops):
+        adopted = []
+        with self._lock:
+            for op in ops:
+                if self._store(op): adopted.append(op)
+        for op in adopted:
+            self.stats["applied"] += 1
+            try: self.on_op(op)
+            except Exception: pass
+        return adopted
+
+    def _missing_for(self, remote_vc):
+        with self._lock:
+            return [op for (origin, seq), op in self.ops.items() if seq > remote_vc.get(origin, 0)]
+
+    def _compacted_snapshot(self):
+        # 後勝ちキーは勝者のみ、それ以外は全件 (EDITは再生順が必要なため圧縮しない)
+        with self._lock:
+            ops = [op for lst in self.by_key.values() for op in lst]
+            return sorted(ops, key=_op_order), dict(self.vc)
+
+    # ----------------------------------------------------------------
+    # 内部: 送受信
+    # ----------------------------------------------------------------
+    def _send(self, msg):
+        msg["from"] = self.station_id
+        data = json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        targets = self.peers or [(self.group, self.port)]
+        for addr in targets:
+            try:
+                self.sock.sendto(data, addr)
+                self.stats["sent"] += 1
+            except OSError: pass
+
+    def _chunks(self, ops):
+        chunk, size = [], 0
+        for op in ops:
+            n = len(json.dumps(op, ensure_ascii=False)) + 1
+            if chunk and size + n > MAX_DATAGRAM - 512:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(op)
+            size += n
+        if chunk: yield chunk
+
+    def _send_ops(self, ops, to=None):
+        for chunk in self._chunks(ops): self._send({"msg": "OPS", "ops": chunk, "to": to})
+
+    def _send_snapshot(self, to):
+        ops, vc = self._compacted_snapshot()
+        chunks = list(self._chunks(ops)) or [[]]
+        snap_id = f"{self.station_id}:{time.monotonic():.3f}"
+        for i, chunk in enumerate(chunks):
+            self._send({"msg": "SNAP", "to": to, "snap_id": snap_id, "part": i, "total": len(chunks), "vc": vc, "ops": chunk})
+        self.stats["snapshots"] += 1
+
+    def _handle(self, msg):
+        sender = msg.get("from")
+        if sender == self.station_id: return
+        to = msg.get("to")
+        if to and to != self.station_id: return
+        kind = msg.get("msg")
+
+        if kind == "OPS":
+            self._ingest(msg.get("ops", []))
+        elif kind == "HB":
+            remote_vc = msg.get("vc", {})
+            missing = self._missing_for(remote_vc)
+            if missing:
+                if not remote_vc and len(missing) >= SNAPSHOT_MIN_OPS: self._send_snapshot(sender)
+                else: self._send_ops(sorted(missing, key=_op_order), to=sender)
+            with self._lock:
+                behind = any(seq > self.vc.get(origin, 0) for origin, seq in remote_vc.items())
+            if behind: self._send({"msg": "HB", "vc": dict(self.vc), "to": sender})
+        elif kind == "SNAP":
+            self._ingest(msg.get("ops", []))
+            parts = self.snap_parts.setdefault(msg["snap_id"], set())
+            parts.add(msg["part"])
+            if len(parts) == msg["total"]:
+                # 全パート受信後にのみクロックを進める (圧縮で省かれた op を既知扱いにする)
+                with self._lock:
+                    for origin, seq in msg.get("vc", {}).items():
+                        if seq > self.vc.get(origin, 0): self.vc[origin] = seq
+                self.snap_parts.pop(msg["snap_id"], None)
+
+    def _recv_loop(self):
+        while self._running:
+            try:
+                data, _ = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.stats["recv"] += 1
+            try:
+                self._handle(json.loads(data.decode("utf-8")))
+            except (ValueError, KeyError, TypeError):
+                continue
+
+    def _heartbeat_loop(self):
+        while self._running:
+            time.sleep(HEARTBEAT_SEC)
+            with self._lock: vc = dict(self.vc)
+            self._send({"msg": "HB", "vc": vc})
+
+
+# ====================================================================
+# ループバック動作確認: python replication.py
+#  3台を 127.0.0.1 上で起動し、途中参加の1台がスナップショット + 差分で収束するか確認する
+# ====================================================================
+if __name__ == "__main__":
+    base = 15010
+    addrs = [("127.0.0.1", base + i) for i in range(3)]
+    states = [dict() for _ in addrs]
+
+    def make(i):
+        def on_op(op): states[i][(op["kind"], op["key"], op["origin"], op["seq"])] = op["data"]
+        peers = [a for j, a in enumerate(addrs) if j != i]
+        return ReplicationNode(f"PC{i}", on_op, port=addrs[i][1], peers=peers, bind_ip="127.0.0.1")
+
+    a, b = make(0), make(1)
+    for n in (a, b): n.start()
+    for k in range(300):
+        a.publish("ROSTER", f"A{k:03d}", {"bib": str(k)})
+    b.publish("RUN", "1@30.000", {"bib": "1", "base_time": 30.0})
+    b.publish("EDIT", "1@30.000", {"action": "APPLY"})
+    a.publish("EDIT", "1@30.000", {"action": "UNDO"})
+    time.sleep(1.0)
+
+    c = make(2)
+    c.start()
+    deadline = time.time() + 3 * HEARTBEAT_SEC
+    while time.time() < deadline and not (a.vc == b.vc == c.vc and len(c.by_key) == len(a.by_key)): time.sleep(0.1)
+
+    ok = a.vc == b.vc == c.vc and a.ops_for("EDIT", "1@30.000") == c.ops_for("EDIT", "1@30.000")
+    print(f"vc A={a.vc} B={b.vc} C={c.vc} snapshots={a.stats['snapshots'] + b.stats['snapshots']}")
+    print("✅ 収束しました" if ok else "❌ 収束しませんでした")
+    for n in (a, b, c): n.stop()
@@ -0,0 +1,191 @@
+# ====================================================================
+# MGTS - リザルト表の並べ替え・絞り込み (表示するページ分だけ描画するためのモデル)
+#  * 列ごとの並び順 (ソート済みの行番号リスト) をキャッシュし、昇順/降順の切替や
+#    同じ列での再表示はソートし直さない
+#  * 絞り込み用に索引を持つ: クラス別・ベスト走行・フラグ (FLYING / MC / ペナルティ / DNF / 記録)
+#    の行番号集合と、名前・ゼッケンの2文字索引 (部分一致検索)
+#  * 名前・ゼッケン・クラスは走行追加時に差分で索引へ入れる。採点で変わる値 (順位・比率・
+#    ペナルティ・フラグ) は再採点のたびに無効化し、次に使う時に1回だけ作り直す
+#  * sync (受信スレッド) と query / page (画面スレッド) は同じロックで1本ずつ
+# ====================================================================
+import bisect
+import threading
+
+INF = float("inf")
+OVERALL, HISTORY = "総合", "全履歴"
+
+FILTER_FLAGS = {
+    "FLYING": lambda r: "FLYING" in r.get("memo_text", ""),
+    "MC": lambda r: bool(r.get("is_mc")),
+    "ペナルティ": lambda r: r.get("penalty", 0) > 0,
+    "DNF": lambda r: bool(r.get("is_dnf")),
+    "記録": lambda r: bool(r.get("record_flags")),
+}
+
+
+def _ratio(text):
+    return float(text[:-1]) if text and text != "-" else INF
+
+
+def _bib_key(bib):
+    bib = str(bib)
+    return (int(bib), bib) if bib.isdigit() else (INF, bib)
+
+
+# 列 -> (並べ替えキー, 走行追加で変わらない列か)
+SORT_KEYS = {
+    "order":       (None, True),    # 走行順 (行番号そのもの)
+    "rank":        (lambda r: (r.get("sort_key", (0, INF)), r["time_float"]), False),
+    "class":       (lambda r: r["class"], True),
+    "bib":         (lambda r: _bib_key(r["bib"]), True),
+    "name":        (lambda r: r["name"], True),
+    "time":        (lambda r: r["time_float"], False),
+    "top_ratio":   (lambda r: _ratio(r.get("top_ratio")), False),
+    "class_ratio": (lambda r: _ratio(r.get("class_ratio")), False),
+    "penalty":     (lambda r: r.get("penalty", 0), False),
+    "memo":        (lambda r: r.get("memo_text", ""), False),
+}
+
+
+def _grams(text):
+    text = str(text).lower()
+    return {text[i:i + 2] for i in range(len(text) - 1)} | set(text)
+
+
+class ResultGrid:
+    def __init__(self):
+        self.records = []
+        self._search = []            # 行番号 -> 検索対象文字列 (小文字)
+        self._grams = {}             # 2文字 (と1文字) -> 行番号集合
+        self._by_class = {}          # クラス -> 行番号集合
+        self._orders = {}            # 列 -> ソート済みの行番号 (変わらない列は [(キー, 行番号)] で差分挿入)
+        self._best = None            # ベスト走行の行番号集合 (再採点で無効化)
+        self._flags = {}             # フラグ名 -> 行番号集合 (再採点で無効化)
+        self.version = 0
+        self._cache = None           # (条件, version, 結果)
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------------------------
+    # データ更新
+    # ----------------------------------------------------------------
+    def sync(self, results_log):
+        # 追加分だけ索引へ入れ、採点で変わる索引は無効化する (再採点のたびに呼ぶ)
+        with self._lock:
+            for i in range(len(self.records), len(results_log)):
+                r = results_log[i]
+                self.records.append(r)
+                text = f"{r['bib']} {r['name']}".lower()
+                self._search.append(text)
+                for g in _grams(text): self._grams.setdefault(g, set()).add(i)
+                self._by_class.setdefault(r["class"], set()).add(i)
+                for col, (key, stable) in SORT_KEYS.items():
+                    order = self._orders.get(col)
+                    if stable and key is not None and order is not None: bisect.insort(order, (key(r), i))
+            for col in [c for c, (_, stable) in SORT_KEYS.items() if not stable]: self._orders.pop(col, None)
+            self._best, self._flags = None, {}
+            self.version += 1
+
+    def classes(self):
+        with self._lock: return sorted(self._by_class)
+
+    # ----------------------------------------------------------------
+    # 索引
+    # ----------------------------------------------------------------
+    def _order(self, col):
+        # 戻り値: 行番号の昇順リスト (キャッシュ)
+        order = self._orders.get(col)
+        key, stable = SORT_KEYS[col]
+        if order is None:
+            if stable: order = self._orders[col] = sorted((key(r), i) for i, r in enumerate(self.records))
+            else:
+                keys = [key(r) for r in self.records]
+                order = self._orders[col] = sorted(range(len(keys)), key=keys.__getitem__)
+        return [i for _, i in order] if stable else order
+
+    def _best_set(self):
+        if self._best is None: self._best = {i for i, r in enumerate(self.records) if r.get("is_best")}
+        return self._best
+
+    def _flag_set(self, flag):
+        s = self._flags.get(flag)
+        if s is None:
+            test = FILTER_FLAGS[flag]
+            s = self._flags[flag] = {i for i, r in enumerate(self.records) if test(r)}
+        return s
+
+    def _text_set(self, text):
+        text = text.strip().lower()
+        grams = {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+        sets = sorted((self._grams.get(g, set()) for g in grams), key=len)
+        hits = set(sets[0]).intersection(*sets[1:])
+        if len(text) > 2: hits = {i for i in hits if text in self._search[i]}   # 2文字索引の候補を確認
+        return hits
+
+    # ----------------------------------------------------------------
+    # 表示
+    # ----------------------------------------------------------------
+    def query(self, scope=OVERALL, sort_col="rank", descending=False, text="", flags=()):
+        # 戻り値: 条件に合う行番号のリスト (表示順)
+        with self._lock:
+            cond = (scope, sort_col, descending, text.strip().lower(), tuple(sorted(flags)))
+            if self._cache and self._cache[0] == cond and self._cache[1] == self.version: return self._cache[2]
+            sets = []
+            if scope == OVERALL: sets.append(self._best_set())
+            elif scope != HISTORY: sets += [self._best_set(), self._by_class.get(scope, set())]
+            if cond[3]: sets.append(self._text_set(cond[3]))
+            sets += [self._flag_set(f) for f in flags]
+
+            keep = None
+            if sets:
+                sets.sort(key=len)
+                keep = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+            key = SORT_KEYS[sort_col][0]
+            if sort_col == "order":
+                rows = sorted(keep, reverse=descending) if keep is not None else list(range(len(self.records)))[::-1 if descending else 1]
+            elif keep is not None and sort_col not in self._orders and len(keep) < len(self.records) // 2:
+                # 絞り込み後が少なければ、全件の並び順を作らずにその分だけ並べる
+                rows = sorted(keep, key=lambda i: key(self.records[i]))
+                if descending: rows.reverse()
+            else:
+                order = self._order(sort_col)
+                if descending: order = order[::-1]
+                rows = [i for i in order if i in keep] if keep is not None else order
+            self._cache = (cond, self.version, rows)
+            return rows
+
+    def page(self, rows, offset, limit):
+        with self._lock: return [self.records[i] for i in rows[offset:offset + limit]]
+
+
+# ====================================================================
+# 速度確認: python result_grid.py [走行数]
+# ====================================================================
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+    from penalty_history import PenaltyHistory
+    from scoring_rules import compile_rules
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(1)
+    history, log = PenaltyHistory(), []
+    for i in range(n):
+        bib = str(rng.randrange(1, n // 3 + 2))
+        r = {"bib": bib, "name": f"選手{bib}", "class": "ABCN"[int(bib) % 4], "base_time": round(rng.uniform(30, 60), 3),
+             "penalty_text": "", "memo_text": "FLYING(-0.1s)" if rng.random() < 0.02 else ""}
+        history.register_run(r)
+        if rng.random() < 0.3: history.apply(r, "PENALTY", 1, "PT")
+        log.append(r)
+    compile_rules().rescore(log, history)
+
+    grid = ResultGrid()
+    t0 = time.perf_counter()
+    grid.sync(log)
+    print(f"索引作成 {n}走: {(time.perf_counter() - t0) * 1000:.1f}ms")
+    for label, args in [("総合 順位", (OVERALL, "rank")), ("全履歴 ゼッケン", (HISTORY, "bib")), ("全履歴 ゼッケン降順", (HISTORY, "bib", True)),
+                        ("全履歴 トップ比", (HISTORY, "top_ratio")), ("B 名前検索", ("B", "rank", False, "選手1")),
+                        ("全履歴 FLYING", (HISTORY, "order", True, "", ("FLYING",))), ("全履歴 ペナルティ+名前", (HISTORY, "penalty", False, "12", ("ペナルティ",)))]:
+        t0 = time.perf_counter()
+        rows = grid.query(*args)
+        print(f"  {label:<16} {len(rows):>5}件 {(time.perf_counter() - t0) * 1000:6.2f}ms  先頭: {[(r['bib'], r['time_str']) for r in grid.page(rows, 0, 3)]}")
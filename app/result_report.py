@@ -0,0 +1,232 @@
+# ====================================================================
+# MGTS - 掲示用リザルト (総合・クラス別の順位表を HTML / PDF で出力)
+#  * 順位・トップ比・クラス比・ペナルティ・備考を、総合とクラスごとに1ファイルずつと
+#    全クラスをまとめた印刷用ファイル (standings_all) に書き出す
+#  * 描画はワーカープロセス (ProcessPoolExecutor) で行い、計測画面のスレッドは
+#    スナップショットを渡すだけにする。変更のあったクラスはまとめて並列に描画する
+#  * 内容のハッシュが前回と同じクラスは描画し直さず、前回の出力をそのまま使う
+#    (区分の本文に集計時刻は入れない。時刻は書き出すファイルの先頭にだけ付ける)
+#  * PDF は WeasyPrint がある場合のみ (なければ HTML をブラウザから印刷する)
+# ====================================================================
+import hashlib
+import html
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from roster import rider_key
+
+try:
+    from weasyprint import HTML as PdfHTML
+    PDF_AVAILABLE = True
+except (ImportError, OSError):   # GTK などのネイティブライブラリが無い場合は OSError
+    PDF_AVAILABLE = False
+
+REPORT_DIR = "mgts_reports"
+OVERALL = "総合"
+INF = float("inf")
+
+COLUMNS = [("rank", "順位"), ("class_rank", "ｸﾗｽ順位"), ("class", "クラス"), ("bib", "ゼッケン"), ("name", "選手名"),
+           ("score", "タイム"), ("top_ratio", "トップ比"), ("class_ratio", "クラス比"), ("runs", "走行"),
+           ("penalty_text", "ペナルティ"), ("memo_text", "備考")]
+
+STYLE = """
+@page { size: A4; margin: 12mm; }
+body { font-family: "Yu Gothic", "Meiryo", "Noto Sans CJK JP", sans-serif; font-size: 10pt; color: #000; }
+h1 { font-size: 16pt; margin: 0 0 2mm; }
+.meta { color: #555; margin-bottom: 4mm; }
+table { width: 100%; border-collapse: collapse; }
+th, td { border: 1px solid #999; padding: 1.2mm 2mm; text-align: left; }
+th { background: #eee; }
+td.num { text-align: right; font-variant-numeric: tabular-nums; }
+tr.unranked td { color: #777; }
+section + section { page-break-before: always; }
+"""
+
+
+def _safe_name(text):
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", str(text)) or "_"
+
+
+# ====================================================================
+# スナップショット (計測画面のスレッドで作る。ワーカーへ渡せる素の値だけ)
+# ====================================================================
+def build_sections(results_log):
+    # 戻り値: {区分名: [行dict]} 総合が先頭、以降クラス名順
+    runs = {}   # rider_key -> 走行数 (ゼッケンを使い回した別人の走行は数えない)
+    for r in results_log:
+        key = rider_key(r["bib"], r.get("name"))
+        runs[key] = runs.get(key, 0) + 1
+    reps = sorted((r for r in results_log if r.get("is_best")), key=lambda r: (r.get("sort_key", (0, INF)), str(r["bib"])))
+    rows = []
+    for r in reps:
+        flags = "/".join(r.get("record_flags", ()))
+        rows.append({
+            "rank": r.get("overall_rank", "-"), "class_rank": r.get("class_rank", "-"),
+            "class": r["class"], "bib": str(r["bib"]), "name": r["name"],
+            "score": ("MC" if r.get("is_mc") else r.get("score_str", r["time_str"])) + (f" {flags}" if flags else ""),
+            "top_ratio": r.get("top_ratio", "-"), "class_ratio": r.get("class_ratio", "-"), "runs": runs[rider_key(r["bib"], r.get("name"))],
+            "penalty_text": r.get("penalty_text", ""), "memo_text": r.get("memo_text", ""),
+        })
+    sections = {OVERALL: rows}
+    for c in sorted({row["class"] for row in rows}): sections[c] = [row for row in rows if row["class"] == c]
+    return sections
+
+
+def section_digest(title, name, rows):
+    return hashlib.sha256(json.dumps([title, name, rows], ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# ====================================================================
+# 描画 (ワーカープロセスで実行)
+# ====================================================================
+def render_section_body(title, name, rows):
+    cols = COLUMNS if name == OVERALL else [c for c in COLUMNS if c[0] != "class"]
+    head = "".join(f"<th>{label}</th>" for _, label in cols)
+    body = []
+    for row in rows:
+        cls = "" if isinstance(row["rank"], int) else ' class="unranked"'
+        cells = "".join(f'<td class="num">{html.escape(str(row[k]))}</td>' if k in ("rank", "class_rank", "score", "top_ratio", "class_ratio", "runs")
+                        else f"<td>{html.escape(str(row[k]))}</td>" for k, _ in cols)
+        body.append(f"<tr{cls}>{cells}</tr>")
+    heading = f"{title} {OVERALL}順位" if name == OVERALL else f"{title} {name}クラス 順位"
+    return (f"<section><h1>{html.escape(heading)}</h1><div class=\"meta\">{len(rows)}名</div>"
+            f"<table><thead><tr>{head}</tr></thead><tbody>{''.join(body)}</tbody></table></section>")
+
+
+def _document(title, bodies, generated):
+    return (f"<!DOCTYPE html><html lang=\"ja\"><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>"
+            f"<style>{STYLE}</style></head><body><div class=\"meta\">集計 {html.escape(generated)}</div>{''.join(bodies)}</body></html>")
+
+
+def _atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp_", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f: f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+def write_document(title, bodies, generated, out_dir, stem, pdf=True):
+    # 戻り値: 書き出したファイルのパス
+    doc = _document(title, bodies, generated)
+    html_path = os.path.join(out_dir, stem + ".html")
+    _atomic_write(html_path, doc.encode("utf-8"))
+    paths = [html_path]
+    if pdf and PDF_AVAILABLE:
+        pdf_path = os.path.join(out_dir, stem + ".pdf")
+        _atomic_write(pdf_path, PdfHTML(string=doc).write_pdf())
+        paths.append(pdf_path)
+    return paths
+
+
+def render_section(title, name, rows, generated, out_dir, pdf=True):
+    body = render_section_body(title, name, rows)
+    return body, write_document(title, [body], generated, out_dir, "standings_" + _safe_name(name), pdf)
+
+
+# ====================================================================
+# 出力管理 (計測画面から呼ぶ)
+# ====================================================================
+class ReportWriter:
+    def __init__(self, out_dir=REPORT_DIR, workers=None, pdf=True, on_done=None):
+        self.out_dir = out_dir
+        self.workers = workers
+        self.pdf = pdf
+        self.on_done = on_done       # on_done(report): report は render() の戻り値 ("error" キーで失敗)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._busy = False
+        self._rendered = {}          # 区分名 -> (ハッシュ, 本文HTML, 出力パス)
+        os.makedirs(out_dir, exist_ok=True)
+
+    def publish(self, results_log, title, tag=None):
+        # スナップショットだけ作って戻る。描画中に来た依頼は最新の1件にまとめる
+        snapshot = (title, build_sections(results_log), time.strftime("%Y-%m-%d %H:%M:%S"), tag)
+        with self._lock:
+            self._pending = snapshot
+            if self._busy: return
+            self._busy = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+                if snapshot is None:
+                    self._busy = False
+                    return
+            title, sections, generated, tag = snapshot
+            try: report = self.render(title, sections, generated)
+            except Exception as e: report = {"error": e}
+            report["tag"] = tag
+            if self.on_done: self.on_done(report)
+
+    def _get_pool(self):
+        if self._pool is None: self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _is_current(self, name, digest):
+        done = self._rendered.get(name)
+        return done is not None and done[0] == digest and all(os.path.exists(p) for p in done[2])
+
+    def render(self, title, sections, generated):
+        digests = {name: section_digest(title, name, rows) for name, rows in sections.items()}
+        todo = [name for name in sections if not self._is_current(name, digests[name])]
+        if todo:
+            pool = self._get_pool()
+            futures = {name: pool.submit(render_section, title, name, sections[name], generated, self.out_dir, self.pdf) for name in todo}
+            for name, fut in futures.items():
+                body, paths = fut.result()
+                self._rendered[name] = (digests[name], body, paths)
+        for name in [n for n in self._rendered if n not in sections]: del self._rendered[name]   # いなくなったクラス
+
+        combined = os.path.join(self.out_dir, "standings_all.html")
+        if todo or not os.path.exists(combined):
+            bodies = [self._rendered[name][1] for name in sections]
+            self._get_pool().submit(write_document, title, bodies, generated, self.out_dir, "standings_all", self.pdf).result()
+        return {"rendered": len(todo), "reused": len(sections) - len(todo), "index": combined, "pdf": self.pdf and PDF_AVAILABLE}
+
+    def close(self):
+        if self._pool is not None: self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+
+# ====================================================================
+# 動作確認: python result_report.py [走行数]
+# ====================================================================
+if __name__ == "__main__":
+    import random
+    import sys
+    from penalty_history import PenaltyHistory
+    from scoring_rules import compile_rules
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    rng = random.Random(1)
+    history, log = PenaltyHistory(), []
+    for i in range(n):
+        bib = str(rng.randrange(1, n // 2 + 2))
+        r = {"bib": bib, "name": f"選手{bib}", "class": "ABCN"[int(bib) % 4], "base_time": round(rng.uniform(30, 60), 3),
+             "penalty_text": "", "memo_text": ""}
+        history.register_run(r)
+        log.append(r)
+    scorer = compile_rules()
+    scorer.rescore(log, history)
+
+    writer = ReportWriter(os.path.join(tempfile.mkdtemp(prefix="mgts_report_"), REPORT_DIR))
+    for label in ("初回", "変更なし"):
+        t0 = time.perf_counter()
+        report = writer.render("MGTS 動作確認", build_sections(log), "-")
+        print(f"{label}: 描画 {report['rendered']} / 再利用 {report['reused']} ({(time.perf_counter() - t0) * 1000:.0f}ms) -> {report['index']}")
+    next(r for r in log if r["is_best"] and r["class"] == "B")["memo_text"] = "確認"   # Bクラスと総合だけ変わる
+    report = writer.render("MGTS 動作確認", build_sections(log), "-")
+    print(f"備考修正: 描画 {report['rendered']} / 再利用 {report['reused']}")
+    writer.close()
@@ -0,0 +1,187 @@
+# ====================================================================
+# MGTS - 選手名簿CSVの読み込み (GUI・タグ書き込みツール共通)
+#  * 文字コードは UTF-8 (BOM可) を優先し、失敗したら Shift_JIS で読み直す
+#  * 区切りはカンマ / タブ / 空白を自動判別、先頭のヘッダー行は読み飛ばす
+#  * 解析済みの名簿は元CSVのサイズ・更新時刻・SHA-256 と一緒にバイナリのスナップショット
+#    (mgts_roster.snapshot) に保存し、次回起動時は1回の読み込みで復元する。
+#    複数のCSVを読み込んだ場合は全ファイルを読み込み順に持ち、起動時に同じ順で重ねる。
+#    更新時刻が変わっていても内容のハッシュが同じなら解析し直さない
+# ====================================================================
+import hashlib
+import marshal
+import os
+import re
+import struct
+import tempfile
+
+ROSTER_SNAPSHOT = "mgts_roster.snapshot"
+SNAPSHOT_MAGIC = b"MGRS"
+SNAPSHOT_VERSION = 2                           # 1: 最後に読んだCSVのみ / 2: 読み込んだCSVすべて
+SNAPSHOT_HEADER = struct.Struct("<4sHI")      # マジック, 版, 本体の長さ
+
+
+def rider_key(bib, name):
+    # 大会をまたいだ選手の識別 (ゼッケンは大会ごとに使い回されるので名前と組にする。空白の有無は区別しない)
+    return f"{bib}|{re.sub(r'[ 　]', '', str(name or ''))}"
+
+
+def decode_roster_bytes(data):
+    try: return data.decode('utf-8-sig').splitlines(True)
+    except UnicodeDecodeError: return data.decode('shift_jis').splitlines(True)
+
+
+def read_roster_lines(file_path):
+    with open(file_path, mode='rb') as f: return decode_roster_bytes(f.read())
+
+
+def parse_roster_lines(lines):
+    # 戻り値: ({タグID: {"bib", "name", "class"}} (CSVの並び順), エラー件数)
+    riders, error_count, header_skipped = {}, 0, False
+    for idx, raw_line in enumerate(lines or []):
+        line = raw_line.strip()
+        if not line: continue
+        if line.startswith('"') and line.endswith('"'): line = line[1:-1]
+        if ',' in line: row = line.split(',')
+        elif '\t' in line: row = line.split('\t')
+        else: row = re.split(r'\s+', line)
+        row = [item.strip() for item in row if item.strip()]
+
+        if len(row) < 4:
+            if idx > 0 and row: error_count += 1
+            continue
+        if not header_skipped and ("ID" in row[0].upper() or "タグ" in row[0]):
+            header_skipped = True
+            continue
+
+        tag_id, bib, name = row[0].upper(), row[1], row[2]
+        r_class = row[3] if len(row) > 3 else "-"
+
+        if not bib.isdigit() or not name:
+            error_count += 1
+            continue
+
+        riders[tag_id] = {"bib": bib, "name": name, "class": r_class}
+    return riders, error_count
+
+
+# ====================================================================
+# スナップショット (解析済み名簿のキャッシュ)
+# ====================================================================
+def build_roster_source(file_path):
+    # CSVを1回だけ読み、ハッシュと解析結果をまとめる (スナップショットの1ファイル分)
+    st = os.stat(file_path)
+    with open(file_path, mode='rb') as f: data = f.read()
+    riders, error_count = parse_roster_lines(decode_roster_bytes(data))
+    return {"source": os.path.abspath(file_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "sha256": hashlib.sha256(data).hexdigest(), "riders": riders, "errors": error_count}
+
+
+def write_roster_snapshot(sources, cache_path=ROSTER_SNAPSHOT):
+    # 読み込んだCSVを読み込み順に全部保存する。名簿は列ごとのリストにする (選手ごとの dict より小さく、読み込みも速い)
+    packed = []
+    for src in sources:
+        riders = src["riders"]
+        packed.append(dict(src, riders=[list(riders)] + [[info[k] for info in riders.values()] for k in ("bib", "name", "class")]))
+    body = marshal.dumps({"sources": packed})
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)), prefix=".tmp_", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f: f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(body)) + body)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+def read_roster_snapshot(cache_path=ROSTER_SNAPSHOT):
+    # 戻り値: [CSVごとのスナップショット, ...] (読み込み順)。無い・壊れている・版が違う場合は None
+    try:
+        with open(cache_path, mode='rb') as f: data = f.read()
+    except OSError: return None
+    if len(data) < SNAPSHOT_HEADER.size: return None
+    magic, version, length = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version not in (1, SNAPSHOT_VERSION) or len(data) != SNAPSHOT_HEADER.size + length: return None
+    try: snapshot = marshal.loads(data[SNAPSHOT_HEADER.size:])
+    except (ValueError, EOFError, TypeError): return None
+    try:
+        sources = [snapshot] if version == 1 else snapshot["sources"]   # 版1 は最後に読んだCSV 1件だけ
+        for src in sources:
+            tags, bibs, names, classes = src["riders"]
+            src["riders"] = {t: {"bib": b, "name": n, "class": c} for t, b, n, c in zip(tags, bibs, names, classes)}
+    except (TypeError, KeyError, ValueError): return None
+    return sources
+
+
+def _refresh_source(path, cached):
+    # 戻り値: (スナップショット, 解析し直したか, 保存し直す必要があるか)
+    # サイズと更新時刻が同じならキャッシュをそのまま使い、違えば内容のハッシュで判断する
+    if cached:
+        if not os.path.exists(path): return cached, False, False   # USBメモリを抜いた等: 前回の内容をそのまま使う
+        st = os.stat(path)
+        if (cached["size"], cached["mtime_ns"]) == (st.st_size, st.st_mtime_ns): return cached, False, False
+        with open(path, mode='rb') as f: digest = hashlib.sha256(f.read()).hexdigest()
+        if digest == cached["sha256"]:
+            cached["size"], cached["mtime_ns"] = st.st_size, st.st_mtime_ns   # 触っただけ (保存し直し・コピー)
+            return cached, False, True
+    return build_roster_source(path), True, True
+
+
+def load_roster(file_path, cache_path=ROSTER_SNAPSHOT, sources=None):
+    # CSVを指定して読み、スナップショットの読み込み順の最後に加える (同じCSVの読み直しは最後へ移す)
+    # 戻り値: (そのCSVのスナップショット, 解析し直したか)
+    if sources is None: sources = read_roster_snapshot(cache_path) or []
+    path = os.path.abspath(file_path)
+    cached = next((src for src in sources if src["source"] == path), None)
+    entry, rebuilt, dirty = _refresh_source(path, cached)
+    if dirty or sources[-1] is not cached:
+        write_roster_snapshot([src for src in sources if src["source"] != path] + [entry], cache_path)
+    return entry, rebuilt
+
+
+def merge_roster_sources(sources):
+    # 読み込み順に重ねる (同じタグIDは後に読んだCSVが勝つ = 画面で読み込んだ時と同じ)
+    riders = {}
+    for src in sources: riders.update(src["riders"])
+    return {"sources": sources, "riders": riders, "errors": sum(src["errors"] for src in sources)}
+
+
+def restore_roster(cache_path=ROSTER_SNAPSHOT):
+    # 起動時: 前回までに読み込んだ名簿を全部復元する。戻り値: (統合した名簿, 解析し直したか) / 前回の名簿が無ければ None
+    cached = read_roster_snapshot(cache_path)
+    if not cached: return None
+    refreshed = [_refresh_source(src["source"], src) for src in cached]
+    sources = [entry for entry, _, _ in refreshed]
+    if any(dirty for _, _, dirty in refreshed): write_roster_snapshot(sources, cache_path)
+    return merge_roster_sources(sources), any(rebuilt for _, rebuilt, _ in refreshed)
+
+
+# ====================================================================
+# 動作確認: python roster.py [名簿CSV]
+# ====================================================================
+if __name__ == "__main__":
+    import sys
+    import time
+
+    src = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "entry_list_sample.csv")
+    work = tempfile.mkdtemp(prefix="mgts_roster_")
+    cache = os.path.join(work, ROSTER_SNAPSHOT)
+    for label, fn in [("初回 (CSV解析)", lambda: load_roster(src, cache)), ("起動時の復元", lambda: restore_roster(cache))]:
+        t0 = time.perf_counter()
+        snapshot, rebuilt = fn()
+        print(f"{label}: {len(snapshot['riders'])}名 / エラー {snapshot['errors']}件 / 解析{'あり' if rebuilt else 'なし'} "
+              f"({(time.perf_counter() - t0) * 1000:.2f}ms, {os.path.getsize(cache)}B)")
+
+    # 追加のCSV (当日エントリー) を読んだ後も、両方を重ねた名簿が復元されること
+    extra = os.path.join(work, "entry_list_extra.csv")
+    first = next(iter(load_roster(src, cache)[0]["riders"]))
+    with open(extra, "w", encoding="utf-8") as f: f.write(f"タグID,ゼッケン,選手名,クラス\n{first},99,差し替え 選手,N\nZ999,98,当日 選手,N\n")
+    base = load_roster(src, cache)[0]["riders"]
+    load_roster(extra, cache)
+    merged, _ = restore_roster(cache)
+    assert len(merged["sources"]) == 2 and len(merged["riders"]) == len(base) + 1, merged["sources"]
+    assert merged["riders"][first]["bib"] == "99" and merged["riders"]["Z999"]["bib"] == "98"
+    print(f"2ファイルの復元: {len(merged['riders'])}名 ({', '.join(os.path.basename(x['source']) for x in merged['sources'])}) OK")
+
+    t0 = time.perf_counter()
+    for _ in range(100): parse_roster_lines(read_roster_lines(src))
+    print(f"参考: CSV解析のみ {(time.perf_counter() - t0) * 10:.2f}ms")
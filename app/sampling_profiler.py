@@ -0,0 +1,244 @@
+# ====================================================================
+# MGTS - 実行中に切り替えられるプロファイラ (大会中の「重い」の原因調査用)
+#  * サンプリング: 専用スレッドが一定間隔で全スレッド (受信リスナー・画面・監視) の
+#    スタックを sys._current_frames() で覗き、同じスタックの出現回数を数える。
+#    計測対象のコードには何も仕掛けないので、止めている間の負荷はゼロ
+#  * スレッドごとのCPU時計が使える環境 (Linux / macOS) では、前回からCPUを使ったスレッドだけを
+#    数える (受信待ち・sleep 中のスレッドが上位を占めないように)。使えない環境では待機中も含む
+#  * 区間トレース (任意): instrument() で包んだ処理 (受信処理・再採点・画面更新など) の
+#    所要時間を入れ子のまま集計する。OFF の間は包んだ関数がフラグを1回見るだけ
+#  * 停止時に flamegraph.pl / speedscope で読める collapsed 形式 (1行1スタック) を書き出し、
+#    上位の関数を要約して返す
+# ====================================================================
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_DIR = "mgts_profiles"
+SAMPLE_INTERVAL = 0.005    # サンプリング間隔 (秒)
+MAX_DEPTH = 64             # 1スタックで記録する最大の深さ
+TOP_N = 8
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+def _is_plumbing(code):
+    # 累積の上位から外す枠 (スレッドの起動処理と区間トレースの包み)
+    return code.co_filename == threading.__file__ or (code.co_filename == __file__ and code.co_name == "traced")
+
+
+class SamplingProfiler:
+    def __init__(self, out_dir=PROFILE_DIR, interval=SAMPLE_INTERVAL):
+        self.out_dir = out_dir
+        self.interval = interval
+        self.tracing = False
+        self._stacks = Counter()        # (スレッド名, (code, ...) 根元から) -> 回数
+        self._spans = {}                # 区間の入れ子パス -> [回数, 合計秒, 最大秒]
+        self._local = threading.local()
+        self._lock = threading.Lock()        # _stacks 用 (サンプリングスレッド)
+        self._span_lock = threading.Lock()   # _spans 用 (計測対象のスレッド。サンプリングとは取り合わない)
+        self._thread = None
+        self._running = False
+        self._started = None
+        self.samples = 0
+        self.cpu_only = hasattr(time, "pthread_getcpuclockid")
+
+    @property
+    def running(self):
+        return self._running
+
+    # ----------------------------------------------------------------
+    # 開始・停止
+    # ----------------------------------------------------------------
+    def start(self, trace=False):
+        if self._running: return
+        with self._lock: self._stacks.clear()
+        with self._span_lock: self._spans.clear()
+        self.samples = 0
+        self.tracing = trace
+        self._running = True
+        self._started = time.time()
+        self._thread = threading.Thread(target=self._sample_loop, name="mgts-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self, top_n=TOP_N):
+        # 戻り値: summary() の内容と書き出したファイルのパス
+        if not self._running: return None
+        self._running = False
+        self.tracing = False
+        self._thread.join()
+        report = self.summary(top_n)
+        report["paths"] = self.write()
+        return report
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        names, names_at = {}, 0.0
+        clocks, cpu_last = {}, {}       # ident -> CPU時計ID / 前回のCPU時間
+        while self._running:
+            now = time.monotonic()
+            if now - names_at > 1.0:    # スレッド名・CPU時計の対応表は1秒ごとに作り直す
+                names, names_at = {t.ident: t.name for t in threading.enumerate()}, now
+                if self.cpu_only: clocks = {ident: clocks.get(ident) or self._cpu_clock(ident) for ident in names}
+            frames = sys._current_frames()
+            # スタックはロックの外で辿る (集計表の更新だけをロックする)
+            seen = []
+            for ident, frame in frames.items():
+                if ident == own: continue
+                clock = clocks.get(ident)
+                if clock is not None:
+                    try: cpu = time.clock_gettime(clock)
+                    except OSError: cpu = None
+                    if cpu is not None:
+                        prev, cpu_last[ident] = cpu_last.get(ident), cpu
+                        if prev is None or cpu == prev: continue   # 前回から動いていない (待機中)
+                codes = []
+                while frame is not None and len(codes) < MAX_DEPTH:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                seen.append((names.get(ident, str(ident)), tuple(codes)))
+            del frames
+            with self._lock:
+                for key in seen: self._stacks[key] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _cpu_clock(ident):
+        try: return time.pthread_getcpuclockid(ident)
+        except (OSError, OverflowError): return None
+
+    # ----------------------------------------------------------------
+    # 区間トレース
+    # ----------------------------------------------------------------
+    def wrap(self, name, fn):
+        def traced(*args, **kwargs):
+            if not self.tracing: return fn(*args, **kwargs)
+            stack = getattr(self._local, "stack", None)
+            if stack is None: stack = self._local.stack = []
+            stack.append(name)
+            path = ";".join(stack)
+            t0 = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                stack.pop()
+                with self._span_lock:
+                    s = self._spans.get(path)
+                    if s is None: s = self._spans[path] = [0, 0.0, 0.0]
+                    s[0] += 1
+                    s[1] += dt
+                    if dt > s[2]: s[2] = dt
+        traced.__name__ = getattr(fn, "__name__", name)
+        traced.__wrapped__ = fn
+        return traced
+
+    def instrument(self, obj, names):
+        # obj のメソッドを区間トレースつきに差し替える (コールバック登録より前に呼ぶこと)
+        for name in names: setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+    # ----------------------------------------------------------------
+    # 集計・出力
+    # ----------------------------------------------------------------
+    def summary(self, top_n=TOP_N):
+        with self._lock: stacks = list(self._stacks.items())
+        with self._span_lock: spans = {path: list(s) for path, s in self._spans.items()}
+        busy = 0
+        inclusive, exclusive = Counter(), Counter()
+        for (_, codes), count in stacks:
+            if not codes: continue
+            busy += count
+            exclusive[codes[-1]] += count
+            for code in set(codes):
+                if not _is_plumbing(code): inclusive[code] += count
+        # 区間は関数ごとの自分の時間 (子の区間を除く) も出す
+        child_total = Counter()
+        for path, (_, total, _) in spans.items():
+            if ";" in path: child_total[path.rsplit(";", 1)[0]] += total
+        span_rows = sorted(((path, n, total, total - child_total[path], peak) for path, (n, total, peak) in spans.items()), key=lambda r: -r[2])
+        return {
+            "seconds": time.time() - self._started if self._started else 0.0, "samples": self.samples, "stack_samples": busy, "cpu_only": self.cpu_only,
+            "self": [(_frame_label(c), n) for c, n in exclusive.most_common(top_n)],
+            "total": [(_frame_label(c), n) for c, n in inclusive.most_common(top_n)],
+            "spans": span_rows[:top_n],
+        }
+
+    def collapsed(self):
+        # flamegraph 用: "スレッド名;ファイル:関数;... 回数"
+        with self._lock: stacks = list(self._stacks.items())
+        lines = Counter()
+        for (thread, codes), count in stacks:
+            lines[";".join([thread.replace(";", "_")] + [_frame_label(c) for c in codes])] += count
+        return [f"{stack} {count}" for stack, count in sorted(lines.items())]
+
+    def collapsed_spans(self):
+        # 区間トレースの flamegraph 用 (重みはマイクロ秒、子の区間を除いた自分の時間)
+        with self._span_lock: spans = {path: s[1] for path, s in self._spans.items()}
+        child_total = Counter()
+        for path, total in spans.items():
+            if ";" in path: child_total[path.rsplit(";", 1)[0]] += total
+        return [f"{path} {max(0, round((total - child_total[path]) * 1e6))}" for path, total in sorted(spans.items())]
+
+    def write(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        stem = os.path.join(self.out_dir, "profile_" + time.strftime("%Y%m%d_%H%M%S", time.localtime(self._started)))
+        paths = []
+        for suffix, lines in ((".folded", self.collapsed()), (".spans.folded", self.collapsed_spans())):
+            if not lines: continue
+            with open(stem + suffix, "w", encoding="utf-8") as f: f.write("\n".join(lines) + "\n")
+            paths.append(stem + suffix)
+        return paths
+
+
+def describe_profile(report):
+    # ログ画面に出す要約 (1行ずつ)
+    busy = report["stack_samples"] or 1
+    lines = [f"{report['seconds']:.0f}秒 / {report['samples']}回サンプリング ({'CPU使用中のみ' if report['cpu_only'] else '待機中も含む'})"]
+    lines += [f"  自身 {n / busy * 100:5.1f}%  {label}" for label, n in report["self"]]
+    lines += [f"  累積 {n / busy * 100:5.1f}%  {label}" for label, n in report["total"]]
+    lines += [f"  区間 {path}: {n}回 計{total * 1000:.0f}ms (自身 {own * 1000:.0f}ms / 最大 {peak * 1000:.1f}ms)" for path, n, total, own, peak in report["spans"]]
+    return lines
+
+
+# ====================================================================
+# 動作確認: python sampling_profiler.py
+#  重い処理を回すスレッドと区間トレースを仕掛け、要約と出力ファイルを確認する
+# ====================================================================
+if __name__ == "__main__":
+    import tempfile
+
+    class Busy:
+        def handle(self, n):
+            self.rescore(n)
+            return sum(i * i for i in range(n // 4))
+
+        def rescore(self, n):
+            return sorted(str(i) for i in range(n))
+
+    prof = SamplingProfiler(os.path.join(tempfile.mkdtemp(prefix="mgts_prof_"), PROFILE_DIR))
+    plain, busy = Busy(), Busy()
+    prof.instrument(busy, ("handle", "rescore"))
+
+    t0 = time.perf_counter()
+    for _ in range(200): plain.handle(2000)
+    base = time.perf_counter() - t0
+
+    stop = threading.Event()
+    def worker():
+        while not stop.is_set(): busy.handle(20000)
+    threading.Thread(target=worker, name="listener-demo", daemon=True).start()
+    prof.start(trace=True)
+    time.sleep(1.0)
+    stop.set()
+    report = prof.stop()
+    for line in describe_profile(report): print(line)
+    for path in report["paths"]: print("->", path)
+
+    t0 = time.perf_counter()
+    for _ in range(200): busy.handle(2000)
+    print(f"OFF時の包み込みの影響: {((time.perf_counter() - t0) / base - 1) * 100:+.1f}%")
@@ -0,0 +1,263 @@
+# ====================================================================
+# MGTS - 採点ルール (設定ファイルで宣言 -> 採点器 Scorer を組み立てる)
+#  * ペナルティ秒数 (コードごと)、MC、DNF の扱い、タイム上限、クラス係数 (ハンディキャップ)、
+#    集計方法 (ベスト1本 / ベストN本の合計) を mgts_scoring.json で指定する
+#  * ルールは compile_rules() で一度だけ解釈して係数・秒数の表にしておき、score_run() は
+#    走行1件ずつそれを引くだけにする (走行ごとに設定を読み直さない)。ルール変更時の
+#    rescore() は全走行に score_run() を順にかけて順位表を作り直す (1件ずつの Python ループ)
+#  * ゴール・ペナルティ修正では rescore_runs() で触った走行だけを採点し、順位表を差分で直す
+#  * 走行の派生値 (penalty / penalty_text / is_mc / time_float / time_str) を書くのは score_run() だけ
+#  * 編集イベント (PenaltyHistory) はラベルで持っているため、ペナルティ秒数を
+#    変更すると過去の走行にもそのまま反映される
+# ====================================================================
+import bisect
+import json
+import os
+
+SCORING_RULES_PATH = "mgts_scoring.json"
+INF = float("inf")
+
+DEFAULT_RULES = {
+    "name": "標準 (ベスト1本)",
+    "penalties": {"PT": 1, "足つき": 1, "フライング": 1, "脱輪": 3},   # ラベル -> 加算秒 (未定義のラベルは操作時の秒数)
+    "dnf_time": 999.999,      # メイン基板が DNF として送るタイム
+    "dnf": "last",            # last: そのタイムで最下位に並べる / exclude: 記録なし
+    "time_cap": None,         # タイム上限 (秒)。None で無制限
+    "over_cap": "clamp",      # clamp: 上限タイムにする / dnf: DNF扱い
+    "aggregate": "best",      # best: ベスト1本 / sum: ベスト runs_counted 本の合計
+    "runs_counted": 1,
+    "handicaps": {},          # クラス -> 係数 (例: {"N": 0.95})
+}
+
+_CHOICES = {"dnf": ("last", "exclude"), "over_cap": ("clamp", "dnf"), "aggregate": ("best", "sum")}
+
+
+def normalize_rules(user):
+    # 既定値で補い、値を検査する (不正な設定は ValueError)
+    unknown = set(user) - set(DEFAULT_RULES)
+    if unknown: raise ValueError(f"不明な採点ルール項目: {', '.join(sorted(unknown))}")
+    rules = dict(DEFAULT_RULES, **user)
+    for key, allowed in _CHOICES.items():
+        if rules[key] not in allowed: raise ValueError(f"{key} は {' / '.join(allowed)} のいずれか: {rules[key]!r}")
+    if int(rules["runs_counted"]) < 1: raise ValueError("runs_counted は1以上")
+    if rules["aggregate"] == "best": rules["runs_counted"] = 1
+    return rules
+
+
+def load_rules(path=SCORING_RULES_PATH):
+    if not os.path.exists(path): return normalize_rules({})
+    with open(path, encoding="utf-8") as f: return normalize_rules(json.load(f))
+
+
+def compile_rules(rules=None):
+    return Scorer(normalize_rules(rules or {}))
+
+
+class Scorer:
+    def __init__(self, rules):
+        self.rules = rules
+        self.name = rules["name"]
+        self._penalties = {k: float(v) for k, v in rules["penalties"].items()}
+        self._handicaps = {k: float(v) for k, v in rules["handicaps"].items()}
+        self._dnf_time = float(rules["dnf_time"])
+        self._dnf_value = self._dnf_time if rules["dnf"] == "last" else INF
+        self._cap = float(rules["time_cap"]) if rules["time_cap"] else None
+        self._over_cap_value = None if rules["over_cap"] == "clamp" else self._dnf_value
+        self._counted = int(rules["runs_counted"])
+        self._ranked = None          # 順位表 [(並びキー, 出走順, 代表走行), ...] (rank() で作成)
+
+    # ----------------------------------------------------------------
+    # 1. 走行ごとの採点 (ペナルティ・MC・DNF・上限・係数。派生値を書くのはここだけ)
+    # ----------------------------------------------------------------
+    def score_run(self, r, events):
+        base = r["base_time"]
+        penalty, is_mc, text = 0.0, False, ""
+        for ev in events:
+            if ev.kind == "RESET": penalty, is_mc, text = 0.0, False, ""
+            elif ev.kind == "MC": is_mc, text = True, "MC"
+            else:
+                penalty += self._penalties.get(ev.label, ev.seconds)
+                if text == "MC": text = ""   # MCから通常のペナルティ加算に復帰した場合
+                is_mc = False
+                text = f"{text} [{ev.label}]".strip()
+        is_dnf = False
+        if is_mc: t = INF
+        elif base >= self._dnf_time: t, is_dnf = self._dnf_value, True
+        else:
+            t = base + penalty
+            if self._cap is not None and t > self._cap:
+                if self._over_cap_value is None: t = self._cap
+                else: t, is_dnf = self._over_cap_value, True
+            if t != INF: t = round(t * self._handicaps.get(r["class"], 1.0), 3)
+        r["penalty"] = int(penalty) if penalty == int(penalty) else penalty
+        r["is_mc"], r["is_dnf"], r["time_float"], r["penalty_text"] = is_mc, is_dnf, t, text
+        r["time_str"] = "MC" if is_mc else ("DNF" if t == INF else f"{t:.3f}")
+
+    def score_runs(self, results_log, penalty_history):
+        events_for = penalty_history.events_for
+        for r in results_log: self.score_run(r, events_for(r))
+
+    # ----------------------------------------------------------------
+    # 2. 比率・ベスト・順位 (全件)。差分更新用の索引 (選手ごとの走行・順位表) もここで作る
+    # ----------------------------------------------------------------
+    def rank(self, results_log):
+        self._groups, self._order, self._members = {}, {}, set()
+        for r in results_log: self._add(r)
+        self._set_tops(results_log)
+        for r in results_log: self._ratios(r)
+        self._ranked = sorted(e for e in map(self._pick_rep, self._groups) if e)
+        self._class_ranked, self._placed = {}, {}
+        for e in self._ranked:
+            self._class_ranked.setdefault(e[2]["class"], []).append(e)
+            self._placed[e[2]["bib"]] = e
+        _number(self._ranked, "overall_rank", 0)
+        for lst in self._class_ranked.values(): _number(lst, "class_rank", 0)
+
+    def rescore(self, results_log, penalty_history):
+        self.score_runs(results_log, penalty_history)
+        self.rank(results_log)
+
+    # ----------------------------------------------------------------
+    # 3. 差分採点 (ゴール・ペナルティ修正1件ごと)
+    #    触った走行だけ採点し、その選手の代表を順位表から抜いて入れ直す。
+    #    順位を振り直すのは動いた位置から後ろだけ、比率はトップが変わった時だけ全件
+    # ----------------------------------------------------------------
+    def rescore_runs(self, results_log, runs, penalty_history):
+        if self._ranked is None: return self.rescore(results_log, penalty_history)
+        new = [r for r in runs if id(r) not in self._members]
+        if len(self._members) + len(new) != len(results_log):
+            return self.rescore(results_log, penalty_history)   # 索引と走行一覧がずれている -> 全件
+        before = {id(r): INF if id(r) not in self._members else r["time_float"] for r in runs}
+        for r in runs: self.score_run(r, penalty_history.events_for(r))
+        for r in new: self._add(r)
+
+        old_top, old_class_tops = self._top, self._class_tops
+        top, class_tops, stale = old_top, dict(old_class_tops), False
+        for r in runs:
+            t, c, was = r["time_float"], r["class"], before[id(r)]
+            if t > was and (was == old_top or was == old_class_tops.get(c)): stale = True   # トップだった走行が遅くなった
+            if t < top: top = t
+            if t < class_tops.get(c, INF): class_tops[c] = t
+        if stale: self._set_tops(results_log)
+        else: self._top, self._class_tops = top, class_tops
+        for r in runs: self._ratios(r)
+        if self._top != old_top: redo = results_log
+        else:
+            moved = {c for c, t in self._class_tops.items() if old_class_tops.get(c) != t}
+            redo = [r for r in results_log if r["class"] in moved] if moved else ()
+        for r in redo: self._ratios(r)
+
+        lo, class_lo = len(self._ranked), {}
+        for bib in {r["bib"] for r in runs}:
+            old = self._placed.pop(bib, None)
+            if old is not None:
+                c = old[2]["class"]
+                lo = min(lo, _remove(self._ranked, old))
+                class_lo[c] = min(class_lo.get(c, INF), _remove(self._class_ranked[c], old))
+            entry = self._pick_rep(bib)
+            if entry is None: continue
+            c = entry[2]["class"]
+            self._placed[bib] = entry
+            lo = min(lo, _insert(self._ranked, entry))
+            class_lo[c] = min(class_lo.get(c, INF), _insert(self._class_ranked.setdefault(c, []), entry))
+        _number(self._ranked, "overall_rank", lo)
+        for c, i in class_lo.items(): _number(self._class_ranked[c], "class_rank", i)
+
+    def _add(self, r):
+        group = self._groups.get(r["bib"])
+        if group is None:
+            group = self._groups[r["bib"]] = []
+            self._order[r["bib"]] = len(self._order)   # 同じスコアは先に走った選手を上にする
+        group.append(r)
+        self._members.add(id(r))
+
+    def _set_tops(self, results_log):
+        top, class_tops = INF, {}
+        for r in results_log:
+            t, c = r["time_float"], r["class"]
+            if t < top: top = t
+            if t < class_tops.get(c, INF): class_tops[c] = t
+        self._top, self._class_tops = top, class_tops
+
+    def _ratios(self, r):
+        t = r["time_float"]
+        if t == INF: r["top_ratio"] = r["class_ratio"] = "-"
+        else:
+            r["top_ratio"] = f"{(t / self._top) * 100:.2f}%"
+            r["class_ratio"] = f"{(t / self._class_tops[r['class']]) * 100:.2f}%"
+
+    def _pick_rep(self, bib):
+        # 選手の代表走行を選び直す。戻り値は順位表の要素 (並びキー, 出走順, 代表) / 順位対象外なら None
+        runs = self._groups[bib]
+        for r in runs:
+            r["is_best"], r["overall_rank"], r["class_rank"] = False, "-", "-"
+            r["score_str"] = r["time_str"]
+            r["sort_key"] = (0, INF)
+        valid = sorted((r for r in runs if r["time_float"] != INF), key=lambda x: x["time_float"])
+        rep = valid[0] if valid else runs[0]   # 有効タイムがなければ最初の走行を代表にする (MC表示用)
+        rep["is_best"] = True
+        kept = valid[:self._counted]
+        if not kept: return None
+        score = round(sum(r["time_float"] for r in kept), 3)
+        rep["sort_key"] = (-len(kept), score)
+        if self._counted > 1: rep["score_str"] = f"{score:.3f}" + ("" if len(kept) == self._counted else f" ({len(kept)}本)")
+        return (rep["sort_key"], self._order[bib], rep)
+
+
+def _remove(ranked, entry):
+    i = bisect.bisect_left(ranked, entry[:2])
+    del ranked[i]
+    return i
+
+
+def _insert(ranked, entry):
+    i = bisect.bisect_left(ranked, entry[:2])
+    ranked.insert(i, entry)
+    return i
+
+
+def _number(ranked, field, start):
+    for i in range(start, len(ranked)): ranked[i][2][field] = i + 1
+
+
+# ====================================================================
+# 全走行の採点し直し (rescore) の速度確認: python scoring_rules.py [走行数]
+# ====================================================================
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+    from penalty_history import PenaltyHistory
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(1)
+    history = PenaltyHistory()
+    log = []
+    for i in range(n):
+        bib = str(rng.randrange(1, n // 3 + 2))
+        base = 999.999 if rng.random() < 0.02 else round(rng.uniform(30, 60), 3)
+        r = {"bib": bib, "name": "", "class": "ABCN"[int(bib) % 4], "base_time": base}
+        history.register_run(r)
+        if rng.random() < 0.3: history.apply(r, "PENALTY", 1, rng.choice(["PT", "足つき", "脱輪"]))
+        if rng.random() < 0.03: history.apply(r, "MC", 999, "MC")
+        log.append(r)
+
+    for rules in ({}, {"aggregate": "sum", "runs_counted": 2, "time_cap": 55, "dnf": "exclude", "handicaps": {"N": 0.95}}):
+        scorer = compile_rules(rules)
+        t0 = time.perf_counter()
+        scorer.rescore(log, history)
+        ms = (time.perf_counter() - t0) * 1000
+        top = min((r for r in log if r["overall_rank"] == 1), key=lambda r: r["sort_key"])
+        print(f"{scorer.rules['aggregate']:>4}: {n}走を {ms:.1f}ms で採点 / 1位 No.{top['bib']} {top['score_str']}")
+
+        # 差分採点: 1走ずつペナルティを足し、全件採点と同じ結果になることも確かめる
+        edited = rng.sample(log, 200)
+        t0 = time.perf_counter()
+        for r in edited:
+            history.apply(r, "PENALTY", 1, "PT")
+            scorer.rescore_runs(log, [r], history)
+        inc = (time.perf_counter() - t0) * 1000 / len(edited)
+        snapshot = [(r["time_float"], r["overall_rank"], r["class_rank"], r["top_ratio"]) for r in log]
+        scorer.rescore(log, history)
+        same = snapshot == [(r["time_float"], r["overall_rank"], r["class_rank"], r["top_ratio"]) for r in log]
+        print(f"      修正1件の差分採点 {inc:.2f}ms ({'全件採点と一致' if same else '全件採点と不一致'})")
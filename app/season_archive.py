@@ -0,0 +1,276 @@
+# ====================================================================
+# MGTS - シーズンアーカイブ (SQLite / WAL)
+#  * 大会ごとの走行・名簿・ペナルティ編集を1つのDBに取り込む (1大会 = 1トランザクション)
+#  * 取り込みは executemany による一括挿入。同じ大会名・日付・セッションは置き換える
+#    (同じ日の別セッションは別の大会として残す)
+#  * 選手はゼッケン+名前 (rider_key) で区別する (大会ごとにゼッケンを使い回しても混ざらない)
+#  * 選手のPB / クラス記録 / ゼッケン別の全走行をインデックスで即答する
+#  * GUIからは submit() で専用スレッドに問い合わせを投げ、結果をコールバックで受け取る
+#  * 集計ツールからは readonly=True で開く (スキーマ作成・WAL設定などの書き込みをしない)
+# ====================================================================
+import csv
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from roster import rider_key
+
+ARCHIVE_PATH = "mgts_season.db"
+DNF_TIME = 999.999
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id    INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    session     TEXT NOT NULL DEFAULT '',
+    source      TEXT,
+    ingested_at REAL NOT NULL,
+    UNIQUE (name, date, session)
+);
+CREATE TABLE IF NOT EXISTS riders (
+    event_id INTEGER NOT NULL REFERENCES events(event_id) ON DELETE CASCADE,
+    tag_id   TEXT,
+    bib      TEXT NOT NULL,
+    name     TEXT,
+    class    TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    event_id     INTEGER NOT NULL REFERENCES events(event_id) ON DELETE CASCADE,
+    run_no       INTEGER NOT NULL,
+    run_id       TEXT,
+    bib          TEXT NOT NULL,
+    name         TEXT,
+    class        TEXT,
+    base_time    REAL,
+    penalty      REAL NOT NULL DEFAULT 0,
+    is_mc        INTEGER NOT NULL DEFAULT 0,
+    is_dnf       INTEGER NOT NULL DEFAULT 0,
+    time_float   REAL,                -- MC / DNF は NULL
+    penalty_text TEXT,
+    memo_text    TEXT,
+    rider_key    TEXT                 -- ゼッケン|名前
+);
+CREATE TABLE IF NOT EXISTS penalties (
+    event_id  INTEGER NOT NULL REFERENCES events(event_id) ON DELETE CASCADE,
+    run_id    TEXT NOT NULL,
+    action    TEXT NOT NULL,
+    kind      TEXT,
+    seconds   REAL,
+    label     TEXT,
+    operator  TEXT,
+    timestamp REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_bib_time   ON runs (bib, time_float) WHERE time_float IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_runs_class_time ON runs (class, time_float) WHERE time_float IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_runs_rider_time ON runs (rider_key, time_float) WHERE time_float IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_runs_bib_event  ON runs (bib, event_id, run_no);
+CREATE INDEX IF NOT EXISTS idx_runs_event      ON runs (event_id);
+CREATE INDEX IF NOT EXISTS idx_riders_event    ON riders (event_id);
+CREATE INDEX IF NOT EXISTS idx_penalties_run   ON penalties (event_id, run_id);
+"""
+
+
+def _run_row(event_id, run_no, r):
+    is_mc = bool(r.get("is_mc"))
+    base = r.get("base_time")
+    is_dnf = base is not None and float(base) >= DNF_TIME
+    time_float = None if is_mc or is_dnf or base is None or r.get("is_dnf") else float(r["time_float"])
+    return (event_id, run_no, r.get("run_id"), str(r["bib"]), r.get("name"), r.get("class"), base,
+            r.get("penalty", 0), int(is_mc), int(is_dnf), time_float, r.get("penalty_text", ""), r.get("memo_text", ""),
+            rider_key(r["bib"], r.get("name")))
+
+
+def _migrate(conn):
+    # 版1 (大会は名前+日付で一意 / 選手はゼッケンのみ) のDBを版2へ。SCHEMA の索引を作る前に行う
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION: return
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(events)")]
+    if cols and "session" not in cols:
+        conn.execute("PRAGMA foreign_keys=OFF")   # 作り直しの間に runs 等が CASCADE で消えないように
+        with conn:
+            conn.execute("""CREATE TABLE events_v2 (event_id INTEGER PRIMARY KEY, name TEXT NOT NULL, date TEXT NOT NULL,
+                            session TEXT NOT NULL DEFAULT '', source TEXT, ingested_at REAL NOT NULL, UNIQUE (name, date, session))""")
+            conn.execute("INSERT INTO events_v2 (event_id, name, date, source, ingested_at) SELECT event_id, name, date, source, ingested_at FROM events")
+            conn.execute("DROP TABLE events")
+            conn.execute("ALTER TABLE events_v2 RENAME TO events")
+            conn.execute("ALTER TABLE runs ADD COLUMN rider_key TEXT")
+            conn.execute("UPDATE runs SET rider_key = bib || '|' || replace(replace(coalesce(name, ''), ' ', ''), '　', '')")
+        conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+
+def results_from_csv(path):
+    # on_save_csv_result で書き出したリザルトCSVを results_log 形式に戻す
+    records = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            try: base = float(row["ベースタイム"])
+            except (KeyError, ValueError): continue
+            is_mc = row.get("最終タイム") == "MC"
+            penalty = float(row.get("ペナルティ加算秒") or 0)
+            records.append({
+                "bib": row.get("ゼッケン", "?"), "name": row.get("名前", ""), "class": row.get("クラス", "-"),
+                "base_time": base, "penalty": penalty, "is_mc": is_mc,
+                "time_float": float("inf") if is_mc else round(base + penalty, 3),
+                "penalty_text": row.get("ペナルティ内容", ""), "memo_text": row.get("備考", ""),
+            })
+    return records
+
+
+class SeasonArchive:
+    def __init__(self, path=ARCHIVE_PATH, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()      # sqlite3 の接続はスレッドごとに持つ
+        self._write_lock = threading.Lock()
+        self._queue = None
+        if readonly: return
+        with self._write_lock:
+            conn = self._conn()
+            _migrate(conn)
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None and self.readonly:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        elif conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")      # 書き込み中でも読み取りを止めない
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ----------------------------------------------------------------
+    # 取り込み
+    # ----------------------------------------------------------------
+    def ingest_event(self, name, date, results_log, rider_database=None, audit_by_run=None, source="", session=""):
+        # audit_by_run: {run_id: [AuditEntry, ...]} / session: 同じ日の別セッションを区別する (同じセッションの再保存は置き換え)
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM events WHERE name = ? AND date = ? AND session = ?", (name, date, session))
+                event_id = conn.execute("INSERT INTO events (name, date, session, source, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                                        (name, date, session, source, time.time())).lastrowid
+                conn.executemany("INSERT INTO riders VALUES (?, ?, ?, ?, ?)",
+                                 ((event_id, tid, str(i.get("bib", "")), i.get("name"), i.get("class")) for tid, i in (rider_database or {}).items()))
+                conn.executemany("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (_run_row(event_id, n, r) for n, r in enumerate(results_log, 1)))
+                rows = []
+                for run_id, entries in (audit_by_run or {}).items():
+                    for entry in entries:
+                        ev = entry.event
+                        rows.append((event_id, run_id, entry.action, ev.kind, ev.seconds, ev.label, entry.operator, entry.timestamp))
+                conn.executemany("INSERT INTO penalties VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return event_id
+
+    def ingest_results_csv(self, path, name=None, date=None):
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        date = date or time.strftime("%Y-%m-%d", time.localtime(os.path.getmtime(path)))
+        return self.ingest_event(name, date, results_from_csv(path), source=path)
+
+    # ----------------------------------------------------------------
+    # 問い合わせ (戻り値は dict / dict のリスト)
+    # ----------------------------------------------------------------
+    def _all(self, sql, args=()):
+        return [dict(r) for r in self._conn().execute(sql, args)]
+
+    def events(self):
+        return self._all("SELECT e.*, (SELECT COUNT(*) FROM runs r WHERE r.event_id = e.event_id) AS runs FROM events e ORDER BY date, event_id")
+
+    def revision(self):
+        # 取り込み済み大会の (event_id, 取り込み時刻)。WALの中身も含めた「内容が変わったか」の判定用
+        return [(r["event_id"], r["ingested_at"]) for r in self._all("SELECT event_id, ingested_at FROM events ORDER BY event_id")]
+
+    def event_runs(self, event_id):
+        return self._all("SELECT * FROM runs WHERE event_id = ? ORDER BY run_no", (event_id,))
+
+    def best_by_rider(self):
+        # rider_key -> 全大会のベスト (記録判定用。クラス係数をかける前の ベース+ペナルティ)
+        return {r["rider_key"]: r["t"] for r in self._all("SELECT rider_key, ROUND(MIN(base_time + penalty), 3) AS t FROM runs WHERE time_float IS NOT NULL GROUP BY rider_key")}
+
+    def best_by_class(self):
+        return {r["class"]: r["t"] for r in self._all("SELECT class, ROUND(MIN(base_time + penalty), 3) AS t FROM runs WHERE time_float IS NOT NULL GROUP BY class")}
+
+    def personal_best(self, bib, name=None):
+        # 名前があればゼッケン+名前で引く (ゼッケンの使い回しで別人のPBを返さない)
+        where, args = ("r.rider_key = ?", rider_key(bib, name)) if name is not None else ("r.bib = ?", str(bib))
+        rows = self._all(f"""SELECT r.*, e.name AS event_name, e.date FROM runs r JOIN events e USING (event_id)
+                            WHERE {where} AND r.time_float IS NOT NULL ORDER BY r.time_float LIMIT 1""", (args,))
+        return rows[0] if rows else None
+
+    def class_record(self, r_class):
+        rows = self._all("""SELECT r.*, e.name AS event_name, e.date FROM runs r JOIN events e USING (event_id)
+                            WHERE r.class = ? AND r.time_float IS NOT NULL ORDER BY r.time_float LIMIT 1""", (r_class,))
+        return rows[0] if rows else None
+
+    def class_records(self):
+        # クラスごとの最速1件 (class, time_float のインデックスで各クラスの先頭だけを読む)
+        classes = [r["class"] for r in self._all("SELECT DISTINCT class FROM runs WHERE time_float IS NOT NULL")]
+        return {c: self.class_record(c) for c in classes}
+
+    def runs_for_bib(self, bib):
+        return self._all("""SELECT r.*, e.name AS event_name, e.date FROM runs r JOIN events e USING (event_id)
+                            WHERE r.bib = ? ORDER BY e.date, r.event_id, r.run_no""", (str(bib),))
+
+    def penalties_for_run(self, event_id, run_id):
+        return self._all("SELECT * FROM penalties WHERE event_id = ? AND run_id = ? ORDER BY timestamp", (event_id, run_id))
+
+    # ----------------------------------------------------------------
+    # バックグラウンド問い合わせ (GUI用)
+    # ----------------------------------------------------------------
+    def submit(self, method, *args, callback=None):
+        # 例: archive.submit("personal_best", "12", callback=lambda res, err: ...)
+        if self._queue is None:
+            self._queue = queue.Queue()
+            threading.Thread(target=self._worker, daemon=True).start()
+        self._queue.put((method, args, callback))
+
+    def _worker(self):
+        while True:
+            method, args, callback = self._queue.get()
+            try: result, err = getattr(self, method)(*args), None
+            except Exception as ex: result, err = None, ex
+            if callback:
+                try: callback(result, err)
+                except Exception: pass
+
+
+# ====================================================================
+# 取り込み・問い合わせ速度の確認: python season_archive.py [大会数] [1大会の走行数]
+# ====================================================================
+if __name__ == "__main__":
+    import random
+    import sys
+    import tempfile
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    rng = random.Random(1)
+    path = os.path.join(tempfile.mkdtemp(), "season.db")
+    archive = SeasonArchive(path)
+
+    t0 = time.perf_counter()
+    for ev in range(n_events):
+        log = []
+        for i in range(n_runs):
+            bib = str(rng.randrange(1, 150))
+            base = DNF_TIME if rng.random() < 0.02 else round(rng.uniform(30, 50), 3)
+            log.append({"bib": bib, "name": f"選手{bib}", "class": "ABCN"[int(bib) % 4], "base_time": base, "penalty": 0,
+                        "is_mc": rng.random() < 0.03, "time_float": base, "penalty_text": "", "memo_text": "", "run_id": f"ev{ev}-r{i}"})
+        archive.ingest_event(f"第{ev + 1}戦", f"2026-{ev // 4 + 1:02d}-{ev % 28 + 1:02d}", log)
+    ingest = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for bib in range(1, 150):
+        archive.personal_best(bib, f"選手{bib}")
+        archive.runs_for_bib(bib)
+    archive.class_records()
+    query = (time.perf_counter() - t0) / 149 * 1000
+    print(f"取り込み: {n_events}大会 x {n_runs}走 = {ingest:.2f}秒 / 問い合わせ (PB + 全走行): {query:.2f}ms/選手")
@@ -0,0 +1,186 @@
+# ====================================================================
+# MGTS - 長時間ソーク試験 (メモリリーク・処理遅延の検出)
+#  * 画面なしのページで MotoGymkhanaApp を起動し、board_emulator の仮想コースから
+#    実機と同じ UDP / シリアル行を流し込んで、1日分のイベントを倍速で再現する
+#  * アプリの時計 (app.clock) は仮想コースの時刻に差し替える (メモの期限切れなども倍速で起きる)
+#  * ゴールごとに処理時間を測り、一定間隔で tracemalloc の使用量と Flet コントロール数、
+#    ログ行数・未処理メモ数を記録する
+#  * 1走あたりのメモリ増加・ゴール処理時間 (p95) が予算を超えたら終了コード1で失敗
+#    (--no-tracemalloc: メモリ計測の負荷なしでゴール処理時間だけを見る)
+#
+#  使い方: python soak_test.py --hours 12 --speed 200
+# ====================================================================
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault("MGTS_TTS", "0")   # gui_main_voice の読み込み前に設定する
+
+import flet as ft
+
+from board_emulator import EventScheduler, PcLink, Course, RiderModel, EventSimulator, build_riders
+
+
+class SoakPage:
+    # ft.Page の代わり (画面には描画せず、update 回数だけ数える)
+    def __init__(self):
+        self.title, self.theme_mode, self.padding = "", None, 0
+        self.overlay, self.controls = [], []
+        self.updates = 0
+
+    def add(self, *controls): self.controls.extend(controls)
+    def update(self, *controls): self.updates += 1
+
+
+class LoopbackSerial:
+    # アプリがハブへ書いたコマンド (ENTRY 等) を仮想コースへ渡す
+    def __init__(self, sched, course):
+        self.sched, self.course = sched, course
+        self.is_open = True
+        self.in_waiting = 0
+
+    def write(self, data):
+        for line in data.decode("utf-8", "ignore").splitlines():
+            if line.strip(): self.sched.post(self.course.broadcast, line.strip())
+
+
+def count_controls(roots):
+    seen, stack, n = set(), list(roots), 0
+    while stack:
+        c = stack.pop()
+        if not isinstance(c, ft.Control) or id(c) in seen: continue
+        seen.add(id(c))
+        n += 1
+        for attr in ("controls", "tabs", "rows", "cells", "actions", "destinations", "columns"):
+            v = getattr(c, attr, None)
+            if isinstance(v, list): stack.extend(v)
+        for attr in ("content", "title", "label"):
+            v = getattr(c, attr, None)
+            if isinstance(v, ft.Control): stack.append(v)
+    return n
+
+
+def percentile(values, q):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_soak(hours=12.0, riders=120, speed=200.0, sample_every=50, mem_budget_kb=64.0, latency_budget_ms=100.0, seed=1, trace_memory=True):
+    import gui_main_voice as gui
+
+    workdir = tempfile.mkdtemp(prefix="mgts_soak_")
+    os.chdir(workdir)   # アーカイブ・オーバーレイの出力先を試験用ディレクトリにする
+    page = SoakPage()
+    app = gui.MotoGymkhanaApp(page)
+
+    sched = EventScheduler(speed)
+    epoch = time.time()
+    app.clock = lambda: epoch + sched.now_ms / 1000.0   # StartScheduler も app.clock を参照する
+    latencies, samples = [], []
+    state = {"finishes": 0}
+    lock = threading.Lock()
+
+    def sample():
+        current, peak = tracemalloc.get_traced_memory() if trace_memory else (0, 0)
+        samples.append({
+            "finishes": state["finishes"], "mem_kb": current / 1024, "peak_kb": peak / 1024,
+            "controls": count_controls(page.controls + page.overlay), "log_lines": len(app.log_box.controls),
+            "runner_notes": len(app.runner_notes), "results": len(app.results_log), "updates": page.updates,
+        })
+        s = samples[-1]
+        print(f"  [{s['finishes']:>5}走] mem {s['mem_kb'] / 1024:7.1f}MB  controls {s['controls']:>7}  log {s['log_lines']:>4}  notes {s['runner_notes']:>3}")
+
+    def sink(payload, source):
+        # 仮想コースからPCへ届くパケット。RESULT はUDP/シリアルの両方で届く (2回目は重複として捨てられる)
+        with lock:
+            if source == "SERIAL":
+                app.handle_serial_line(payload)
+                return
+            is_result = '"RESULT"' in payload
+            t0 = time.perf_counter()
+            app.process_incoming_packet(payload.encode(), "UDP")
+            if not is_result: return
+            latencies.append((time.perf_counter() - t0) * 1000)
+            state["finishes"] += 1
+            if state["finishes"] % sample_every == 0: sample()
+
+    link = PcLink(sink=sink)
+    course = Course(sched, link)
+    app.entry_dispatcher.targets = []          # UDP送信はせず、シリアル経由 (LoopbackSerial) だけで基板へ届ける
+    app.ser = LoopbackSerial(sched, course)
+
+    roster = build_riders(None, riders)
+    app.rider_database.update(roster)
+    app.update_rider_table()
+
+    rng = random.Random(seed)
+    runs_per_rider = max(1, int(hours * 3600 / 25.0 / riders))   # 1走 ≒ 25秒間隔
+    sim = EventSimulator(course, roster, RiderModel(rng), runs_per_rider, auto_entry=False,
+                         on_touch=lambda tag_id: app.on_nfc_connect(tag_id))
+    end_ms = sim.schedule()
+
+    print(f"🧪 ソーク試験: {riders}名 x {runs_per_rider}本 = {sim.planned}走 / 仮想 {end_ms / 3600000:.1f}時間 / {speed}倍速 / 作業ディレクトリ {workdir}")
+    if trace_memory: tracemalloc.start()
+    sample()
+    baseline = tracemalloc.take_snapshot() if trace_memory else None
+    started = time.monotonic()
+    sched.run()
+    real = time.monotonic() - started
+    sample()
+    final = tracemalloc.take_snapshot() if trace_memory else None
+    if trace_memory: tracemalloc.stop()
+
+    # 最初の1割は立ち上がり (キャッシュ・タブ生成など) として除外して1走あたりの増加を見る
+    warm = next((s for s in samples if s["finishes"] >= state["finishes"] * 0.1), samples[0])
+    last = samples[-1]
+    runs = max(last["finishes"] - warm["finishes"], 1)
+    mem_per_run = (last["mem_kb"] - warm["mem_kb"]) / runs
+    n = len(latencies)
+    p95_early, p95_late = percentile(latencies[:max(n // 10, 1)], 0.95), percentile(latencies[-max(n // 10, 1):], 0.95)
+
+    print(f"\n⏱️ 実時間 {real:.0f}秒 / ゴール {state['finishes']}件 / page.update {page.updates}回")
+    if trace_memory: print(f"📈 メモリ増加: {mem_per_run:.1f} KB/走 (予算 {mem_budget_kb} KB) / コントロール {warm['controls']} -> {last['controls']}")
+    print(f"📈 未処理メモ: 最大 {max(s['runner_notes'] for s in samples)}件 -> 終了時 {last['runner_notes']}件 (期限 {gui.RUNNER_NOTE_TTL}秒)")
+    print(f"📈 ゴール処理 p95: 序盤 {p95_early:.1f}ms -> 終盤 {p95_late:.1f}ms (予算 {latency_budget_ms}ms)")
+    if trace_memory:
+        print("🔎 増加の大きい行:")
+        for stat in final.compare_to(baseline, "lineno")[:10]: print(f"   {stat}")
+
+    with open(os.path.join(workdir, "soak_samples.json"), "w", encoding="utf-8") as f:
+        json.dump({"samples": samples, "latencies_ms": latencies}, f)
+
+    failures = []
+    if trace_memory and mem_per_run > mem_budget_kb: failures.append(f"メモリ {mem_per_run:.1f} KB/走 > {mem_budget_kb} KB")
+    if p95_late > latency_budget_ms: failures.append(f"ゴール処理 p95 {p95_late:.1f}ms > {latency_budget_ms}ms")
+    if last["log_lines"] > gui.LOG_MAX_LINES: failures.append(f"ログ行数 {last['log_lines']} > {gui.LOG_MAX_LINES}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MGTS 長時間ソーク試験")
+    parser.add_argument("--hours", type=float, default=12.0, help="再現するイベント時間 (仮想)")
+    parser.add_argument("--riders", type=int, default=120)
+    parser.add_argument("--speed", type=float, default=200.0, help="仮想時間の倍速")
+    parser.add_argument("--sample-every", type=int, default=50, help="何走ごとにメモリ・コントロール数を記録するか")
+    parser.add_argument("--mem-budget-kb", type=float, default=64.0, help="1走あたりのメモリ増加の上限")
+    parser.add_argument("--latency-budget-ms", type=float, default=100.0, help="ゴール処理時間 (終盤p95) の上限")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="メモリを計測しない (ゴール処理時間を計測負荷なしで見る)")
+    args = parser.parse_args()
+
+    failures = run_soak(args.hours, args.riders, args.speed, args.sample_every, args.mem_budget_kb, args.latency_budget_ms, args.seed, not args.no_tracemalloc)
+    if failures:
+        print("\n❌ 失敗: " + " / ".join(failures))
+        sys.exit(1)
+    print("\n✅ 予算内で完了")
+
+
+if __name__ == "__main__":
+    main()
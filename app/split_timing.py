@@ -0,0 +1,102 @@
+# ====================================================================
+# MGTS - 区間タイム (中間計測センサー)
+#  * メイン基板からの SPLIT {id, sector, time(スタートからの経過秒)} を走行中の
+#    選手に紐付け、RESULT 受信時に区間タイムとして確定する
+#      区間1 = スタート〜SPLIT1, 区間k = SPLIT(k-1)〜SPLITk, 最終区間 = 最後のSPLIT〜ゴール
+#  * 区間ごとのベスト・選手ごとの区間ベスト・区間順位・理論ベストを差分だけで更新する
+#    (区間順位は選手ベストのソート済みリストを bisect で更新)
+#  * SPLIT を取りこぼした走行は、つながらない区間だけを記録しない
+#  * UDP とハブ経由で同じ SPLIT が2回届くため、走行中の (選手, SPLIT番号) は最初の1回だけを採る
+# ====================================================================
+import bisect
+import threading
+import time
+
+SPLIT_TTL = 600      # ゴールしなかった走行の途中経過を捨てるまでの秒数
+
+
+class SplitBoard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.n_splits = 0          # これまでに見た最大の SPLIT 番号 (= 中間センサー数)
+        self._running = {}         # rider_id -> [受信時刻, {split番号: 経過秒}]
+        self.rider_best = {}       # bib -> {区間: ベスト}
+        self.sector_best = {}      # 区間 -> (タイム, bib)
+        self._ranked = {}          # 区間 -> ソート済み [(選手ベスト, bib)]
+
+    # ----------------------------------------------------------------
+    # 受信
+    # ----------------------------------------------------------------
+    def on_split(self, rider_id, split_no, elapsed, now=None):
+        # 戻り値: (区間番号, 区間タイム or None, その区間の全体ベスト or None)。二重受信は None
+        if split_no < 1: return split_no, None, None
+        now = time.time() if now is None else now
+        with self._lock:
+            if split_no > self.n_splits: self.n_splits = split_no
+            for rid in [r for r, (ts, _) in self._running.items() if now - ts > SPLIT_TTL]: del self._running[rid]
+            run = self._running.setdefault(rider_id, [now, {}])
+            if split_no in run[1]: return None
+            run[0] = now
+            run[1][split_no] = elapsed
+            best = self.sector_best.get(split_no)
+            return split_no, self._sector_time(run[1], split_no), best[0] if best else None
+
+    def _sector_time(self, points, sector):
+        # 区間 sector の終点は SPLIT sector (最終区間はゴール)、始点は SPLIT sector-1 (区間1はスタート)
+        end = points.get(sector)
+        start = 0.0 if sector == 1 else points.get(sector - 1)
+        if end is None or start is None or end <= start: return None
+        return round(end - start, 3)
+
+    def on_finish(self, rider_id, bib, run_time):
+        # 戻り値: [区間1, 区間2, ...] (記録できなかった区間は None)。中間センサーがなければ []
+        with self._lock:
+            run = self._running.pop(rider_id, None)
+            if run is None or not self.n_splits or run_time is None: return []
+            points = run[1]
+            points[self.n_splits + 1] = run_time
+            sectors = [self._sector_time(points, k) for k in range(1, self.n_splits + 2)]
+            for k, t in enumerate(sectors, 1):
+                if t is not None: self._update_sector(bib, k, t)
+            return sectors
+
+    def discard(self, rider_id):
+        with self._lock: self._running.pop(rider_id, None)
+
+    def _update_sector(self, bib, sector, t):
+        # 呼び出し側でロック済み。選手ベストが縮んだ時だけ区間順位のリストを入れ替える
+        best = self.rider_best.setdefault(bib, {})
+        old = best.get(sector)
+        if old is not None and old <= t: return
+        best[sector] = t
+        ranked = self._ranked.setdefault(sector, [])
+        if old is not None: del ranked[bisect.bisect_left(ranked, (old, bib))]
+        bisect.insort(ranked, (t, bib))
+        if sector not in self.sector_best or t < self.sector_best[sector][0]: self.sector_best[sector] = (t, bib)
+
+    # ----------------------------------------------------------------
+    # 参照
+    # ----------------------------------------------------------------
+    def sector_rank(self, bib, sector):
+        with self._lock:
+            t = self.rider_best.get(bib, {}).get(sector)
+            if t is None: return None
+            return bisect.bisect_left(self._ranked[sector], (t, "")) + 1
+
+    def sector_ranking(self, sector, n=10):
+        with self._lock: return self._ranked.get(sector, [])[:n]
+
+    def theoretical_best(self, bib=None):
+        # bib 指定: その選手の区間ベストの合計 / 省略: 全選手の区間ベストの合計。全区間そろわなければ None
+        with self._lock:
+            sectors = range(1, self.n_splits + 2)
+            if bib is None:
+                if any(k not in self.sector_best for k in sectors): return None
+                return round(sum(self.sector_best[k][0] for k in sectors), 3)
+            best = self.rider_best.get(bib, {})
+            if any(k not in best for k in sectors): return None
+            return round(sum(best[k] for k in sectors), 3)
+
+
+def describe_sectors(sectors):
+    return "区間 " + " / ".join("-" if t is None else f"{t:.3f}" for t in sectors) if sectors else ""
@@ -0,0 +1,161 @@
+# ====================================================================
+# MGTS - 出走順スケジューラ
+#  * 名簿と直近の走行タイムから出走待ち列を組み、各選手のスタート予定時刻を見積もる
+#  * メイン基板は STOP を「一番先にスタートした選手」に割り当てるため、コース内での
+#    追い越しは計測ミスになる。予測タイムの速い順に並べ、前走者より先にゴール
+#    しない最短間隔でスタートさせる (クラスごとにまとめることもできる)
+#  * ゴールから次のスタートまでコースが空いた時間 (アイドル) と、1時間あたりの
+#    走行数を記録する
+# ====================================================================
+import threading
+import time
+from collections import deque
+
+from roster import rider_key
+
+SIGNAL_GREEN_SEC = 5.0      # SEQ_START から青信号まで (signal_board.ino)
+DEFAULT_RUN_SEC = 40.0      # タイム実績のない選手の見込み
+
+
+class StartScheduler:
+    def __init__(self, runs_per_rider=2, min_gap=12.0, finish_margin=3.0, group_by_class=False, recent=3, window_sec=3600, clock=time.time):
+        self.clock = clock                  # now を省略した時の時計 (ソーク試験では仮想時計に差し替える)
+        self.runs_per_rider = runs_per_rider
+        self.min_gap = min_gap              # スタート間隔の下限 (エントリー〜シグナル〜発進)
+        self.finish_margin = finish_margin  # 前走者のゴールから空ける時間 (TIMING_GUARD_MS 相当)
+        self.group_by_class = group_by_class
+        self.window_sec = window_sec
+        self._lock = threading.Lock()
+        self.riders = {}                    # tag_id -> 名簿情報
+        self.recent = {}                    # tag_id -> deque(直近タイム)
+        self._recent_len = recent
+        self.seed_times = {}                # rider_key -> 過去のベスト (record_index など)
+        self.runs_done = {}                 # tag_id -> 走行数
+        self.on_deck = []                   # エントリー済み・未スタート
+        self.on_course = {}                 # tag_id -> スタート時刻 (挿入順 = スタート順)
+        self._order = None                  # 出走待ち列のキャッシュ
+        self.last_start = None              # (tag_id, 時刻)
+        self.idle_since = None              # コースが空になった時刻
+        self.idle_gaps = []
+        self.finishes = deque()             # 直近 window_sec のゴール時刻
+        self.total_runs = 0
+        self.first_start = None
+
+    # ----------------------------------------------------------------
+    # 入力
+    # ----------------------------------------------------------------
+    def set_roster(self, riders, seed_times=None):
+        with self._lock:
+            self.riders = dict(riders)
+            if seed_times is not None: self.seed_times = dict(seed_times)
+            self._order = None
+
+    def on_entry(self, tag_id, now=None):
+        # NFC受付・ENTRY_ACK の両方から呼ばれる (同じエントリーは1回、スタート済みの選手は並べ直さない)
+        with self._lock:
+            if tag_id not in self.on_deck and tag_id not in self.on_course: self.on_deck.append(tag_id)
+            self._order = None
+
+    def on_signal(self, now=None):
+        # SEQ_START: 実スタート (REACTION/FLYING) が来るまでは青信号の時刻をスタートとみなす
+        now = self.clock() if now is None else now
+        with self._lock:
+            if self.on_deck: self._start(self.on_deck[0], now + SIGNAL_GREEN_SEC)
+
+    def on_start(self, tag_id, now=None):
+        now = self.clock() if now is None else now
+        with self._lock:
+            if tag_id in self.on_course: self.on_course[tag_id] = now   # 見込み時刻を実測で置き換える
+            else: self._start(tag_id, now)
+
+    def _start(self, tag_id, at):
+        if tag_id in self.on_deck: self.on_deck.remove(tag_id)
+        self.on_course[tag_id] = at
+        self.last_start = (tag_id, at)
+        if self.first_start is None: self.first_start = at
+        if self.idle_since is not None:
+            self.idle_gaps.append(max(0.0, at - self.idle_since))
+            self.idle_since = None
+
+    def on_finish(self, tag_id, run_time=None, now=None):
+        now = self.clock() if now is None else now
+        with self._lock:
+            self.on_course.pop(tag_id, None)
+            if tag_id in self.on_deck: self.on_deck.remove(tag_id)   # スタート通知を取りこぼした場合
+            self.runs_done[tag_id] = self.runs_done.get(tag_id, 0) + 1
+            if run_time is not None and run_time < 999:
+                self.recent.setdefault(tag_id, deque(maxlen=self._recent_len)).append(run_time)
+            self.total_runs += 1
+            self.finishes.append(now)
+            while self.finishes and now - self.finishes[0] > self.window_sec: self.finishes.popleft()
+            if not self.on_course and self.idle_since is None: self.idle_since = now
+            self._order = None
+
+    def on_reset(self, now=None):
+        # FORCE_DNF: コース上と待機列をクリア (アプリ側の active_runners.clear() に合わせる)
+        now = self.clock() if now is None else now
+        with self._lock:
+            self.on_course.clear()
+            self.on_deck.clear()
+            if self.idle_since is None: self.idle_since = now
+            self._order = None
+
+    # ----------------------------------------------------------------
+    # 予測
+    # ----------------------------------------------------------------
+    def predict(self, tag_id):
+        times = self.recent.get(tag_id)
+        if times: return sum(times) / len(times)
+        info = self.riders.get(tag_id, {})
+        seed = self.seed_times.get(rider_key(info.get("bib"), info.get("name")))
+        return seed * 1.05 if seed else DEFAULT_RUN_SEC
+
+    def queue(self):
+        # 出走待ち列 (エントリー済み・コース上・規定本数を走り終えた選手は除く)
+        with self._lock:
+            if self._order is None:
+                busy = set(self.on_deck) | set(self.on_course)
+                waiting = [t for t in self.riders if t not in busy and self.runs_done.get(t, 0) < self.runs_per_rider]
+                # 走行数の少ない選手を先に、その中で予測タイムの速い順 (追い越しが起きない並び)
+                if self.group_by_class: key = lambda t: (self.runs_done.get(t, 0), self.riders[t].get("class", ""), self.predict(t))
+                else: key = lambda t: (self.runs_done.get(t, 0), self.predict(t))
+                self._order = sorted(waiting, key=key)
+            return list(self._order)
+
+    def upcoming(self, n=8, now=None):
+        # 戻り値: [(tag_id, スタート予定時刻, 予測タイム)] エントリー済みの選手から順に
+        now = self.clock() if now is None else now
+        order = self.queue()
+        with self._lock:
+            prev_start, prev_finish = None, None
+            for tag_id, started in self.on_course.items():
+                finish = started + self.predict(tag_id)
+                prev_start = started if prev_start is None else max(prev_start, started)
+                prev_finish = finish if prev_finish is None else max(prev_finish, finish)
+            plan = []
+            for tag_id in (self.on_deck + order)[:n]:
+                t_run = self.predict(tag_id)
+                eta = now
+                if prev_start is not None: eta = max(eta, prev_start + self.min_gap)
+                if prev_finish is not None: eta = max(eta, prev_finish + self.finish_margin - t_run)
+                plan.append((tag_id, eta, t_run))
+                prev_start, prev_finish = eta, eta + t_run
+            return plan
+
+    def course_clear_at(self, now=None):
+        now = self.clock() if now is None else now
+        with self._lock:
+            return max([s + self.predict(t) for t, s in self.on_course.items()] or [now])
+
+    def stats(self, now=None):
+        now = self.clock() if now is None else now
+        with self._lock:
+            elapsed_h = (now - self.first_start) / 3600.0 if self.first_start else 0.0
+            gaps = self.idle_gaps
+            return {
+                "runs": self.total_runs,
+                "runs_per_hour": self.total_runs / elapsed_h if elapsed_h > 0.01 else 0.0,
+                "runs_last_hour": len(self.finishes),
+                "idle_avg": sum(gaps) / len(gaps) if gaps else 0.0,
+                "idle_total": sum(gaps) + (now - self.idle_since if self.idle_since else 0.0),
+            }
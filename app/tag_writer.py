@@ -1,12 +1,21 @@
+import argparse
+import csv
+import os
+import time
+
 import nfc
 import ndef
-import time
 
-def main():
+from roster import read_roster_lines, parse_roster_lines
+
+MANIFEST_HEADER = ["日時", "タグID", "ゼッケン", "名前", "クラス", "タグUID", "タグ種別", "結果", "所要秒"]
+
+
+def interactive():
     print("=======================================")
     print(" 🏍️ MGTS - NFCタグ 事前プロビジョニングツール")
     print("=======================================")
-    
+
     while True:
         target_id = input("\n📝 書き込むIDを入力してください (例: A001) / 終了は 'q': ").strip().upper()
         if target_id == 'Q':
@@ -20,7 +29,7 @@ def main():
             try:
                 # NDEFテキストレコードの作成
                 record = ndef.TextRecord(target_id)
-                
+
                 # タグに書き込み
                 if tag.ndef is not None:
                     tag.ndef.records = [record]
@@ -34,7 +43,110 @@ def main():
         # タグが離れるまで待機してから次へ
         with nfc.ContactlessFrontend('usb') as clf:
             clf.connect(rdwr={'on-connect': on_connect})
-            time.sleep(1) 
+            time.sleep(1)
+
+
+# ====================================================================
+# 一括プロビジョニング (名簿CSV -> タグ)
+# ====================================================================
+def current_tag_id(tag):
+    if tag.ndef and tag.ndef.records and isinstance(tag.ndef.records[0], ndef.TextRecord): return tag.ndef.records[0].text.strip().upper()
+    return ""
+
+
+def provision_tag(tag, target_id, done_ids, skip_wrong):
+    # 戻り値: (結果, 補足)  結果 = written / already / skipped / duplicate / error
+    if tag.ndef is None: return "error", "NDEF非対応タグ"
+    existing = current_tag_id(tag)
+    if existing == target_id: return "already", ""
+    if existing and existing in done_ids: return "duplicate", existing   # この名簿で書き込み済みのタグを再度かざした
+    if existing and skip_wrong: return "skipped", existing
+
+    if not tag.ndef.is_writeable: return "error", "書き込み禁止タグ"
+    tag.ndef.records = [ndef.TextRecord(target_id)]
+    # 書き込み後にタグから読み直して照合する (has_changed はタグ上のデータを再取得する)
+    if tag.ndef.has_changed or current_tag_id(tag) != target_id: return "error", "照合失敗"
+    return "written", existing
+
+
+def load_manifest_done(manifest_path):
+    done = set()
+    if not os.path.exists(manifest_path): return done
+    with open(manifest_path, encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("結果") in ("written", "already"): done.add(row["タグID"])
+    return done
+
+
+def batch(roster_path, manifest_path, device, skip_wrong):
+    riders, error_count = parse_roster_lines(read_roster_lines(roster_path))
+    done_ids = load_manifest_done(manifest_path)
+    queue = [tid for tid in riders if tid not in done_ids]
+
+    print("=======================================")
+    print(" 🏍️ MGTS - NFCタグ 一括プロビジョニング")
+    print("=======================================")
+    print(f"📁 名簿: {len(riders)}名 (エラー行 {error_count}件) / 済み {len(riders) - len(queue)}件 / 残り {len(queue)}件")
+    if not queue: return
+
+    write_header = not os.path.exists(manifest_path)
+    started = time.monotonic()
+    provisioned = 0
+    with open(manifest_path, "a", encoding="utf-8-sig", newline="") as mf, nfc.ContactlessFrontend(device) as clf:
+        writer = csv.writer(mf)
+        if write_header: writer.writerow(MANIFEST_HEADER)
+
+        idx = 0
+        while idx < len(queue):
+            target_id = queue[idx]
+            rider = riders[target_id]
+            print(f"\n[{idx + 1}/{len(queue)}] 📡 {target_id} (No.{rider['bib']} {rider['name']}) -> タグをかざしてください")
+            result = {}
+
+            def on_connect(tag):
+                t0 = time.monotonic()
+                try:
+                    status, detail = provision_tag(tag, target_id, done_ids, skip_wrong)
+                except Exception as e:
+                    status, detail = "error", str(e)
+                result.update(status=status, detail=detail, uid=tag.identifier.hex().upper(), type=str(tag.type), sec=time.monotonic() - t0)
+                return True   # タグが離れるまで待つ (同じタグの二重処理を防ぐ)
+
+            # リーダーは開いたまま、タグごとに connect だけを繰り返す
+            if not clf.connect(rdwr={'on-connect': on_connect}): break
+            status = result.get("status", "error")
+            writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S"), target_id, rider["bib"], rider["name"], rider["class"],
+                             result.get("uid", ""), result.get("type", ""), status, f"{result.get('sec', 0):.2f}"])
+            mf.flush()
+
+            if status in ("written", "already"):
+                done_ids.add(target_id)
+                provisioned += 1
+                idx += 1
+                rate = provisioned / max((time.monotonic() - started) / 60.0, 1e-9)
+                label = "✅ 書き込み・照合OK" if status == "written" else "⏭️ 書き込み済み (スキップ)"
+                print(f"{label}: [{target_id}] ({rate:.1f} 枚/分)")
+            elif status == "duplicate":
+                print(f"⚠️ このタグは既に [{result['detail']}] として書き込み済みです。別のタグをかざしてください")
+            elif status == "skipped":
+                print(f"⏭️ 別のID [{result['detail']}] が書かれたタグのためスキップしました (--skip-wrong)")
+            else:
+                print(f"❌ 失敗: {result.get('detail', '')} -> 同じIDで再試行します")
+
+    elapsed = (time.monotonic() - started) / 60.0
+    print(f"\n🏁 完了: {provisioned}枚 / {elapsed:.1f}分 ({provisioned / max(elapsed, 1e-9):.1f} 枚/分) / マニフェスト: {manifest_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MGTS NFCタグ プロビジョニングツール")
+    parser.add_argument("--batch", metavar="ROSTER_CSV", help="名簿CSV (GUIで読み込むものと同じ形式) から一括書き込み")
+    parser.add_argument("--manifest", default="provisioning_manifest.csv", help="プロビジョニング記録の出力先 (既存なら続きから再開)")
+    parser.add_argument("--device", default="usb", help="nfcpy のデバイスパス")
+    parser.add_argument("--skip-wrong", action="store_true", help="別のIDが書かれたタグは上書きせずスキップする")
+    args = parser.parse_args()
+
+    if args.batch: batch(args.batch, args.manifest, args.device, args.skip_wrong)
+    else: interactive()
 
 if __name__ == '__main__':
     main()
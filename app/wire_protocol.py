@@ -0,0 +1,151 @@
+# ====================================================================
+# MGTS - バイナリ通信フォーマット (JSONパケットと併用)
+#
+#  [ヘッダ 20byte / リトルエンディアン]
+#   magic   2s  b"MG"
+#   version B   WIRE_VERSION
+#   type    B   メッセージ種別コード (MSG_TYPES)
+#   node    H   送信元ノード番号 (NODE_*)
+#   seq     I   送信元ごとの通し番号
+#   ts_us   Q   送信元の時刻 (マイクロ秒, 起動からの経過で可)
+#   length  H   ペイロード長
+#  [ペイロード] 種別ごとの固定レイアウト (PAYLOADS)
+#
+#  * 先頭2byteが b"MG" ならバイナリ、それ以外は従来どおりJSONとして解釈する
+#  * バイナリは memoryview + struct.unpack_from でコピーせずに読む
+#  * 戻り値は従来のJSONと同じキー構成の dict (process_incoming_packet をそのまま使える)
+# ====================================================================
+import json
+import random
+import struct
+
+WIRE_MAGIC = b"MG"
+WIRE_VERSION = 1
+HEADER = struct.Struct("<2sBBHIQH")
+
+NODE_PC, NODE_MAIN, NODE_START, NODE_STOP, NODE_SIGNAL, NODE_HUB, NODE_NFC = 0, 1, 2, 3, 4, 5, 6
+
+MSG_TYPES = {
+    1: "RESULT", 2: "ENTRY", 3: "ENTRY_ACK", 4: "SEQ_START", 5: "FORCE_DNF",
+    6: "REACTION", 7: "FLYING", 8: "START", 9: "STOP", 10: "SPLIT",
+    11: "HEARTBEAT",
+}
+MSG_CODES = {name: code for code, name in MSG_TYPES.items()}
+
+# 種別 -> (ペイロード構造, [(JSONキー, デコード関数, エンコード関数)])
+_ID = ("id", lambda b: b.rstrip(b"\0").decode("ascii", "replace"), lambda s: str(s).encode("ascii", "replace")[:8])
+_MS = lambda key: (key, lambda v: v / 1000.0, lambda f: int(round(float(f) * 1000)))
+PAYLOADS = {
+    "RESULT":    (struct.Struct("<8sI"), [_ID, _MS("time")]),
+    "ENTRY":     (struct.Struct("<8s"), [_ID]),
+    "ENTRY_ACK": (struct.Struct("<8s"), [_ID]),
+    "SEQ_START": (struct.Struct("<"), []),
+    "FORCE_DNF": (struct.Struct("<"), []),
+    "REACTION":  (struct.Struct("<8si"), [_ID, _MS("diff")]),
+    "FLYING":    (struct.Struct("<8si"), [_ID, _MS("diff")]),
+    "START":     (struct.Struct("<"), []),
+    "STOP":      (struct.Struct("<"), []),
+    "SPLIT":     (struct.Struct("<8sBI"), [_ID, ("sector", int, int), _MS("time")]),
+    "HEARTBEAT": (struct.Struct("<"), []),   # ノード番号・通し番号はヘッダ (JSONでは {"node", "seq"})
+}
+
+# 種別コード -> デコードに必要なものを事前展開 (パケットごとの辞書引きを減らす)
+_DECODERS = {code: (name, PAYLOADS[name][0].size, PAYLOADS[name][0].unpack_from, [(k, d) for k, d, _ in PAYLOADS[name][1]]) for code, name in MSG_TYPES.items()}
+_unpack_header = HEADER.unpack_from
+
+
+class WireError(ValueError):
+    pass
+
+
+def is_binary(raw):
+    return isinstance(raw, (bytes, bytearray, memoryview)) and bytes(raw[:2]) == WIRE_MAGIC
+
+
+def decode_binary(raw):
+    buf = memoryview(raw)
+    if len(buf) < HEADER.size: raise WireError("short header")
+    magic, version, code, node, seq, ts_us, length = _unpack_header(buf, 0)
+    if magic != WIRE_MAGIC: raise WireError("bad magic")
+    if version != WIRE_VERSION: raise WireError(f"unsupported version {version}")
+    decoder = _DECODERS.get(code)
+    if decoder is None: raise WireError(f"unknown type {code}")
+    name, size, unpack, fields = decoder
+    if length != size or len(buf) < HEADER.size + length: raise WireError("bad length")
+
+    msg = {"type": name, "node": node, "seq": seq, "ts_us": ts_us, "v": version}
+    for (key, dec), value in zip(fields, unpack(buf, HEADER.size)):
+        msg[key] = dec(value)
+    return msg
+
+
+def encode_binary(msg_type, node=NODE_PC, seq=0, ts_us=0, **fields):
+    layout, spec = PAYLOADS[msg_type]
+    payload = layout.pack(*(enc(fields[key]) for key, _, enc in spec))
+    return HEADER.pack(WIRE_MAGIC, WIRE_VERSION, MSG_CODES[msg_type], node, seq & 0xFFFFFFFF, ts_us, len(payload)) + payload
+
+
+def sensor_trigger(raw):
+    # センサーノードが有線LANへ流す生文字列 ("START" / "STOP" / "SPLIT:n") ならその文字列、違えば None
+    text = raw.decode("utf-8", "ignore") if isinstance(raw, (bytes, bytearray, memoryview)) else raw
+    text = text.strip()
+    return text if text in ("START", "STOP") or (text.startswith("SPLIT:") and text[6:].isdigit()) else None
+
+
+def decode_packet(raw):
+    # バイナリ / JSON を自動判別して dict を返す。解釈できなければ None
+    try:
+        if is_binary(raw): return decode_binary(raw)
+        text = raw.decode("utf-8", "ignore") if isinstance(raw, (bytes, bytearray, memoryview)) else raw
+        data = json.loads(text.strip())
+        return data if isinstance(data, dict) else None
+    except (WireError, ValueError, RecursionError, struct.error):
+        return None
+
+
+# ====================================================================
+# ファズテスト: python wire_protocol.py
+#  ランダム列・正規パケットの変異 (ビット反転/切り詰め/延長) を与え、
+#  デコーダが例外を漏らさず、正規パケットは往復で一致することを確認する
+# ====================================================================
+def _sample_packets(rng):
+    for name in MSG_TYPES.values():
+        _, spec = PAYLOADS[name]
+        fields = {}
+        for key, _, _ in spec:
+            fields[key] = f"A{rng.randrange(1000):03d}" if key == "id" else round(rng.uniform(0, 999.999), 3)
+        if name in ("REACTION", "FLYING"): fields["diff"] = round(rng.uniform(-2, 2), 3)
+        if name == "SPLIT": fields["sector"] = rng.randrange(1, 9)
+        yield name, fields, encode_binary(name, node=rng.randrange(7), seq=rng.randrange(1 << 32), ts_us=rng.randrange(1 << 40), **fields)
+
+
+def fuzz_decoder(iterations=200000, seed=0):
+    rng = random.Random(seed)
+    samples = list(_sample_packets(rng))
+    for name, fields, pkt in samples:
+        msg = decode_packet(pkt)
+        assert msg and msg["type"] == name, name
+        for key, value in fields.items():
+            assert (msg[key] == value) if key == "id" else abs(msg[key] - value) < 0.0005, (name, key)
+
+    accepted = 0
+    for i in range(iterations):
+        _, _, base = samples[i % len(samples)]
+        mode = i % 4
+        if mode == 0: data = bytes(rng.randrange(256) for _ in range(rng.randrange(48)))
+        elif mode == 1: data = base[:rng.randrange(len(base) + 1)]
+        elif mode == 2: data = base + bytes(rng.randrange(256) for _ in range(rng.randrange(1, 8)))
+        else:
+            b = bytearray(base)
+            for _ in range(rng.randrange(1, 4)): b[rng.randrange(len(b))] ^= 1 << rng.randrange(8)
+            data = bytes(b)
+        msg = decode_packet(data)   # 例外が漏れたらここで落ちる
+        assert msg is None or isinstance(msg, dict)
+        if msg is not None: accepted += 1
+    return accepted
+
+
+if __name__ == "__main__":
+    n = 200000
+    accepted = fuzz_decoder(n)
+    print(f"✅ ファズテスト完了: {n}件 (うち受理 {accepted}件) / 例外なし")
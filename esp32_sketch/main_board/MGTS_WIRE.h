@@ -0,0 +1,79 @@
+// MGTS_WIRE.h
+// PC向けバイナリ通信フォーマット (app/wire_protocol.py と同一レイアウト / リトルエンディアン)
+#ifndef MGTS_WIRE_H
+#define MGTS_WIRE_H
+
+#include <Arduino.h>
+
+#define MGTS_WIRE_VERSION 1
+
+// メッセージ種別コード
+enum MgtsMsgType : uint8_t {
+  MGTS_RESULT = 1, MGTS_ENTRY = 2, MGTS_ENTRY_ACK = 3, MGTS_SEQ_START = 4, MGTS_FORCE_DNF = 5,
+  MGTS_REACTION = 6, MGTS_FLYING = 7, MGTS_START = 8, MGTS_STOP = 9,
+  MGTS_SPLIT = 10, MGTS_HEARTBEAT = 11   // HEARTBEAT はペイロードなし (ノード番号・通し番号はヘッダ)
+};
+
+// 送信元ノード番号
+enum MgtsNode : uint16_t {
+  MGTS_NODE_PC = 0, MGTS_NODE_MAIN = 1, MGTS_NODE_START = 2, MGTS_NODE_STOP = 3,
+  MGTS_NODE_SIGNAL = 4, MGTS_NODE_HUB = 5, MGTS_NODE_NFC = 6
+};
+
+struct __attribute__((packed)) MgtsHeader {
+  char magic[2];       // "MG"
+  uint8_t version;
+  uint8_t type;
+  uint16_t node;
+  uint32_t seq;
+  uint64_t tsUs;
+  uint16_t length;     // ペイロード長
+};
+
+struct __attribute__((packed)) MgtsResultPacket {
+  MgtsHeader h;
+  char id[8];          // 末尾は0埋め
+  uint32_t timeMs;
+};
+
+struct __attribute__((packed)) MgtsSplitPacket {
+  MgtsHeader h;
+  char id[8];
+  uint8_t sector;      // 中間計測センサー番号 (1〜)
+  uint32_t timeMs;     // スタートからの経過
+};
+
+static uint32_t mgtsWireSeq = 0;
+
+static inline void mgtsFillHeader(MgtsHeader &h, uint8_t type, uint16_t node, uint16_t length) {
+  h.magic[0] = 'M'; h.magic[1] = 'G';
+  h.version = MGTS_WIRE_VERSION;
+  h.type = type;
+  h.node = node;
+  h.seq = ++mgtsWireSeq;
+  h.tsUs = (uint64_t)esp_timer_get_time();
+  h.length = length;
+}
+
+// RESULTパケットを組み立てる (String連結もJSON生成も不要)
+// ヘッダで定義するため static inline (複数の .cpp / .ino から読み込んでも重複定義にならない)
+static inline MgtsResultPacket buildResultPacket(const String &id, float timeValue, uint16_t node) {
+  MgtsResultPacket p;
+  memset(&p, 0, sizeof(p));
+  mgtsFillHeader(p.h, MGTS_RESULT, node, sizeof(MgtsResultPacket) - sizeof(MgtsHeader));
+  strncpy(p.id, id.c_str(), sizeof(p.id));
+  p.timeMs = (uint32_t)(timeValue * 1000.0f + 0.5f);
+  return p;
+}
+
+static inline MgtsSplitPacket buildSplitPacket(const String &id, uint8_t sector, unsigned long elapsedMs, uint16_t node) {
+  MgtsSplitPacket p;
+  memset(&p, 0, sizeof(p));
+  mgtsFillHeader(p.h, MGTS_SPLIT, node, sizeof(MgtsSplitPacket) - sizeof(MgtsHeader));
+  strncpy(p.id, id.c_str(), sizeof(p.id));
+  p.sector = sector;
+  p.timeMs = (uint32_t)elapsedMs;
+  return p;
+}
+
+#endif
@@ -24,6 +24,7 @@
 #include <Adafruit_NeoPixel.h>
 #include <vector>
 #include <ArduinoJson.h>
+#include "MGTS_WIRE.h"
 
 /* ====================================================================
  * L3 ネットワーク構成 (有線LAN / W5500)
@@ -41,6 +42,7 @@ uint8_t hubAddress[] = {0x58, 0xE6, 0xC5, 0x12, 0x97, 0xCC};
 // システム・ガードタイム設定
 const unsigned long TIMING_GUARD_MS = 3000; // チャタリング・不正連続入力防止 (ms)
 const unsigned long DELAY_SEND_MS = 1000;   // PCへの非同期遅延送信のディレイ時間 (ms)
+const bool USE_BINARY_WIRE = false;         // true: 有線LANのRESULTをバイナリ形式 (MGTS_WIRE.h) で送信
 
 /* ====================================================================
  * ハードウェア・ピン定義
@@ -64,14 +66,17 @@ char packetBuffer[512];
 /* ====================================================================
  * 計測データ構造・ステート管理
  * ==================================================================== */
-struct Runner { String id; unsigned long startMillis; float result; bool isDnf; };
+struct Runner { String id; unsigned long startMillis; float result; bool isDnf; int splitsPassed; };
 std::vector<Runner> runners;         
 String nextRiderID = "X999";         
+long lastEntrySeq = -1;              // ★追加: 再送ENTRYの二重適用防止 (PCの送信連番)
 unsigned long resultStartTime = 0;   
 Runner lastFinishedRunner;           
 
 unsigned long lastStartActionTime = 0; 
 unsigned long lastStopActionTime = 0;  
+const int MAX_SPLITS = 8;              // 中間計測センサー (SPLIT:1〜SPLIT:8)
+unsigned long lastSplitActionTime[MAX_SPLITS + 1] = {0};
 bool isSingleSensorMode = false;     
 
 // [非同期遅延送信用 ステート変数]
@@ -95,15 +100,49 @@ void sendResultToPC(String id, float timeValue) {
   // 1. 有線LAN(UDP)経由での送信
   IPAddress bc(255, 255, 255, 255);
   ethUdp.beginPacket(bc, UDP_PORT); 
-  ethUdp.print(json); 
+  if (USE_BINARY_WIRE) {
+    MgtsResultPacket bin = buildResultPacket(id, timeValue, MGTS_NODE_MAIN);
+    ethUdp.write((const uint8_t *)&bin, sizeof(bin));
+  } else {
+    ethUdp.print(json); 
+  }
   ethUdp.endPacket();
   
-  // 2. ★追加: ESP-NOW経由での送信 (ハブ経由でPCのシリアルへ届けるため)
+  // 2. ★追加: ESP-NOW経由での送信 (ハブ経由でPCのシリアルへ届けるため / シリアル中継は文字列のためJSONのまま)
   esp_now_send(hubAddress, (uint8_t *)json.c_str(), json.length());
 
   Serial.println("[TX_PC] Delayed RESULT packet sent: " + json);
 }
 
+/**
+ * ENTRY受信確認 (PC側の再送を止めるため、遅延させず即時送信)
+ */
+void sendEntryAck(String id, long seq) {
+  String json = "{\"type\":\"ENTRY_ACK\",\"id\":\"" + id + "\",\"seq\":" + String(seq) + "}";
+  IPAddress bc(255, 255, 255, 255);
+  ethUdp.beginPacket(bc, UDP_PORT);
+  ethUdp.print(json);
+  ethUdp.endPacket();
+  esp_now_send(hubAddress, (uint8_t *)json.c_str(), json.length());
+}
+
+/**
+ * 中間計測 (ゴール処理とは独立。遅延させず即時送信し、ゴール時の送信と重ならないようにする)
+ */
+void sendSplitToPC(String id, int sector, unsigned long elapsedMs) {
+  String json = "{\"type\":\"SPLIT\",\"id\":\"" + id + "\",\"sector\":" + String(sector) + ",\"time\":" + String(elapsedMs / 1000.0, 3) + "}";
+  IPAddress bc(255, 255, 255, 255);
+  ethUdp.beginPacket(bc, UDP_PORT);
+  if (USE_BINARY_WIRE) {
+    MgtsSplitPacket bin = buildSplitPacket(id, sector, elapsedMs, MGTS_NODE_MAIN);
+    ethUdp.write((const uint8_t *)&bin, sizeof(bin));
+  } else {
+    ethUdp.print(json);
+  }
+  ethUdp.endPacket();
+  esp_now_send(hubAddress, (uint8_t *)json.c_str(), json.length());
+}
+
 /**
  * ランナー完了処理（非同期送信キューへ登録）
  */
@@ -143,7 +182,12 @@ void processCommand(String msg) {
   if (msg.startsWith("{")) {
     JsonDocument doc;
     if (!deserializeJson(doc, msg)) {
-      if (doc["type"] == "ENTRY") nextRiderID = doc["id"].as<String>();
+      if (doc["type"] == "ENTRY") {
+        // ★追加: 同じseqの再送は適用済みとみなしてACKだけ返す (スタート後の再送で次走者を上書きしない)
+        long seq = doc["seq"] | -1L;
+        if (seq < 0 || seq != lastEntrySeq) nextRiderID = doc["id"].as<String>();
+        if (seq >= 0) { lastEntrySeq = seq; sendEntryAck(doc["id"].as<String>(), seq); }
+      }
     }
   } 
   else if (msg == "START") {
@@ -165,7 +209,7 @@ void processCommand(String msg) {
 
         lastStartActionTime = now; // ★[最優先] 即座にロック確保
         if (runners.size() < 9) {
-          runners.push_back({nextRiderID, now, 0.0, false});
+          runners.push_back({nextRiderID, now, 0.0, false, 0});
           nextRiderID = "X999"; 
         }
       }
@@ -181,6 +225,20 @@ void processCommand(String msg) {
       }
     }
   }
+  else if (msg.startsWith("SPLIT:")) {
+    // [中間計測] まだこのセンサーを通過していない、一番先にスタートした選手に割り当てる
+    int sector = msg.substring(6).toInt();
+    if (sector >= 1 && sector <= MAX_SPLITS && now - lastSplitActionTime[sector] > TIMING_GUARD_MS) {
+      for (size_t i = 0; i < runners.size(); i++) {
+        if (runners[i].splitsPassed < sector && now - runners[i].startMillis > TIMING_GUARD_MS) {
+          lastSplitActionTime[sector] = now; // ★[最優先] 即座にロック確保
+          runners[i].splitsPassed = sector;
+          sendSplitToPC(runners[i].id, sector, now - runners[i].startMillis);
+          break;
+        }
+      }
+    }
+  }
   else if (msg == "FORCE_DNF") { 
     handleDNF(); 
   }
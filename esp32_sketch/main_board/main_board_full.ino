@@ -30,6 +30,7 @@
 #include <Adafruit_NeoPixel.h>
 #include <vector>
 #include <ArduinoJson.h>
+#include "MGTS_WIRE.h"
 
 /* ====================================================================
  * L3 ネットワーク構成 (有線LAN / W5500)
@@ -46,6 +47,7 @@ uint8_t hubAddress[] = {0x58, 0xE6, 0xC5, 0x12, 0x97, 0xCC}; // ESP-NOW 送信
 // システム・ガードタイム設定
 const unsigned long TIMING_GUARD_MS = 3000; // チャタリング・不正連続入力防止 (ms)
 const unsigned long DELAY_SEND_MS = 1000;   // PCへの非同期遅延送信のディレイ時間 (ms)
+const bool USE_BINARY_WIRE = false;         // true: 有線LANのRESULTをバイナリ形式 (MGTS_WIRE.h) で送信 (main_board.ino と揃えること)
 
 /* ====================================================================
  * ハードウェア・ピン定義
@@ -72,6 +74,7 @@ char packetBuffer[512];
 struct Runner { String id; unsigned long startMillis; float result; bool isDnf; };
 std::vector<Runner> runners;         
 String nextRiderID = "X999";         
+long lastEntrySeq = -1;              // ★追加: 再送ENTRYの二重適用防止 (PCの送信連番)
 unsigned long resultStartTime = 0;   
 Runner lastFinishedRunner;           
 
@@ -105,15 +108,32 @@ void sendResultToPC(String id, float timeValue) {
   // UDPブロードキャスト
   IPAddress bc(255, 255, 255, 255);
   ethUdp.beginPacket(bc, UDP_PORT); 
-  ethUdp.print(json); 
+  if (USE_BINARY_WIRE) {
+    MgtsResultPacket bin = buildResultPacket(id, timeValue, MGTS_NODE_MAIN);
+    ethUdp.write((const uint8_t *)&bin, sizeof(bin));
+  } else {
+    ethUdp.print(json); 
+  }
   ethUdp.endPacket();
   
-  // ESP-NOWでハブへ送信
+  // ESP-NOWでハブへ送信 (シリアル中継は文字列のためJSONのまま)
   esp_now_send(hubAddress, (uint8_t *)json.c_str(), json.length());
   
   Serial.println("[TX_PC] Delayed RESULT packet sent: " + json);
 }
 
+/**
+ * ENTRY受信確認 (PC側の再送を止めるため、遅延させず即時送信)
+ */
+void sendEntryAck(String id, long seq) {
+  String json = "{\"type\":\"ENTRY_ACK\",\"id\":\"" + id + "\",\"seq\":" + String(seq) + "}";
+  IPAddress bc(255, 255, 255, 255);
+  ethUdp.beginPacket(bc, UDP_PORT);
+  ethUdp.print(json);
+  ethUdp.endPacket();
+  esp_now_send(hubAddress, (uint8_t *)json.c_str(), json.length());
+}
+
 /**
  * ランナー完了処理（非同期送信キューへ登録）
  */
@@ -153,7 +173,12 @@ void processCommand(String msg) {
   if (msg.startsWith("{")) {
     JsonDocument doc;
     if (!deserializeJson(doc, msg)) {
-      if (doc["type"] == "ENTRY") nextRiderID = doc["id"].as<String>();
+      if (doc["type"] == "ENTRY") {
+        // ★追加: 同じseqの再送は適用済みとみなしてACKだけ返す (スタート後の再送で次走者を上書きしない)
+        long seq = doc["seq"] | -1L;
+        if (seq < 0 || seq != lastEntrySeq) nextRiderID = doc["id"].as<String>();
+        if (seq >= 0) { lastEntrySeq = seq; sendEntryAck(doc["id"].as<String>(), seq); }
+      }
     }
   } 
   // SYNCモード時はSEQ_STARTでタイマーを同期登録
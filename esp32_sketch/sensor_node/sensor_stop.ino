@@ -57,6 +57,9 @@ uint8_t broadcastAddress2[] = {0x58, 0xE6, 0xC5, 0x12, 0xYY, 0xYY};
  * ==================================================================== */
 const unsigned long DEBOUNCE_MS = 20;     // チャタリング排除用の継続遮断閾値 (ms)
 const unsigned long SEND_GUARD_MS = 3000; // 不正連続トリガー防止用の再送信ガード時間 (ms)
+// 送信コマンド: ゴールは "STOP"。中間計測ノードとして使う場合は "SPLIT:1", "SPLIT:2" ... とし、
+// IP (ip_eth) と MAC (mac_eth) を他のノードと重ならないように変更する
+const char *TRIGGER_MSG = "STOP";
 
 unsigned long lastSendTime = 0;           // 最終パケット送信タイムスタンプ
 unsigned long detectionStartTime = 0;      // センサー初期検知タイムスタンプ
@@ -153,7 +156,7 @@ void loop() {
         
         // 未送信かつ送信ガード時間を超過している場合のみパケットを送出 (エッジトリガー制御)
         if (!hasTriggered && (now - lastSendTime > SEND_GUARD_MS)) {
-          String msg = "STOP"; // ゴール判定のため STOP コマンドを定義
+          String msg = TRIGGER_MSG; // ゴール判定 (または中間計測) のコマンド
           
           Serial.println("\n-----------------------------------------");
           Serial.print("[TRIGGER] Goal line crossed. Duration: ");